@@ -1,24 +1,56 @@
+from multiprocessing import cpu_count
 from optparse import make_option
 from django.core.management.base import BaseCommand, CommandError
 from georgia_lynchings.articles.models import Article
+from georgia_lynchings.articles.thumbnails import generate_thumbnails, record_images
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
 
 class Command(BaseCommand):
-    help = """Generate all size thumbnails for articles."""
+    help = """Generate all size thumbnails for articles whose PDF is new or has changed."""
 
     option_list = BaseCommand.option_list + (
         make_option('--recreate',
             dest='recreate',
             action='store_true',
             default=False,
-            help="Recreate thumbnails even if they already exist."),
+            help="Recreate thumbnails even if the PDF hasn't changed."),
+        make_option('--workers',
+            dest='workers',
+            type='int',
+            default=cpu_count(),
+            help="Number of ImageMagick processes to run at once (default: number of CPUs)."),
+        make_option('--dry-run',
+            dest='dryrun',
+            action='store_true',
+            default=False,
+            help="Report which articles need thumbnails without generating them."),
+        make_option('--index-only',
+            dest='index_only',
+            action='store_true',
+            default=False,
+            help="Record the existing thumbnails in the image manifest without generating any."),
         )
 
     def handle(self, *args, **options):
-        article_list = Article.objects.all()
-        recreate = False
-        if options['recreate']: # I  know it is wierd, but I'm tired and it's late.
-            recreate = True
-        for article in article_list:
-            article.generate_all_thumbnails(recreate)
-
-
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        verbosity = int(options.get('verbosity', 1))
+        article_list = Article.objects.exclude(file='')
+        if options['index_only']:
+            manifest = record_images(article_list, update_source=True)
+            bump_data_generation()
+            if verbosity > 0:
+                print "Indexed images for %d articles." % len(manifest)
+            return
+        result = generate_thumbnails(article_list, workers=options['workers'],
+                                     recreate=options['recreate'],
+                                     dryrun=options['dryrun'])
+        if result['generated'] and not options['dryrun']:
+            bump_data_generation()
+        for article in result['missing']:
+            print "PDF not found for %s: %s" % (article, article.file.name)
+        for article in result['failed']:
+            print "Failed to generate thumbnails for %s" % article
+        if verbosity > 0:
+            print "Generated thumbnails for %d articles, skipped %d unchanged." % \
+                (len(result['generated']), len(result['skipped']))
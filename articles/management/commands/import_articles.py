@@ -6,6 +6,7 @@ import re
 from django.core.files import File
 from django.core.management.base import NoArgsCommand
 from georgia_lynchings.articles.models import Article, PcAceDocument
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
 
 class Command(NoArgsCommand):
     help = """Import all PC-ACE document metadata from the triplestore and
@@ -35,6 +36,8 @@ class Command(NoArgsCommand):
 
         for doc in docs:
             self.import_document(doc)
+        if not self.simulate:
+            bump_data_generation()
 
 
     def import_document(self, doc):
@@ -0,0 +1,53 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+# Columns of the index for the article listing, matching LISTING_ORDER.
+LISTING_COLUMNS = ['featured', 'file', 'date', 'publisher', 'id']
+
+class Migration(SchemaMigration):
+    
+    def forwards(self, orm):
+        
+        # Adding index on 'Article', fields ['featured', 'file', 'date', 'publisher', 'id']
+        # South can't create descending index columns, so the SQL is written
+        # out to match the descending sort on file.
+        index_name = db.create_index_name('articles_article', LISTING_COLUMNS)
+        db.execute('CREATE INDEX %s ON %s (%s, %s DESC, %s, %s, %s)' % tuple(
+            [db.quote_name(index_name), db.quote_name('articles_article')] +
+            [db.quote_name(column) for column in LISTING_COLUMNS]))
+    
+    
+    def backwards(self, orm):
+        
+        # Removing index on 'Article', fields ['featured', 'file', 'date', 'publisher', 'id']
+        db.delete_index('articles_article', LISTING_COLUMNS)
+    
+    
+    models = {
+        'articles.article': {
+            'Meta': {'object_name': 'Article'},
+            'contributor': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True', 'blank': 'True'}),
+            'coverage': ('django.db.models.fields.CharField', [], {'max_length': '25', 'null': 'True', 'blank': 'True'}),
+            'creator': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True', 'blank': 'True'}),
+            'date': ('django.db.models.fields.DateField', [], {'null': 'True', 'blank': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'featured': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'blank': 'True'}),
+            'file': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'format': ('django.db.models.fields.CharField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'identifier': ('django.db.models.fields.CharField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'language': ('django.db.models.fields.CharField', [], {'default': "'EN'", 'max_length': '2'}),
+            'publisher': ('django.db.models.fields.CharField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'relation': ('django.db.models.fields.CharField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'rights': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'source': ('django.db.models.fields.CharField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'subject': ('django.db.models.fields.CharField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True', 'blank': 'True'}),
+            'type': ('django.db.models.fields.CharField', [], {'default': "'NA'", 'max_length': '2'})
+        }
+    }
+    
+    complete_apps = ['articles']
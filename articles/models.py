@@ -1,7 +1,8 @@
-import logging, os, subprocess
+import logging, operator, os, subprocess
 from urllib import quote
 
-from django.db import models
+from django.db import connection, models
+from django.db.models import Q
 from django.conf import settings
 from django.utils.encoding import smart_str
 
@@ -28,6 +29,73 @@ IMG_SIZE = {
     "xlrg": (308, 400),
     "page": (670, 870),
 }
+# Sizes generated from the first page only, as opposed to every page.
+FIRST_PAGE_SIZES = ["sm", "med", "lrg", "xlrg"]
+
+# Fields articles are listed by, with a leading '-' for descending order.
+# The id makes every position in the listing unique so the values of the
+# last article on a page can be used as the cursor for the next page.
+# Migration 0002 adds a database index matching this order.
+LISTING_ORDER = ('featured', '-file', 'date', 'publisher', 'id')
+
+def _nulls_sort_low():
+    """
+    Whether the database sorts NULL before all other values, as SQLite and
+    MySQL do, rather than after them, as PostgreSQL and Oracle do.
+    """
+    return connection.vendor not in ('postgresql', 'oracle')
+
+class ArticleQuerySet(models.query.QuerySet):
+    """
+    QuerySet for :class:`Article` with helpers for keyset pagination.
+    """
+
+    def listing(self):
+        """Orders articles by :data:`LISTING_ORDER`."""
+        return self.order_by(*LISTING_ORDER)
+
+    def after(self, key):
+        """
+        Restricts the results to articles that come after a position in
+        :data:`LISTING_ORDER`.  Combined with :meth:`listing` and a slice
+        this fetches a page by seeking in the listing index rather than
+        counting through every preceding article as an offset would.
+
+        :param key:  Sequence of values for the :data:`LISTING_ORDER` fields,
+            as returned by :meth:`Article.listing_key`.
+        """
+        nulls_low = _nulls_sort_low()
+        alternatives = []
+        preceding = [] # all earlier fields are equal to the key
+        for field, value in zip(LISTING_ORDER, key):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            nulls_first = (nulls_low != descending)
+            if value is None:
+                later = None
+                if nulls_first:
+                    later = Q(**{'%s__isnull' % name: False})
+                same = Q(**{'%s__isnull' % name: True})
+            else:
+                lookup = 'lt' if descending else 'gt'
+                later = Q(**{'%s__%s' % (name, lookup): value})
+                if not nulls_first:
+                    later |= Q(**{'%s__isnull' % name: True})
+                same = Q(**{name: value})
+            if later is not None:
+                alternatives.append(reduce(operator.and_, preceding + [later]))
+            preceding.append(same)
+        if not alternatives:
+            return self.none()
+        return self.filter(reduce(operator.or_, alternatives))
+
+class ArticleManager(models.Manager):
+
+    def get_query_set(self):
+        return ArticleQuerySet(self.model, using=self._db)
+
+    def listing(self):
+        return self.get_query_set().listing()
 
 class Article(models.Model):
     """
@@ -75,6 +143,8 @@ class Article(models.Model):
     # Used to help Sort Featured or preferred articles.
     featured = models.BooleanField(default=False, help_text=help['featured'])
 
+    objects = ArticleManager()
+
     def __unicode__(self):
         if self.title and self.publisher:
             return u"%s, %s" % (self.title, self.publisher)
@@ -97,12 +167,69 @@ class Article(models.Model):
 
     def _has_thumbnail(self, size="med"):
         """
-        Checks to see if a corrisponding nng thumbnail exists for the file object
-        attached to this model.
+        Checks the image manifest to see if a corrisponding png thumbnail
+        exists for the file object attached to this model.
+        """
+        if size not in IMG_SIZE.keys():
+            raise ValueError('Incorrect value of %s passed for size.' % size)
+        if size == 'page':
+            return bool(self.page_images)
+        return size in self.thumbnails
+
+    def image_manifest(self):
+        """
+        Returns the entry in the image manifest for the file attached to this
+        model, or an empty dict if no images have been generated.  See
+        :mod:`georgia_lynchings.articles.thumbnails`.
+        """
+        from georgia_lynchings.articles.thumbnails import get_manifest
+        if not self.file:
+            return {}
+        return get_manifest().get(str(self.id), {})
+
+    @property
+    def thumbnails(self):
+        """
+        Dict of the generated first page thumbnails keyed by size, each a
+        dict with the image 'file' name, 'width', 'height' and 'bytes'.
+        """
+        return self.image_manifest().get('images', {})
+
+    @property
+    def page_images(self):
+        """
+        List of the generated page images in page order, described in the
+        same way as :attr:`thumbnails`.
+        """
+        return self.image_manifest().get('pages', [])
+
+    def _source_path(self, page=""):
+        """
+        Returns the path to the PDF file for ImageMagick, optionally
+        followed by a page selector such as '[0]'.
         """
-        png_file = os.path.join(settings.MEDIA_ROOT, settings.ARTICLE_UPLOAD_DIR,
-                    self._format_thumbnail_filename(size))
-        return os.path.exists(png_file)
+        return "%s/%s%s" % (settings.MEDIA_ROOT, self.file.name, page)
+
+    def _thumbnail_path(self, size="med"):
+        """
+        Returns the full path of the generated image of a particular size.
+        """
+        article_path = '%s' % os.path.join(settings.STATIC_ROOT, settings.ARTICLE_IMAGES_DIR)
+        return "%s/%s" % (article_path, self._format_thumbnail_filename(size))
+
+    def _conversions(self, size, fill_and_crop=None):
+        """
+        Returns the ImageMagick arguments to resize an image to a particular
+        size.  See :meth:`generate_thumbnail` for fill_and_crop.
+        """
+        # xlrg, by default, grows no bigger than its box, while other sizes
+        # fill the box completely and crop excess
+        if fill_and_crop is None:
+            fill_and_crop = (size != 'xlrg')
+        if fill_and_crop:
+            return ["-resize", "%sx%s^" % IMG_SIZE[size],
+                    "-extent", "%sx%s" % IMG_SIZE[size]]
+        return ["-resize", "%sx%s" % IMG_SIZE[size]]
 
     def generate_thumbnail(self, size="med", fill_and_crop=None, recreate=False, singlepage=True, dryrun=False):
         """
@@ -120,47 +247,91 @@ class Article(models.Model):
             raise ValueError('Incorrect value of %s passed for size.' % size)
         if not self.file:
             return "No file exists to generate a thumbnail from."
-        if self._has_thumbnail(size) and recreate:
+        if self._has_thumbnail(size) and not recreate:
             return "Thumbnail already exists."
-        # xlrg, by default, grows no bigger than its box, while other sizes 
-        # fill the box completely and crop excess
-        if fill_and_crop is None:
-            fill_and_crop = (size != 'xlrg')
-
-        article_path = '%s' % os.path.join(settings.STATIC_ROOT, settings.ARTICLE_IMAGES_DIR)
-
-        if fill_and_crop:
-            conversions = ["-resize", "%sx%s^" % IMG_SIZE[size],
-                           "-extent", "%sx%s" % IMG_SIZE[size]]
-        else:
-            conversions = ["-resize", "%sx%s" % IMG_SIZE[size]]
 
         page = "[0]" # Generates first page only.
         if not singlepage:
             page = "" # Generates images for all pages with '-#' format.
 
-        cmd = ["convert",
-               "%s/%s%s" % (settings.MEDIA_ROOT, self.file.name, page)] + \
-              conversions + \
-              ["%s/%s" % (article_path, self._format_thumbnail_filename(size))]
+        cmd = ["convert", self._source_path(page)] + \
+              self._conversions(size, fill_and_crop) + \
+              [self._thumbnail_path(size)]
         logger.debug(cmd)
         if not dryrun:
             subprocess.call(cmd) # run it as at commandline.
+            self._record_images()
         return 'Generated Image: %s' % self._format_thumbnail_filename(size)
 
+    def _record_images(self):
+        """Updates the image manifest with the images generated for this article."""
+        from georgia_lynchings.articles.thumbnails import record_images
+        record_images([self])
+
+    def thumbnail_commands(self, sizes=None):
+        """
+        Returns the list of ImageMagick commands needed to generate the
+        images for the given sizes.
+
+        The first page of the PDF is rasterized only once and every first
+        page size is derived from a clone of that image in memory, so the
+        thumbnails take a single command.  The 'page' images cover every
+        page of the PDF and get a command of their own.
+
+        :param sizes:  List of keys of IMG_SIZE.  Defaults to all of them.
+        """
+        if sizes is None:
+            sizes = IMG_SIZE.keys()
+        if not self.file:
+            return []
+        commands = []
+        first_page_sizes = [size for size in FIRST_PAGE_SIZES if size in sizes]
+        if first_page_sizes:
+            cmd = ["convert", self._source_path("[0]")]
+            for size in first_page_sizes:
+                cmd += ["(", "+clone"] + self._conversions(size) + \
+                       ["-write", self._thumbnail_path(size), "+delete", ")"]
+            cmd.append("null:")
+            commands.append(cmd)
+        if 'page' in sizes:
+            commands.append(["convert", self._source_path()] +
+                            self._conversions('page') +
+                            [self._thumbnail_path('page')])
+        return commands
+
     def generate_all_thumbnails(self, recreate=False, dryrun=False):
         """
         Generates thumbnails for all sizes in IMG_SIZE.
 
         :param recreate:  Bool:  Overwrite exiting thumbnails.
         """
-        result = []
-        for size in IMG_SIZE.keys():
-            sp = True
-            if size == 'page':
-                sp = False
-            result.append(self.generate_thumbnail(size, recreate=recreate, singlepage=sp, dryrun=dryrun))
-        return result
+        if not self.file:
+            return ["No file exists to generate a thumbnail from."]
+        sizes = [size for size in IMG_SIZE.keys()
+                 if recreate or not self._has_thumbnail(size)]
+        if not sizes:
+            return ["Thumbnail already exists."]
+        for cmd in self.thumbnail_commands(sizes):
+            logger.debug(cmd)
+            if not dryrun:
+                subprocess.call(cmd) # run it as at commandline.
+        if not dryrun:
+            self._record_images()
+        return ['Generated Image: %s' % self._format_thumbnail_filename(size)
+                for size in sizes]
+
+    def listing_key(self):
+        """
+        Returns the values of the :data:`LISTING_ORDER` fields for this
+        article, for use with :meth:`ArticleQuerySet.after`.
+        """
+        key = []
+        for field in LISTING_ORDER:
+            value = getattr(self, field.lstrip('-'))
+            if field.lstrip('-') == 'file':
+                value = value.name
+            key.append(value)
+        return key
 
     def base_filename(self):
         """
@@ -173,7 +344,7 @@ class Article(models.Model):
         return None
 
     class Meta:
-        ordering = ('featured', '-file', 'date', 'publisher')
+        ordering = LISTING_ORDER
 
 #class PcAceDocument(RdfObject):
 #    """
@@ -2,12 +2,21 @@ from django.core.urlresolvers import reverse
 from django.core.files import File
 from django.test import TestCase
 from django.test.client import Client
+from django.test.utils import override_settings
 
-from georgia_lynchings.articles.models import Article, IMG_SIZE
+from georgia_lynchings.articles.models import Article, IMG_SIZE, FIRST_PAGE_SIZES
+from georgia_lynchings.articles.thumbnails import generate_thumbnails, \
+	load_manifest, save_manifest, record_images, PNG_SIGNATURE
 
-import os
+from base64 import urlsafe_b64encode
+import datetime, os, shutil, struct, tempfile
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+def write_png_header(path, width, height):
+	"""Writes just enough of a PNG image for its dimensions to be read."""
+	with open(path, 'wb') as png:
+		png.write(PNG_SIGNATURE + struct.pack('>I4sII', 13, 'IHDR', width, height))
+
 class ArticleTest(TestCase):
 	"""
 	Tests for the Article models methods.
@@ -37,11 +46,189 @@ class ArticleTest(TestCase):
 			message = "Generated Image: testfile%s" % ext
 			self.assertTrue(message in response_list, msg=message + " not in %s" % response_list)
 
+	def test_thumbnail_commands(self):
+		commands = self.article.thumbnail_commands()
+		self.assertEqual(2, len(commands))
+		first_page, pages = commands
+		# the first page is rasterized once for every thumbnail size
+		self.assertEqual(1, len([arg for arg in first_page if arg.endswith('.pdf[0]')]))
+		for size in FIRST_PAGE_SIZES:
+			self.assertTrue(self.article._thumbnail_path(size) in first_page)
+		self.assertTrue(pages[1].endswith('.pdf'))
+		self.assertEqual(self.article._thumbnail_path('page'), pages[-1])
+
+		commands = self.article.thumbnail_commands(['page'])
+		self.assertEqual(1, len(commands))
+
 	def test_base_filename(self):
 		expected = 'testfile'
 		actual = self.article.base_filename()
 		self.assertEqual(expected, actual)
 
+class GenerateThumbnailsTest(TestCase):
+	"""
+	Tests for the image manifest and skipping articles whose PDF hasn't changed.
+	"""
+
+	def setUp(self):
+		self.static_root = tempfile.mkdtemp()
+		self.settings_override = override_settings(STATIC_ROOT=self.static_root)
+		self.settings_override.enable()
+		os.mkdir(os.path.join(self.static_root, 'articleimages'))
+		test_file = os.path.normpath(os.path.join(BASE_DIR, "fixtures/testfile.pdf"))
+		self.article = Article(file=File(open(test_file, 'rb')), title="This is a test file")
+		self.article.save()
+
+	def tearDown(self):
+		self.article.file.delete()
+		self.settings_override.disable()
+		shutil.rmtree(self.static_root)
+
+	def _record_current_thumbnails(self, pages=1):
+		for size in FIRST_PAGE_SIZES:
+			write_png_header(self.article._thumbnail_path(size), *IMG_SIZE[size])
+		page_root = self.article._thumbnail_path('page')[:-len('.png')]
+		for page in range(pages):
+			write_png_header('%s-%d.png' % (page_root, page), 670, 870 + page)
+		manifest = record_images([self.article], update_source=True)
+		return manifest[str(self.article.id)]['source']
+
+	def test_index_images(self):
+		self._record_current_thumbnails(pages=12)
+		entry = load_manifest()[str(self.article.id)]
+		self.assertEqual(set(FIRST_PAGE_SIZES), set(entry['images']))
+		self.assertEqual({'file': 'testfile_med.png', 'width': 77, 'height': 100, 'bytes': 24},
+			entry['images']['med'])
+		# pages are in page order, not filename order
+		self.assertEqual(['testfile_page-%d.png' % page for page in range(12)],
+			[image['file'] for image in entry['pages']])
+		self.assertEqual(881, entry['pages'][11]['height'])
+
+		self.assertTrue(self.article._has_thumbnail('sm'))
+		self.assertTrue(self.article._has_thumbnail('page'))
+		self.assertEqual(12, len(self.article.page_images))
+
+	def test_no_images(self):
+		self.assertFalse(self.article._has_thumbnail('med'))
+		self.assertEqual({}, self.article.thumbnails)
+		self.assertEqual([], self.article.page_images)
+
+	def test_article_detail(self):
+		self._record_current_thumbnails(pages=3)
+		response = self.client.get(reverse("articles:detail", args=[self.article.id]))
+		self.assertEqual(['testfile_page-0.png', 'testfile_page-1.png', 'testfile_page-2.png'],
+			[image['file'] for image in response.context['pageimage_list']])
+		self.assertContains(response, 'articleimages/testfile_page-2.png" width="670" height="872"')
+
+	def test_new_article(self):
+		result = generate_thumbnails([self.article], dryrun=True)
+		self.assertEqual([self.article], result['generated'])
+		self.assertEqual([], result['skipped'])
+
+	def test_unchanged_article(self):
+		self._record_current_thumbnails()
+		result = generate_thumbnails([self.article], dryrun=True)
+		self.assertEqual([], result['generated'])
+		self.assertEqual([self.article], result['skipped'])
+
+		result = generate_thumbnails([self.article], recreate=True, dryrun=True)
+		self.assertEqual([self.article], result['generated'])
+
+	def test_changed_article(self):
+		signature = self._record_current_thumbnails()
+		manifest = load_manifest()
+		manifest[str(self.article.id)]['source'] = dict(signature, mtime=0, md5='0' * 32)
+		save_manifest(manifest)
+		result = generate_thumbnails([self.article], dryrun=True)
+		self.assertEqual([self.article], result['generated'])
+
+	def test_touched_article(self):
+		# a new mtime with the same contents is not regenerated
+		signature = self._record_current_thumbnails()
+		manifest = load_manifest()
+		manifest[str(self.article.id)]['source'] = dict(signature, mtime=0)
+		save_manifest(manifest)
+		result = generate_thumbnails([self.article])
+		self.assertEqual([self.article], result['skipped'])
+		self.assertEqual(signature, load_manifest()[str(self.article.id)]['source'])
+
+	def test_missing_thumbnail(self):
+		self._record_current_thumbnails()
+		os.remove(self.article._thumbnail_path('sm'))
+		result = generate_thumbnails([self.article], dryrun=True)
+		self.assertEqual([self.article], result['generated'])
+
+class ArticleListingTest(TestCase):
+	"""
+	Tests for the paginated and filtered article listing.
+	"""
+
+	def setUp(self):
+		self.client = Client()
+		publishers = ['Atlanta Constitution', 'Macon Telegraph', None]
+		for num in range(130):
+			date = None
+			if num % 4:
+				date = datetime.date(1880 + num % 30, 1 + num % 12, 1)
+			file = None
+			if num % 5 == 1:
+				file = ''
+			elif num % 3 == 0:
+				file = 'files/article%03d.pdf' % (num % 20)
+			Article.objects.create(title="Test Article %s" % num, file=file,
+				publisher=publishers[num % 3], date=date, featured=(num % 7 == 0))
+
+	def _all_pages(self, params=None):
+		params = dict(params or {})
+		pages = []
+		url = reverse('articles:list')
+		while url:
+			response = self.client.get(url, params)
+			self.assertEqual(200, response.status_code)
+			pages.append([article.id for article in response.context['article_list']])
+			url = response.context['next_url']
+			if url:
+				url = reverse('articles:list') + url
+				params = {}
+		return pages
+
+	def test_keyset_pages(self):
+		pages = self._all_pages()
+		self.assertEqual([50, 50, 30], [len(page) for page in pages])
+		expected = list(Article.objects.listing().values_list('id', flat=True))
+		self.assertEqual(expected, sum(pages, []))
+
+	def test_after(self):
+		articles = list(Article.objects.listing())
+		for index, article in enumerate(articles):
+			after = Article.objects.listing().after(article.listing_key())
+			self.assertEqual([a.id for a in articles[index + 1:]],
+				list(after.values_list('id', flat=True)))
+
+	def test_filters(self):
+		params = {'publisher': 'Macon Telegraph', 'date_from': '1890-01-01',
+			'date_to': '1899-12-31', 'featured': 'false'}
+		pages = self._all_pages(params)
+		expected = Article.objects.listing().filter(publisher='Macon Telegraph',
+			date__gte=datetime.date(1890, 1, 1), date__lte=datetime.date(1899, 12, 31),
+			featured=False)
+		self.assertEqual(list(expected.values_list('id', flat=True)), sum(pages, []))
+
+		pages = self._all_pages({'featured': 'true'})
+		self.assertEqual(Article.objects.filter(featured=True).count(), len(sum(pages, [])))
+
+	def test_bad_parameters(self):
+		url = reverse('articles:list')
+		for params in [{'date_from': '1890'}, {'featured': 'maybe'},
+				{'after': 'not a cursor'}, {'after': 'WzFd'},
+				{'after': urlsafe_b64encode('[false, null, null, null, "x"]')},
+				{'after': urlsafe_b64encode('[false, null, null, null, true]')},
+				{'after': urlsafe_b64encode('[false, [], null, null, 1]')},
+				{'after': urlsafe_b64encode('[0, null, null, null, 1]')},
+				{'after': urlsafe_b64encode('[false, null, 1890, null, 1]')},
+				{'after': urlsafe_b64encode('[false, null, "1890-01-01", {}, 1]')}]:
+			self.assertEqual(400, self.client.get(url, params).status_code, msg=params)
+
 class ViewTest(TestCase):
 	"""
 	Some quick tests to make sure views dont error out.
@@ -0,0 +1,249 @@
+"""
+Batch generation of the thumbnails and page images for articles.
+
+Each article needs two ImageMagick commands (see
+:meth:`~georgia_lynchings.articles.models.Article.thumbnail_commands`), which
+are run in a pool of worker processes.
+
+A manifest is kept with the generated images, keyed by article id.  Each
+entry records the ``source`` PDF's modification time and md5, so articles
+whose PDF hasn't changed since the last run are skipped, and describes the
+generated files so that pages can display them without scanning the
+images directory::
+
+    {"12": {"source": {"mtime": 1340000000.0, "md5": "..."},
+            "images": {"med": {"file": "x_med.png", "width": 77,
+                               "height": 100, "bytes": 5123}, ...},
+            "pages": [{"file": "x_page-0.png", ...}, ...]}}
+
+The ``pages`` are listed in page order.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import subprocess
+from multiprocessing import Pool
+
+from django.conf import settings
+
+from georgia_lynchings.articles.models import FIRST_PAGE_SIZES
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+
+# The last manifest read by get_manifest, with the modification time of the
+# file it was read from.
+_manifest_cache = {}
+
+def manifest_path():
+    """Returns the path of the manifest file for the generated images."""
+    return os.path.join(settings.STATIC_ROOT, settings.ARTICLE_IMAGES_DIR,
+                        MANIFEST_FILENAME)
+
+def load_manifest():
+    """
+    Returns the manifest as a dict keyed by article id, or an empty dict if
+    there is no usable manifest yet.
+    """
+    try:
+        with open(manifest_path()) as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, ValueError):
+        return {}
+
+def get_manifest():
+    """
+    Returns the manifest for use when displaying articles.  The file is only
+    read again when it has been modified since it was last read.
+    """
+    path = manifest_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    if _manifest_cache.get('path') != path or _manifest_cache.get('mtime') != mtime:
+        _manifest_cache.update(path=path, mtime=mtime, manifest=load_manifest())
+    return _manifest_cache['manifest']
+
+def save_manifest(manifest):
+    """
+    Writes the manifest, replacing the old one only once the new one is
+    complete.
+    """
+    _manifest_cache.clear()
+    path = manifest_path()
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+def file_md5(path, chunk_size=1024 * 1024):
+    """Returns the md5 hex digest of the contents of a file."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), ''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def source_signature(path, previous=None):
+    """
+    Returns a dict with the modification time and md5 of a PDF.  The file is
+    only hashed if its modification time differs from the previous signature.
+
+    :param path:  Path of the PDF.
+    :param previous:  Signature recorded for the PDF by the last run, if any.
+    """
+    mtime = os.path.getmtime(path)
+    if previous and previous.get('mtime') == mtime:
+        return previous
+    return {'mtime': mtime, 'md5': file_md5(path)}
+
+def png_dimensions(path):
+    """
+    Returns the width and height of a PNG image, read from its header, or
+    (None, None) if the file isn't a PNG.
+    """
+    with open(path, 'rb') as png:
+        header = png.read(24)
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE):
+        return None, None
+    return struct.unpack('>II', header[16:24])
+
+def image_info(path):
+    """Returns the manifest description of a generated image."""
+    width, height = png_dimensions(path)
+    return {
+        'file': os.path.basename(path),
+        'width': width,
+        'height': height,
+        'bytes': os.path.getsize(path),
+    }
+
+def _page_number(path):
+    """
+    ImageMagick numbers the images of a multi-page PDF as name-0.png,
+    name-1.png, etc, and names the image of a single page PDF name.png.
+    """
+    match = re.search(r'-(\d+)\.png$', path)
+    if match:
+        return int(match.group(1))
+    return 0
+
+def index_images(article):
+    """
+    Returns the ``images`` and ``pages`` manifest values describing the
+    images that have been generated for an article.
+    """
+    images = {}
+    for size in FIRST_PAGE_SIZES:
+        path = article._thumbnail_path(size)
+        if os.path.exists(path):
+            images[size] = image_info(path)
+    page_root = article._thumbnail_path('page')[:-len('.png')]
+    page_paths = glob.glob('%s.png' % page_root) + glob.glob('%s-*.png' % page_root)
+    pages = [image_info(path) for path in sorted(page_paths, key=_page_number)]
+    return {'images': images, 'pages': pages}
+
+def _images_exist(article, entry):
+    """Checks that every first page size in a manifest entry is on disk."""
+    images = entry.get('images', {})
+    return all(size in images and os.path.exists(article._thumbnail_path(size))
+               for size in FIRST_PAGE_SIZES)
+
+def record_images(articles, update_source=False):
+    """
+    Updates the manifest with the images that currently exist for the given
+    articles, without generating anything.
+
+    :param articles:  Iterable of :class:`~georgia_lynchings.articles.models.Article`.
+    :param update_source:  Bool:  Also record the current signature of each
+        PDF, marking the existing images as up to date.
+    """
+    manifest = load_manifest()
+    for article in articles:
+        if not article.file:
+            continue
+        entry = manifest.setdefault(str(article.id), {})
+        entry.update(index_images(article))
+        pdf_path = article._source_path()
+        if update_source and os.path.exists(pdf_path):
+            entry['source'] = source_signature(pdf_path, entry.get('source'))
+    save_manifest(manifest)
+    return manifest
+
+def run_command(cmd):
+    """Runs a single command, returning its exit status."""
+    logger.debug(cmd)
+    return subprocess.call(cmd)
+
+def generate_thumbnails(articles, workers=1, recreate=False, dryrun=False):
+    """
+    Generates the images for every article whose PDF is new or has changed
+    since the images were last generated.
+
+    :param articles:  Iterable of :class:`~georgia_lynchings.articles.models.Article`.
+    :param workers:  Number of processes to run ImageMagick commands in.
+    :param recreate:  Bool:  Generate images even if the PDF is unchanged.
+    :param dryrun:  Bool:  Work out what needs generating without running
+        anything or updating the manifest.
+
+    Returns a dict with lists of the ``generated``, ``skipped``, ``failed``
+    and ``missing`` articles.
+    """
+    manifest = load_manifest()
+    result = {'generated': [], 'skipped': [], 'failed': [], 'missing': []}
+    jobs = [] # (article, signature, commands)
+    for article in articles:
+        if not article.file:
+            continue
+        pdf_path = article._source_path()
+        if not os.path.exists(pdf_path):
+            result['missing'].append(article)
+            continue
+        entry = manifest.setdefault(str(article.id), {})
+        previous = entry.get('source')
+        signature = source_signature(pdf_path, previous)
+        unchanged = previous is not None and signature['md5'] == previous['md5']
+        if unchanged and not recreate and _images_exist(article, entry):
+            entry['source'] = signature # keep the new mtime to skip hashing next time
+            result['skipped'].append(article)
+            continue
+        jobs.append((article, signature, article.thumbnail_commands()))
+
+    if dryrun:
+        result['generated'] = [article for article, signature, commands in jobs]
+        return result
+
+    commands = [cmd for article, signature, article_commands in jobs
+                for cmd in article_commands]
+    if workers > 1 and len(commands) > 1:
+        pool = Pool(workers)
+        try:
+            statuses = pool.map(run_command, commands)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        statuses = map(run_command, commands)
+
+    statuses = iter(statuses)
+    for article, signature, article_commands in jobs:
+        if all([status == 0 for cmd, status in zip(article_commands, statuses)]):
+            manifest[str(article.id)]['source'] = signature
+            manifest[str(article.id)].update(index_images(article))
+            result['generated'].append(article)
+        else:
+            # leave the old signature so the article is retried next time
+            result['failed'].append(article)
+
+    save_manifest(manifest)
+    return result
@@ -1,20 +1,110 @@
-import glob, os
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+import json
 
-from django.http import Http404
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponseBadRequest
 
 from django.shortcuts import render, get_object_or_404
 from django.core.urlresolvers import reverse
 
-from georgia_lynchings.articles.models import Article
-from georgia_lynchings.settings import STATIC_ROOT
+from georgia_lynchings.articles.models import Article, LISTING_ORDER
+
+ARTICLES_PER_PAGE = 50
+DATE_FORMAT = '%Y-%m-%d'
+BOOLEAN_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+# Types allowed for the value of each LISTING_ORDER field in a cursor;
+# dates are strings until parsed.
+CURSOR_TYPES = {
+	'featured': (bool, type(None)),
+	'file': (basestring, type(None)),
+	'date': (basestring, type(None)),
+	'publisher': (basestring, type(None)),
+	'id': (int, long),
+}
+
+def _parse_date(value):
+	return datetime.strptime(value, DATE_FORMAT).date()
+
+def encode_cursor(article):
+	"""
+	Encodes the position of an article in the listing as an opaque string
+	for use in urls.
+	"""
+	key = json.dumps(article.listing_key(), cls=DjangoJSONEncoder)
+	return urlsafe_b64encode(key)
+
+def decode_cursor(cursor):
+	"""
+	Decodes a string from :func:`encode_cursor` into a listing key.  Raises
+	ValueError if the cursor is not valid.
+	"""
+	try:
+		key = json.loads(urlsafe_b64decode(str(cursor)))
+	except (TypeError, ValueError):
+		raise ValueError('Invalid cursor %r.' % cursor)
+	if not isinstance(key, list) or len(key) != len(LISTING_ORDER):
+		raise ValueError('Invalid cursor %r.' % cursor)
+	for field, value in zip(LISTING_ORDER, key):
+		allowed = CURSOR_TYPES[field.lstrip('-')]
+		# bool is a subclass of int, but not a valid id
+		if not isinstance(value, allowed) or (isinstance(value, bool) and bool not in allowed):
+			raise ValueError('Invalid cursor %r.' % cursor)
+	date_index = LISTING_ORDER.index('date')
+	if key[date_index] is not None:
+		key[date_index] = _parse_date(key[date_index])
+	return key
+
+def listing_filters(params):
+	"""
+	Returns the queryset filters for the article listing given in the
+	request parameters: ``publisher``, ``date_from`` and ``date_to`` (as
+	YYYY-MM-DD) and ``featured`` (true or false).  Raises ValueError for
+	values that can't be parsed.
+	"""
+	filters = {}
+	if params.get('publisher'):
+		filters['publisher'] = params['publisher']
+	if params.get('date_from'):
+		filters['date__gte'] = _parse_date(params['date_from'])
+	if params.get('date_to'):
+		filters['date__lte'] = _parse_date(params['date_to'])
+	if params.get('featured'):
+		featured = params['featured'].lower()
+		if featured not in BOOLEAN_VALUES:
+			raise ValueError('featured must be true or false.')
+		filters['featured'] = BOOLEAN_VALUES[featured]
+	return filters
 
 def article_list(request):
 	"""
-	Returns a list of all articles.
+	Returns a page of articles in listing order.  The optional filters are
+	described in :func:`listing_filters`; the following page is requested
+	with the ``after`` cursor given in ``next_url`` rather than by page
+	number, so later pages are as cheap to fetch as the first.
 	"""
-	article_list = Article.objects.all()[:50]
+	try:
+		filters = listing_filters(request.GET)
+		key = None
+		if request.GET.get('after'):
+			key = decode_cursor(request.GET['after'])
+	except ValueError as err:
+		return HttpResponseBadRequest(str(err))
+
+	article_qs = Article.objects.listing().filter(**filters)
+	if key is not None:
+		article_qs = article_qs.after(key)
+	# fetch one extra article to find out if there is another page
+	article_list = list(article_qs[:ARTICLES_PER_PAGE + 1])
+	next_url = None
+	if len(article_list) > ARTICLES_PER_PAGE:
+		article_list = article_list[:ARTICLES_PER_PAGE]
+		params = request.GET.copy()
+		params['after'] = encode_cursor(article_list[-1])
+		next_url = '?%s' % params.urlencode()
 	return render(request, 'articles/list.html', {
 		'article_list': article_list,
+		'next_url': next_url,
 		})
 
 def article_detail(request, article_id):
@@ -25,12 +115,7 @@ def article_detail(request, article_id):
 
 	"""
 	article = get_object_or_404(Article, id=article_id)
-	ptrn = "%s/articleimages/%s_page*" % (STATIC_ROOT, article.base_filename())
-	raw_imagelist = glob.glob(ptrn)
-	pageimage_list = [part.split("/")[-1] for part in raw_imagelist]
 	return render(request, 'articles/detail.html',{
         'article': article,
-        'pageimage_list': pageimage_list,
-        'raw_imagelist': raw_imagelist,
-        'ptrn': ptrn,
-        })
\ No newline at end of file
+        'pageimage_list': article.page_images,
+        })
@@ -23,6 +23,8 @@ from optparse import make_option
 from django.core.management.base import BaseCommand, CommandError
 
 from georgia_lynchings.demographics.models import County, Population
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
+from georgia_lynchings.lynchings.stats import clear_site_stats
 
 class Command(BaseCommand):
 
@@ -44,6 +46,9 @@ class Command(BaseCommand):
         years = [1870, 1880, 1890, 1900, 1910, 1920, 1930]
         for year in years:
             self._import_file(year)
+        Population.build_statewide_totals()
+        clear_site_stats()
+        bump_data_generation()
 
     def _import_file(self, year):
         """
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.db import models
 from django.utils.encoding import smart_str
 
@@ -11,6 +12,12 @@ YEAR_CHOICES = (
     (1930, 1930),
 )
 
+# Census figures summed for the statewide totals.
+STATEWIDE_FIELDS = ['total', 'white', 'black', 'iltr_white', 'iltr_black']
+STATEWIDE_CACHE_KEY = 'demographics:statewide_totals'
+# memcached will not keep anything for longer than 30 days.
+STATEWIDE_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
 class County(models.Model):
     """
     Represents data about a particular county.
@@ -56,12 +63,37 @@ class Population(models.Model):
     class Meta:
         ordering = ["county__name", "year"]
 
+    @classmethod
+    def build_statewide_totals(cls):
+        """
+        Sums the census figures for every year in a single query and caches
+        the result.  Census data is static, so this only needs to be rerun
+        when census data is imported.
+        """
+        sums = dict([('sum_%s' % f, models.Sum(f)) for f in STATEWIDE_FIELDS])
+        totals = {}
+        for row in cls.objects.order_by().values('year').annotate(**sums):
+            totals[row['year']] = dict([(f, row['sum_%s' % f]) for f in STATEWIDE_FIELDS])
+        cache.set(STATEWIDE_CACHE_KEY, totals, STATEWIDE_CACHE_TIMEOUT)
+        return totals
+
+    @classmethod
+    def statewide_totals_by_year(cls):
+        """
+        Returns a dict of unsaved :class:`Population` objects holding the
+        statewide totals, keyed by census year.
+        """
+        totals = cache.get(STATEWIDE_CACHE_KEY)
+        if totals is None:
+            totals = cls.build_statewide_totals()
+        return dict([(year, cls(year=year, **sums)) for year, sums in totals.items()])
+
     @classmethod
     def statewide_totals_for_year(cls, year):
-        fields = ['total', 'white', 'black', 'iltr_white', 'iltr_black']
-        totals = cls.objects.filter(year=year).aggregate(
-                **dict([(f, models.Sum(f)) for f in fields]))
-        return cls(**totals)
+        totals = cls.statewide_totals_by_year()
+        if year in totals:
+            return totals[year]
+        return cls(year=year)
 
     def statewide_totals(self):
         return self.statewide_totals_for_year(self.year)
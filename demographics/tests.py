@@ -1,8 +1,11 @@
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db.models import Sum
 from django.test import TestCase
 from django.test.client import Client
 
-from georgia_lynchings.demographics.models import Population
+from georgia_lynchings.demographics.models import County, Population, \
+	STATEWIDE_CACHE_KEY
 
 class PopulationTest(TestCase):
 	fixtures = ['demographics.json']
@@ -41,4 +44,35 @@ class PopulationTest(TestCase):
 	def test_black_percent_literate(self):
 		expected = 80.77
 		actual = self.ppl.black_percent_literate
-		self.assertAlmostEqual(expected, actual, places=2)
\ No newline at end of file
+		self.assertAlmostEqual(expected, actual, places=2)
+
+class StatewideTotalsTest(TestCase):
+
+	def setUp(self):
+		cache.delete(STATEWIDE_CACHE_KEY)
+
+	def test_statewide_totals_for_year(self):
+		expected = Population.objects.filter(year=1890).aggregate(Sum('total'), Sum('iltr_black'))
+		actual = Population.statewide_totals_for_year(1890)
+		self.assertEqual(expected['total__sum'], actual.total)
+		self.assertEqual(expected['iltr_black__sum'], actual.iltr_black)
+		self.assertEqual(1890, actual.year)
+		# Served from the cache once built.
+		ppl = Population.objects.get(id=1979)
+		with self.assertNumQueries(0):
+			Population.statewide_totals_for_year(1920)
+			ppl.statewide_totals()
+
+	def test_missing_year(self):
+		actual = Population.statewide_totals_for_year(1850)
+		self.assertEqual(None, actual.total)
+		self.assertEqual(None, actual.percent_white)
+
+	def test_county_detail(self):
+		county = County.objects.get(name="Decatur")
+		response = self.client.get(reverse('lynchings:county_detail', args=[county.id]))
+		self.assertEqual(200, response.status_code)
+		census_list = response.context['census_list']
+		self.assertEqual(county.population_set.count(), len(census_list))
+		for pop, state in census_list:
+			self.assertEqual(pop.year, state.year)
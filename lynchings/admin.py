@@ -15,11 +15,18 @@ class StoryAdmin(admin.ModelAdmin):
     filter_horizontal = ('articles',)
 
 class LynchingAdmin(admin.ModelAdmin):
-    pass
+
+    def queryset(self, request):
+        # lynchings are listed by descriptions of their victims
+        return super(LynchingAdmin, self).queryset(request).with_summary()
 
 class VictimAdmin(admin.ModelAdmin):
     list_filter = ('county',)
 
+    def queryset(self, request):
+        # unnamed victims are listed by race
+        return super(VictimAdmin, self).queryset(request).select_related('race')
+
 admin.site.register(Race, RaceAdmin)
 admin.site.register(Accusation, AccusationAdmin)
 admin.site.register(Lynching, LynchingAdmin)
@@ -0,0 +1,134 @@
+"""
+Streaming exports of the site data for bulk download.
+
+Rows are read from the database a chunk at a time, seeking on the primary
+key rather than using offsets, and written to the response as they are
+produced, so the memory used by an export stays the same however much data
+there is.  The same rows can be written as CSV or as newline-delimited JSON
+(one JSON object per line).
+"""
+
+import csv
+import json
+from collections import defaultdict, OrderedDict
+from cStringIO import StringIO
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.encoding import smart_str
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+# Separates multiple values, such as accusations, in a CSV field.
+LIST_SEPARATOR = u'; '
+
+VICTIM_FIELDS = ['victim_id', 'lynching_id', 'name', 'race', 'gender', 'date',
+                 'county_id', 'county', 'latitude', 'longitude', 'accusations',
+                 'detailed_reason']
+
+def chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the results of a ``values()`` queryset that includes the id, in
+    id order, as lists of at most chunk_size rows.  Each chunk is a separate
+    query for the rows after the last id of the previous one.
+    """
+    last_id = None
+    while True:
+        chunk_qs = queryset.order_by('id')
+        if last_id is not None:
+            chunk_qs = chunk_qs.filter(id__gt=last_id)
+        chunk = list(chunk_qs[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]['id']
+
+def victim_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields a dict for each victim with the details of their lynching,
+    county and accusations, with the keys in :data:`VICTIM_FIELDS`.
+    """
+    from georgia_lynchings.lynchings.models import Victim
+    victims = Victim.objects.values('id', 'lynching', 'name', 'race__label',
+                                    'gender', 'date', 'county', 'county__name',
+                                    'county__latitude', 'county__longitude',
+                                    'detailed_reason')
+    for chunk in chunks(victims, chunk_size):
+        for row in _victim_chunk_rows(chunk):
+            yield row
+
+def _victim_chunk_rows(chunk):
+    """Adds the accusations to a chunk of victims with a single query."""
+    from georgia_lynchings.lynchings.models import Victim
+    accusations = defaultdict(list)
+    through = Victim.accusation.through.objects \
+                    .filter(victim__in=[victim['id'] for victim in chunk]) \
+                    .order_by('accusation__label') \
+                    .values_list('victim', 'accusation__label')
+    for victim_id, label in through:
+        accusations[victim_id].append(label)
+    for victim in chunk:
+        yield OrderedDict([
+            ('victim_id', victim['id']),
+            ('lynching_id', victim['lynching']),
+            ('name', victim['name']),
+            ('race', victim['race__label']),
+            ('gender', victim['gender']),
+            ('date', victim['date']),
+            ('county_id', victim['county']),
+            ('county', victim['county__name']),
+            ('latitude', victim['county__latitude']),
+            ('longitude', victim['county__longitude']),
+            ('accusations', accusations[victim['id']]),
+            ('detailed_reason', victim['detailed_reason']),
+        ])
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        value = LIST_SEPARATOR.join(value)
+    elif hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return smart_str(value)
+
+def csv_lines(fields, rows):
+    """Yields a header line and then a line of CSV for each row dict."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_csv_value(row[field]) for field in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # the header alone when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def ndjson_lines(rows):
+    """Yields a line of JSON for each row dict."""
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+def export_response(rows, fields, format, filename):
+    """
+    Returns a response that streams the rows in the requested format as a
+    file download.
+
+    :param rows:  Iterator of dicts with keys in fields.
+    :param fields:  List of field names, in the order of the CSV columns.
+    :param format:  'csv' or 'ndjson'.
+    :param filename:  Download filename without an extension.
+    """
+    if format == 'csv':
+        content = csv_lines(fields, rows)
+    else:
+        content = ndjson_lines(rows)
+    response = HttpResponse(content, mimetype=EXPORT_FORMATS[format])
+    response['Content-Disposition'] = 'attachment; filename=%s.%s' % (filename, format)
+    return response
@@ -0,0 +1,211 @@
+"""
+Times the site's public views and JSON endpoints against the data in the
+database, usually a synthetic dataset from the ``generate_dataset``
+command, and writes the results as JSON so they can be compared across
+releases.
+
+Each view is requested through the Django test client in three ways, each
+``--repeat`` times: *cold*, with the precomputed data (site counts, timemap
+feed, graph data and census totals) and the response cache cleared before
+every request; *warm*, with the precomputed data in place but bypassing the
+response cache; and *cached*, served from the response cache.  The fastest
+and median times and the number of queries of each are reported.
+
+Benchmarking clears the cached data, so run it against a scratch database
+rather than the production one.
+
+Usage::
+
+    $ ./manage.py benchmark_views
+    $ ./manage.py benchmark_views --repeat 10 --output benchmark-0.9.0.json
+    $ ./manage.py benchmark_views --compare benchmark-0.8.0.json
+    $ ./manage.py benchmark_views lynchings:timemap_data relations:graph_data
+
+"""
+
+from datetime import datetime
+import json
+from optparse import make_option
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count
+from django.test.client import Client
+
+from georgia_lynchings import __version__
+from georgia_lynchings.articles.models import Article
+from georgia_lynchings.demographics.models import County, Population, STATEWIDE_CACHE_KEY
+from georgia_lynchings.lynchings import profiling, responsecache
+from georgia_lynchings.lynchings.models import Accusation, Lynching, Victim
+from georgia_lynchings.lynchings.stats import clear_site_stats
+from georgia_lynchings.lynchings.timemap import clear_timemap_feed
+from georgia_lynchings.reldata import models as reldata
+from georgia_lynchings.reldata.graph import clear_graph_data
+
+MODES = ['cold', 'warm', 'cached']
+
+class Command(BaseCommand):
+    help = 'Time the public views and write the results as JSON.'
+    args = '[view name ...]'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat',
+            dest='repeat',
+            type='int',
+            default=5,
+            help='Number of times to request each view in each mode.  Defaults to 5.'),
+        make_option('--output',
+            dest='output',
+            help='Write the results to this JSON file.'),
+        make_option('--compare',
+            dest='compare',
+            help='Compare the results with those in an earlier JSON file.'),
+    )
+
+    def handle(self, *args, **options):
+        self.repeat = max(options['repeat'], 1)
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as previous_file:
+                previous = json.load(previous_file)
+
+        views = self.benchmark_urls()
+        if args:
+            unknown = set(args) - set(view_name for view_name, url in views)
+            if unknown:
+                raise CommandError('Unknown or unavailable views: %s' % ', '.join(sorted(unknown)))
+            views = [(view_name, url) for view_name, url in views if view_name in args]
+
+        results = {
+            'version': __version__,
+            'created': datetime.now().isoformat(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'repeat': self.repeat,
+            'data': self.data_counts(),
+            'views': [self.benchmark(view_name, url) for view_name, url in views],
+        }
+        self.clear_caches()
+
+        if int(options['verbosity']) > 0:
+            self.print_results(results)
+        if previous is not None:
+            self.print_comparison(previous, results)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+
+    def benchmark_urls(self):
+        '''The views to time and a url for each, with objects chosen from the
+        database that have the most related data.  Views that need an object
+        are left out if there isn't one.'''
+        urls = [
+            ('home', reverse('home')),
+            ('lynchings:lynching_list', reverse('lynchings:lynching_list')),
+            ('lynchings:alleged_crimes_list', reverse('lynchings:alleged_crimes_list')),
+            ('lynchings:county_list', reverse('lynchings:county_list')),
+            ('lynchings:timemap', reverse('lynchings:timemap')),
+            ('lynchings:timemap_data', reverse('lynchings:timemap_data')),
+            ('lynchings:map_data', reverse('lynchings:map_data') + '?zoom=7'),
+            ('lynchings:stats_data', reverse('lynchings:stats_data')),
+            ('lynchings:export_victims', reverse('lynchings:export_victims', args=['ndjson'])),
+            ('articles:list', reverse('articles:list')),
+            ('relations:graph', reverse('relations:graph')),
+            ('relations:graph_data', reverse('relations:graph_data')),
+            ('relations:export_relations', reverse('relations:export_relations', args=['ndjson'])),
+        ]
+        lynching = Lynching.objects.annotate(count=Count('victim')).order_by('-count', 'id')[:1]
+        if lynching:
+            urls.append(('lynchings:lynching_detail',
+                         reverse('lynchings:lynching_detail', args=[lynching[0].id])))
+        accusation = Accusation.objects.annotate(count=Count('victim')).order_by('-count', 'id')[:1]
+        if accusation:
+            urls.append(('lynchings:lynching_list_by_accusation',
+                         reverse('lynchings:lynching_list_by_accusation', args=[accusation[0].id])))
+        county = County.objects.annotate(count=Count('victim')).order_by('-count', 'id')[:1]
+        if county:
+            urls.append(('lynchings:county_detail',
+                         reverse('lynchings:county_detail', args=[county[0].id])))
+        article = Article.objects.order_by('id')[:1]
+        if article:
+            urls.append(('articles:detail', reverse('articles:detail', args=[article[0].id])))
+        actor = reldata.Relation.objects.filter(subject__isnull=False).values('subject') \
+                        .annotate(count=Count('id')).order_by('-count', 'subject')[:1]
+        if actor:
+            urls.append(('relations:event_lookup', '%s?participant=%d' %
+                         (reverse('relations:event_lookup'), actor[0]['subject'])))
+        return urls
+
+    def data_counts(self):
+        return {
+            'lynchings': Lynching.objects.count(),
+            'victims': Victim.objects.count(),
+            'accusations': Accusation.objects.count(),
+            'counties': County.objects.count(),
+            'populations': Population.objects.count(),
+            'articles': Article.objects.count(),
+            'relations': reldata.Relation.objects.count(),
+            'actors': reldata.Actor.objects.count(),
+        }
+
+    def clear_caches(self):
+        '''Drop all of the precomputed data and the cached pages.'''
+        clear_site_stats()
+        clear_timemap_feed()
+        clear_graph_data()
+        cache.delete(STATEWIDE_CACHE_KEY)
+        responsecache.bump_data_generation()
+
+    def benchmark(self, view_name, url):
+        '''Time a view in each mode, returning a dict of the results.'''
+        client = Client()
+        result = {'view': view_name, 'url': url}
+        for mode in MODES:
+            times = []
+            for i in range(self.repeat):
+                if mode == 'cold':
+                    self.clear_caches()
+                elif mode == 'warm':
+                    responsecache.bump_data_generation()
+                with profiling.profile(view_name) as profile:
+                    response = client.get(url)
+                    # streamed responses are only generated when read
+                    content = response.content
+                times.append(profile.total_time)
+            times.sort()
+            result[mode] = {
+                'min': times[0],
+                'median': times[len(times) // 2],
+                'queries': profile.query_count,
+            }
+        result['status'] = response.status_code
+        result['bytes'] = len(content)
+        return result
+
+    def print_results(self, results):
+        print 'Georgia Lynchings %s, %s database, best of %d' % \
+            (results['version'], results['database'], results['repeat'])
+        print ', '.join('%d %s' % (count, name) for name, count in sorted(results['data'].items()))
+        print '%-40s %10s %10s %10s %8s' % ('view', 'cold', 'warm', 'cached', 'queries')
+        for view in results['views']:
+            print '%-40s %9.1fms %9.1fms %9.1fms %8d' % \
+                (view['view'], view['cold']['min'] * 1000, view['warm']['min'] * 1000,
+                 view['cached']['min'] * 1000, view['cold']['queries'])
+
+    def print_comparison(self, previous, results):
+        '''Print the change in the median warm time of each view since the
+        earlier results.'''
+        earlier = dict((view['view'], view) for view in previous['views'])
+        print '\nCompared with %s (%s):' % (previous['version'], previous['created'])
+        print '%-40s %10s %10s %8s %8s' % ('view', 'before', 'after', 'change', 'queries')
+        for view in results['views']:
+            before = earlier.get(view['view'])
+            if before is None:
+                continue
+            print '%-40s %9.1fms %9.1fms %7.0f%% %+8d' % \
+                (view['view'], before['warm']['median'] * 1000, view['warm']['median'] * 1000,
+                 (view['warm']['median'] / max(before['warm']['median'], 1e-6) - 1) * 100,
+                 view['cold']['queries'] - before['cold']['queries'])
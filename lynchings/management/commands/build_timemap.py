@@ -0,0 +1,25 @@
+"""
+Rebuilds the precomputed data feed served to the timemap from the current
+Lynching, Victim and County data.  The feed is normally kept current
+automatically as data is saved, but this should be run after any bulk data
+changes made outside of the Django ORM.
+
+Usage::
+
+    $ ./manage.py build_timemap
+
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
+from georgia_lynchings.lynchings.timemap import build_timemap_feed
+
+class Command(NoArgsCommand):
+    help = "Rebuild the precomputed data feed for the lynchings timemap."
+
+    def handle_noargs(self, **options):
+        feed = build_timemap_feed()
+        bump_data_generation()
+        if int(options.get('verbosity', 1)) > 0:
+            print "Built timemap feed with %s lynchings." % len(feed['entries'])
@@ -0,0 +1,290 @@
+"""
+Generates a synthetic dataset at a configurable scale, for measuring how
+the site's views perform with much more data than the test fixtures hold
+(see the ``benchmark_views`` command).
+
+Lynchings are created with their victims spread at random over all of the
+counties in the database, with synthetic races, accusations and articles.
+Census figures are added for every county in every census year that
+doesn't have them, and relations are generated between actors chosen from
+a Zipf distribution, so that a few actors (like "mob" in the real data)
+take part in most of them.  All derived data is rebuilt afterwards.
+
+The command refuses to run if there are already lynchings or relations in
+the database, so run it against a scratch database set up with syncdb and
+migrate, with the counties and census data loaded from the demographics
+``initial_data`` fixture.
+
+Usage::
+
+    $ ./manage.py generate_dataset
+    $ ./manage.py generate_dataset --lynchings 5000 --victims 8000 --relations 1000000
+
+"""
+
+from bisect import bisect
+from datetime import date, timedelta
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from georgia_lynchings.articles.models import Article
+from georgia_lynchings.demographics.models import County, Population, YEAR_CHOICES
+from georgia_lynchings.lynchings.models import Accusation, Lynching, Race, Victim, \
+    suspended_derived_data
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
+from georgia_lynchings.reldata import models as reldata
+from georgia_lynchings.reldata.graph import build_filter_facets, build_graph_data
+
+# Range of dates for the synthetic lynchings.
+FIRST_DATE = date(1875, 1, 1)
+LAST_DATE = date(1930, 12, 31)
+
+# sqlite allows at most 999 parameters in a query.
+SQLITE_MAX_PARAMETERS = 999
+
+RACES = ['Black', 'White', 'Unknown']
+# Relative frequency of each race, and of male and female victims.
+RACE_WEIGHTS = [85, 10, 5]
+GENDER_WEIGHTS = [('M', 97), ('F', 3)]
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset for benchmarking.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--lynchings',
+            dest='lynchings',
+            type='int',
+            default=1000,
+            help='Number of lynchings.  Defaults to 1000.'),
+        make_option('--victims',
+            dest='victims',
+            type='int',
+            default=1500,
+            help='Number of victims, at least one for each lynching.  Defaults to 1500.'),
+        make_option('--accusations',
+            dest='accusations',
+            type='int',
+            default=40,
+            help='Number of distinct accusations.  Defaults to 40.'),
+        make_option('--articles',
+            dest='articles',
+            type='int',
+            default=2000,
+            help='Number of articles, each about one lynching.  Defaults to 2000.'),
+        make_option('--relations',
+            dest='relations',
+            type='int',
+            default=100000,
+            help='Number of relations.  Defaults to 100000.'),
+        make_option('--actors',
+            dest='actors',
+            type='int',
+            default=500,
+            help='Number of actors in the relations.  Defaults to 500.'),
+        make_option('--actions',
+            dest='actions',
+            type='int',
+            default=20,
+            help='Number of actions in the relations.  Defaults to 20.'),
+        make_option('--zipf',
+            dest='zipf',
+            type='float',
+            default=1.1,
+            help='Exponent of the Zipf distribution of actors and actions.  Defaults to 1.1.'),
+        make_option('--batch-size',
+            dest='batch_size',
+            type='int',
+            default=100,
+            help='Number of rows to insert per query.  Defaults to 100.'),
+        make_option('--seed',
+            dest='seed',
+            type='int',
+            default=0,
+            help='Random seed for the synthetic data.'),
+    )
+
+    def handle(self, *args, **options):
+        if Lynching.objects.exists() or reldata.Relation.objects.exists():
+            raise CommandError('There are already lynchings or relations in the database.  ' +
+                               'Generate the dataset in an empty database.')
+        self.counties = list(County.objects.values_list('id', flat=True))
+        if not self.counties:
+            raise CommandError('There are no counties in the database.  ' +
+                               'Load them with loaddata demographics/fixtures/initial_data.json.')
+        if options['lynchings'] < 1:
+            raise CommandError('Generate at least one lynching.')
+        self.verbosity = int(options['verbosity'])
+        self.rng = random.Random(options['seed'])
+        self.batch_size = max(options['batch_size'], 1)
+        start_time = time.time()
+
+        with transaction.commit_on_success():
+            populations = self.create_populations()
+            with suspended_derived_data():
+                lynchings = self.create_lynchings(options['lynchings'])
+                victims = self.create_victims(lynchings, max(options['victims'], len(lynchings)),
+                                              options['accusations'], options['zipf'])
+                articles = self.create_articles(lynchings, options['articles'])
+            relations = self.create_relations(lynchings, options['relations'],
+                                              options['actors'], options['actions'],
+                                              options['zipf'])
+            Population.build_statewide_totals()
+            build_graph_data()
+            build_filter_facets()
+        bump_data_generation()
+
+        if self.verbosity > 0:
+            print 'Generated %d lynchings, %d victims, %d articles, %d relations ' \
+                  'and %d census figures in %.1fs' % \
+                (len(lynchings), victims, articles, relations, populations,
+                 time.time() - start_time)
+
+    def bulk_create(self, model, objects):
+        '''Insert objects in batches, returning how many there were.'''
+        batch_size = self.batch_size
+        if connection.vendor == 'sqlite':
+            batch_size = min(batch_size, SQLITE_MAX_PARAMETERS // len(model._meta.fields))
+        count = 0
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                model.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    def created_ids(self, model, before):
+        '''Ids of the objects inserted since the highest id was before.'''
+        return list(model.objects.filter(id__gt=before).order_by('id')
+                                 .values_list('id', flat=True))
+
+    def last_id(self, model):
+        last = model.objects.order_by('-id').values_list('id', flat=True)[:1]
+        return last[0] if last else 0
+
+    def zipf_chooser(self, ids, exponent):
+        '''Returns a function that picks from ids with the probability of the
+        item at rank r proportional to 1 / r ** exponent.'''
+        return self.weighted_chooser([(item, 1.0 / rank ** exponent)
+                                      for rank, item in enumerate(ids, 1)])
+
+    def weighted_chooser(self, weighted):
+        '''Returns a function that picks a value from (value, weight) pairs.'''
+        cumulative = []
+        total = 0.0
+        for value, weight in weighted:
+            total += weight
+            cumulative.append(total)
+        values = [value for value, weight in weighted]
+        return lambda: values[min(bisect(cumulative, self.rng.random() * total), len(values) - 1)]
+
+    def random_date(self):
+        return FIRST_DATE + timedelta(days=self.rng.randint(0, (LAST_DATE - FIRST_DATE).days))
+
+    def create_populations(self):
+        '''Add census figures for each county and year that has none.'''
+        existing = set(Population.objects.values_list('county', 'year'))
+        populations = []
+        for county_id in self.counties:
+            total = self.rng.randint(2000, 40000)
+            for year, label in YEAR_CHOICES:
+                if (county_id, year) in existing:
+                    continue
+                total = int(total * self.rng.uniform(0.95, 1.2))
+                black = int(total * self.rng.uniform(0.2, 0.7))
+                white = total - black
+                populations.append(Population(county_id=county_id, year=year, total=total,
+                    white=white, black=black,
+                    iltr_white=int(white * self.rng.uniform(0.05, 0.2)),
+                    iltr_black=int(black * self.rng.uniform(0.3, 0.8))))
+        return self.bulk_create(Population, populations)
+
+    def create_lynchings(self, count):
+        before = self.last_id(Lynching)
+        # pca ids above any in the real data
+        self.bulk_create(Lynching, (Lynching(pca_id=1000000 + i) for i in xrange(count)))
+        return self.created_ids(Lynching, before)
+
+    def create_victims(self, lynchings, count, accusation_count, exponent):
+        '''Create victims, one for each lynching and the rest at random,
+        with one or two accusations each.  Returns the number created.'''
+        races = dict((label, Race.objects.get_or_create(label=label)[0].id) for label in RACES)
+        choose_race = self.weighted_chooser([(races[label], weight)
+                                      for label, weight in zip(RACES, RACE_WEIGHTS)])
+        choose_gender = self.weighted_chooser(GENDER_WEIGHTS)
+
+        before = self.last_id(Accusation)
+        self.bulk_create(Accusation, (Accusation(label='synthetic accusation %d' % i)
+                                      for i in xrange(max(accusation_count, 1))))
+        choose_accusation = self.zipf_chooser(self.created_ids(Accusation, before), exponent)
+
+        dates = dict((lynching_id, self.random_date()) for lynching_id in lynchings)
+        counties = dict((lynching_id, self.rng.choice(self.counties)) for lynching_id in lynchings)
+        def victim(i):
+            lynching_id = lynchings[i] if i < len(lynchings) else self.rng.choice(lynchings)
+            return Victim(lynching_id=lynching_id,
+                          name='Synthetic Victim %d' % i if self.rng.random() < 0.8 else None,
+                          race_id=choose_race(),
+                          gender=choose_gender(),
+                          date=dates[lynching_id],
+                          # most victims of a lynching are in the same county
+                          county_id=counties[lynching_id] if self.rng.random() < 0.9
+                                    else self.rng.choice(self.counties),
+                          detailed_reason='Synthetic reason %d' % i)
+        before = self.last_id(Victim)
+        self.bulk_create(Victim, (victim(i) for i in xrange(count)))
+
+        Through = Victim.accusation.through
+        def accusations():
+            for victim_id in self.created_ids(Victim, before):
+                for accusation_id in set(choose_accusation()
+                                         for i in range(self.rng.randint(1, 2))):
+                    yield Through(victim_id=victim_id, accusation_id=accusation_id)
+        self.bulk_create(Through, accusations())
+        return count
+
+    def create_articles(self, lynchings, count):
+        '''Create articles, each linked to a random lynching.  Returns the
+        number created.'''
+        publishers = ['Synthetic Gazette %d' % i for i in range(20)]
+        before = self.last_id(Article)
+        self.bulk_create(Article, (Article(title='Synthetic article %d' % i,
+                                           publisher=self.rng.choice(publishers),
+                                           date=self.random_date())
+                                   for i in xrange(count)))
+        Through = Lynching.articles.through
+        self.bulk_create(Through, (Through(lynching_id=self.rng.choice(lynchings),
+                                           article_id=article_id)
+                                   for article_id in self.created_ids(Article, before)))
+        return count
+
+    def create_relations(self, lynchings, count, actor_count, action_count, exponent):
+        '''Create relations in the lynchings, with Zipf distributed actors
+        and actions.  Returns the number created.'''
+        before = self.last_id(reldata.Actor)
+        self.bulk_create(reldata.Actor, (reldata.Actor(description='synthetic actor %d' % i)
+                                         for i in xrange(max(actor_count, 1))))
+        choose_actor = self.zipf_chooser(self.created_ids(reldata.Actor, before), exponent)
+        before = self.last_id(reldata.Action)
+        self.bulk_create(reldata.Action, (reldata.Action(description='synthetic action %d' % i)
+                                          for i in xrange(max(action_count, 1))))
+        choose_action = self.zipf_chooser(self.created_ids(reldata.Action, before), exponent)
+
+        def relation(i):
+            return reldata.Relation(story_id=self.rng.choice(lynchings),
+                                    event_id=i // 10,
+                                    sequence_id=i % 10,
+                                    triplet_id=i,
+                                    subject_id=choose_actor(),
+                                    action_id=choose_action(),
+                                    # some relations are incomplete, as in the imported data
+                                    object_id=choose_actor() if i % 20 else None)
+        return self.bulk_create(reldata.Relation, (relation(i) for i in xrange(count)))
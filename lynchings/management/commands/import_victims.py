@@ -26,6 +26,8 @@ order:
 
 * First row will be ignored as column names.
 * Lynching data is not replaced as part of this import, only victim information.
+* The whole import runs in a single transaction, so a failure part way
+  through leaves the existing data unchanged.
 
 """
 
@@ -34,22 +36,31 @@ from optparse import make_option
 from datetime import datetime
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils.encoding import smart_unicode, smart_str
 
 from georgia_lynchings.demographics.models import County
-from georgia_lynchings.lynchings.models import Lynching, Victim, Race, Accusation
+from georgia_lynchings.lynchings.models import Lynching, Victim, Race, Accusation, \
+    suspended_derived_data
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
 
 class Command(BaseCommand):
     """
     Imports information about Victims of Lynchings for use in rendering the Lynching
     information throughout the site.
 
+    Races, accusations, counties and lynchings are matched through lookup
+    dictionaries loaded once at the start of the import and victims are
+    inserted in batches, so the number of queries doesn't grow with the
+    number of rows in the input file.
     """
 
     help = "Imports Victim data from the CSV export produced from PCAce.  Ignores first row as fieldnames."
     args = "<filename>"
 
     fieldnames = ('event_id', 'date_raw', 'name', 'race_raw', 'gender_raw', 'detailed_reason', 'accusation_raw', 'county_raw')
+    # Victim fields matched to find the inserted victims.
+    victim_key_fields = ('lynching', 'name', 'detailed_reason', 'race', 'gender', 'county', 'date')
 
     option_list = BaseCommand.option_list + (
         make_option('--silent',
@@ -57,30 +68,52 @@ class Command(BaseCommand):
                 dest='silent',
                 help='Skips user input for the wipe of all victim data before loading input file.'
             ),
+        make_option('--batch-size',
+                dest='batch_size',
+                type='int',
+                default=100,
+                help='Number of rows to insert per query.  Defaults to 100.'
+            ),
         )
 
     def handle(self, *args, **options):
         if not args:
             raise CommandError("No import file specificed!")
         reader = self._init_reader(args)
-        self._confirm_wipe(options.get('silent')) # Safty Step to confirm wipe of data.
-        self._insert_count = 0
-        for row in reader:
-            self._handle_row(row)
+        self.batch_size = options.get('batch_size') or 100
+        # Safty Step to confirm wipe of data, before the transaction is opened.
+        wipe = self._confirm_wipe(options.get('silent'))
+        with transaction.commit_on_success():
+            with suspended_derived_data():
+                if wipe:
+                    self._wipe()
+                rows = list(reader)
+                self._load_lookups(rows)
+                self._insert_victims(rows)
+        bump_data_generation()
         print "Inserted %s Victims from the input file." % self._insert_count
+        self._report_unmatched_counties()
 
     def _confirm_wipe(self, silent):
-        """Step to require users to confirm the wipe of victims before proceeding."""
-        if not silent:
-            input_msg = """CONFIRM YOU WISH TO PROCEED WITH A FULL WIPE AND RELOAD OF \
-                        ALL VICTIM, RACE and ACCUSATION DATA? (Y/n)"""
-            user_input = raw_input(input_msg + ': ')
-            if user_input.lower() not in ['y', 'yes']:
-                raise CommandError("User Aborted Data Import!  No data was changed.")
-            print "Wiping %s Victims from the database." % Victim.objects.all().count()
-            Victim.objects.all().delete()
-            Accusation.objects.all().delete()
-            Race.objects.all().delete()
+        """
+        Step to require users to confirm the wipe of victims before proceeding.
+        Returns True if the data should be wiped.
+        """
+        if silent:
+            return False
+        input_msg = """CONFIRM YOU WISH TO PROCEED WITH A FULL WIPE AND RELOAD OF \
+                    ALL VICTIM, RACE and ACCUSATION DATA? (Y/n)"""
+        user_input = raw_input(input_msg + ': ')
+        if user_input.lower() not in ['y', 'yes']:
+            raise CommandError("User Aborted Data Import!  No data was changed.")
+        return True
+
+    def _wipe(self):
+        """Removes all victims, accusations and races."""
+        print "Wiping %s Victims from the database." % Victim.objects.all().count()
+        Victim.objects.all().delete()
+        Accusation.objects.all().delete()
+        Race.objects.all().delete()
 
     def _init_reader(self, *args):
         """Open the input file and return the reader object."""
@@ -94,39 +127,96 @@ class Command(BaseCommand):
         except IOError as e:
             raise CommandError("Unable to find file %s" % filename)
 
-    def _handle_row(self, row):
+    def _bulk_create(self, model, objs):
+        """Inserts unsaved model instances in batches of the configured size."""
+        for start in range(0, len(objs), self.batch_size):
+            model.objects.bulk_create(objs[start:start + self.batch_size])
+
+    def _clean(self, raw):
+        """Returns stripped unicode text from a raw input value."""
+        return smart_unicode(raw or '', errors='ignore').strip(u' \t\n\r')
+
+    def _load_labels(self, model, labels):
         """
-        Processes a single row from the input file.
+        Returns a dictionary of instances of a labeled model (Race or
+        Accusation) keyed by case folded label, first creating any of the
+        labels that don't exist yet.
+        """
+        lookup = dict([(obj.label.lower(), obj) for obj in model.objects.all()])
+        new_labels = {}
+        for label in labels:
+            if label and label.lower() not in lookup:
+                new_labels.setdefault(label.lower(), label)
+        if new_labels:
+            self._bulk_create(model, [model(label=label) for label in new_labels.values()])
+            lookup = dict([(obj.label.lower(), obj) for obj in model.objects.all()])
+        return lookup
 
-        :param row:  Dict of a single raw input row.
+    def _load_lookups(self, rows):
+        """
+        Loads the races, accusations, counties and lynchings referenced by
+        the input rows into lookup dictionaries, creating any missing races,
+        accusations and lynchings.
         """
-        data = {
-            'name': smart_unicode(row['name'], errors='ignore'),
-            'detailed_reason': smart_unicode(row['detailed_reason'], errors='ignore'),
-        }
-        data['lynching'], created = Lynching.objects.get_or_create(pca_id=row['event_id'])
-        data['race'] = self._get_race(row['race_raw'])
-        data['gender'] = self._get_gender(row['gender_raw'])
-        data['county'] = self._get_county(row['county_raw'])
-        data['date'] = self._handle_date(row['date_raw'])
-        victim = Victim(**data)
-        victim.save()
-        self._handle_accusation(victim, row['accusation_raw'])
-        self._insert_count += 1
-
-    def _get_race(self, race_raw):
+        self._races = self._load_labels(Race,
+            [self._clean(row['race_raw']) for row in rows])
+        self._accusations = self._load_labels(Accusation,
+            [self._clean(row['accusation_raw']) for row in rows])
+        self._counties = dict([(county.name.lower(), county) for county in County.objects.all()])
+
+        self._lynchings = dict(Lynching.objects.values_list('pca_id', 'id'))
+        new_pca_ids = set([int(row['event_id']) for row in rows]) - set(self._lynchings)
+        if new_pca_ids:
+            self._bulk_create(Lynching, [Lynching(pca_id=pca_id) for pca_id in sorted(new_pca_ids)])
+            self._lynchings = dict(Lynching.objects.values_list('pca_id', 'id'))
+
+    def _insert_victims(self, rows):
         """
-        Tries to approximate a match of race from current values or creates one if no match found.
+        Inserts a victim for every input row, followed by the links between
+        victims and their accusations.
         """
-        if not race_raw:
-            return None
-        race_text = race_raw.strip(' \t\n\r')
-        try:
-            race = Race.objects.get(label__iexact=race_text)
-        except Race.DoesNotExist:
-            race = Race(label=race_text)
-            race.save()
-        return race
+        self._unmatched_counties = {}
+        victims, accusations = [], []
+        for row in rows:
+            victims.append(Victim(
+                lynching_id=self._lynchings[int(row['event_id'])],
+                name=smart_unicode(row['name'], errors='ignore'),
+                detailed_reason=smart_unicode(row['detailed_reason'], errors='ignore'),
+                race=self._races.get(self._clean(row['race_raw']).lower()),
+                gender=self._get_gender(row['gender_raw']),
+                county=self._get_county(row['county_raw']),
+                date=self._handle_date(row['date_raw']),
+            ))
+            accusations.append(self._accusations.get(self._clean(row['accusation_raw']).lower()))
+
+        # bulk_create doesn't report the ids of new rows, and nothing
+        # guarantees they follow the insertion order, so match the new rows
+        # to the input by their values to link victims with their accusations.
+        # Victims with all the same values are interchangeable.
+        existing_ids = set(Victim.objects.values_list('id', flat=True))
+        self._bulk_create(Victim, victims)
+        new_ids = {}
+        for values in Victim.objects.order_by('id').values('id', *self.victim_key_fields):
+            if values['id'] not in existing_ids:
+                key = tuple(values[field] for field in self.victim_key_fields)
+                new_ids.setdefault(key, []).append(values['id'])
+
+        Through = Victim.accusation.through
+        links = []
+        for victim, accusation in zip(victims, accusations):
+            ids = new_ids.get(self._victim_key(victim))
+            if not ids:
+                raise CommandError("Unable to find the inserted victim %s." % smart_str(victim))
+            victim_id = ids.pop(0)
+            if accusation:
+                links.append(Through(victim_id=victim_id, accusation_id=accusation.id))
+        self._bulk_create(Through, links)
+        self._insert_count = len(victims)
+
+    def _victim_key(self, victim):
+        """Returns the values of a victim's key fields, as read back by values()."""
+        return (victim.lynching_id, victim.name, victim.detailed_reason, victim.race_id,
+                victim.gender, victim.county_id, victim.date)
 
     def _get_gender(self, gender_raw):
         """
@@ -147,40 +237,29 @@ class Command(BaseCommand):
         """
         try:
             fmt = "%m/%d/%Y"# mm/dd/yyyy
-            date = datetime.strptime(date_string.strip(), fmt)
+            date = datetime.strptime(date_string.strip(), fmt).date()
             return date
         except ValueError:
             #print("Could not parse date from string %s" % date_string)
             return None
-        
-    def _handle_accusation(self, victim, accusation_raw):
-        """
-        Tries to approximate a match of the accusation from the current values or creates one if no match found.
-        """
-        if not accusation_raw:
-            return None
-        accusation_text = accusation_raw.strip(' \t\n\r')
-        try:
-            accusation = Accusation.objects.get(label__iexact=accusation_text)
-        except Accusation.DoesNotExist:
-            accusation = Accusation(label=accusation_text)
-            accusation.save()
-        victim.accusation.add(accusation)
 
     def _get_county(self, county_raw):
         """
         This processes the string data from the county information and tries to make a
         sensible match from it.
         """
-        if not county_raw:
-            return None
-        county_name = county_raw.strip(' \t\n\r')
-        try:
-            county = County.objects.get(name__iexact=county_name)
-            return county
-        except County.DoesNotExist:
-            print "County named %s not found in list!" % county_name
+        county_name = self._clean(county_raw)
+        if not county_name:
             return None
+        county = self._counties.get(county_name.lower())
+        if county is None:
+            self._unmatched_counties[county_name] = self._unmatched_counties.get(county_name, 0) + 1
+        return county
 
-
-
+    def _report_unmatched_counties(self):
+        """Lists county names from the input file that matched no county."""
+        if not self._unmatched_counties:
+            return
+        print "%s county names were not found in the county list:" % len(self._unmatched_counties)
+        for name, count in sorted(self._unmatched_counties.items()):
+            print "    %s (%s victims)" % (smart_str(name), count)
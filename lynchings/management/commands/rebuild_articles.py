@@ -33,6 +33,7 @@ from django.utils.encoding import smart_unicode, smart_str
 
 from georgia_lynchings.articles.models import Article
 from georgia_lynchings.lynchings.models import Lynching
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
 
 class Command(BaseCommand):
     help = "Related articles to lynchings by the PCA Identifier in th import file."
@@ -44,6 +45,7 @@ class Command(BaseCommand):
     	reader = self._init_reader(args)
         for row in reader:
             self._handle_row(row)
+        bump_data_generation()
 
     def _handle_row(self, row):
         """
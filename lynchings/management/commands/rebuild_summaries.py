@@ -0,0 +1,27 @@
+"""
+Rebuilds the denormalized LynchingSummary table used for list displays and
+the timemap from the current Lynching and Victim data.  Summaries are
+normally kept current automatically as data is saved, but this should be
+run after any bulk data changes made outside of the Django ORM.
+
+Usage::
+
+    $ ./manage.py rebuild_summaries
+
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from georgia_lynchings.lynchings.models import LynchingSummary
+from georgia_lynchings.lynchings.responsecache import bump_data_generation
+from georgia_lynchings.lynchings.timemap import build_timemap_feed
+
+class Command(NoArgsCommand):
+    help = "Rebuild the lynching summary table and the timemap feed built from it."
+
+    def handle_noargs(self, **options):
+        count = LynchingSummary.rebuild()
+        build_timemap_feed()
+        bump_data_generation()
+        if int(options.get('verbosity', 1)) > 0:
+            print "Rebuilt summaries for %s lynchings." % count
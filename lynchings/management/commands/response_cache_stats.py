@@ -0,0 +1,40 @@
+"""
+Reports how well the site-wide response cache is working: the number of
+requests served from the cache (hits) and rendered (misses) since the
+counts were last reset, and the current data generation.
+
+Usage::
+
+    $ ./manage.py response_cache_stats
+    $ ./manage.py response_cache_stats --reset
+
+"""
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from georgia_lynchings.lynchings.responsecache import get_stats, reset_stats
+
+class Command(NoArgsCommand):
+    help = "Report the hit rate of the site-wide response cache."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--reset',
+            action='store_true',
+            dest='reset',
+            default=False,
+            help='Reset the hit and miss counts after reporting them.'),
+    )
+
+    def handle_noargs(self, **options):
+        stats = get_stats()
+        print "Data generation: %s" % stats['generation']
+        print "Hits: %s" % stats['hits']
+        print "Misses: %s" % stats['misses']
+        if stats['hit_rate'] is None:
+            print "Hit rate: no requests"
+        else:
+            print "Hit rate: %.1f%%" % (stats['hit_rate'] * 100)
+        if options['reset']:
+            reset_stats()
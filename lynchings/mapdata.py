@@ -0,0 +1,275 @@
+"""
+Lynchings on the map, by bounding box and time window.
+
+Lynchings are placed on the map at the center of their county, so the
+points are indexed by county: a :class:`SpatialGrid` of the counties with
+lynchings finds those inside a bounding box, and each county's lynchings
+are kept in date order so a time window is found by bisection.  The index
+is built from the entries of the precomputed timemap feed (see
+:mod:`georgia_lynchings.lynchings.timemap`), which it shares the mapping
+rules with, and kept in the Django cache until the feed changes.
+
+At low zoom levels nearby counties are clustered on the server, so the
+map receives one marker per cluster with a count rather than every
+lynching.  The timemap can likewise be given one marker for each county
+and year or decade (see :func:`cluster_by_period`).
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import groupby
+import math
+
+from django.core.cache import cache
+
+MAP_INDEX_CACHE_KEY = 'lynchings:map_index'
+# memcached will not keep anything for longer than 30 days.
+MAP_INDEX_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Size in degrees of the cells of the county index.  Georgia spans about
+# five degrees each way and its counties are a few tenths of a degree
+# across.
+GRID_CELL_SIZE = 0.5
+
+# Zoom levels of the map, as used by Google Maps.
+MIN_ZOOM = 0
+MAX_ZOOM = 21
+
+# Counties are clustered below this zoom level (as used by Google Maps,
+# where the whole world is 256 pixels across at zoom 0) ...
+CLUSTER_MAX_ZOOM = 9
+# ... with counties about this many pixels apart or less in a cluster.
+CLUSTER_CELL_PIXELS = 64
+
+# Periods the timemap clusters can cover, with their length in years.
+CLUSTER_PERIODS = {
+    'year': 1,
+    'decade': 10,
+}
+
+
+class SpatialGrid(object):
+    """
+    Spatial index of points on a fixed grid.  Each item is filed under the
+    cell its point falls in, so finding the items in a bounding box only
+    looks at the cells the box overlaps.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_size)),
+                int(math.floor(lon / self.cell_size)))
+
+    def add(self, lat, lon, item):
+        self.cells.setdefault(self._cell(lat, lon), []).append((lat, lon, item))
+
+    def within(self, south, west, north, east):
+        """Yields the items with points inside the bounding box."""
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            # a large box covers more cells than are in use
+            cells = [points for (row, col), points in self.cells.items()
+                     if min_row <= row <= max_row and min_col <= col <= max_col]
+        else:
+            cells = [self.cells.get((row, col), [])
+                     for row in xrange(min_row, max_row + 1)
+                     for col in xrange(min_col, max_col + 1)]
+        for points in cells:
+            for lat, lon, item in points:
+                if south <= lat <= north and west <= lon <= east:
+                    yield item
+
+
+def map_point(entry):
+    """A point on the map for a timemap feed entry."""
+    return {
+        'title': entry['title'],
+        'date': entry['start'],
+        'county': entry['options'].get('county'),
+        'alleged_crime': entry['options'].get('alleged_crime'),
+        'detail_link': entry['options']['detail_link'],
+        'lat': entry['point']['lat'],
+        'lon': entry['point']['lon'],
+    }
+
+def build_map_index():
+    """
+    Builds the index from the timemap feed and stores it in the cache.  The
+    index is a dict with the ``grid`` of counties, each a dict with its
+    ``name``, ``lat`` and ``lon`` and its ``points`` and their ``dates``
+    in date order.
+    """
+    from georgia_lynchings.lynchings.timemap import get_timemap_feed
+    counties = {}
+    for entry in get_timemap_feed()['entries'].values():
+        point = map_point(entry)
+        if point['lat'] is None or point['lon'] is None:
+            # counties without a recorded center can't be placed
+            continue
+        key = (point['county'], point['lat'], point['lon'])
+        county = counties.setdefault(key, {
+            'name': point['county'],
+            'lat': point['lat'],
+            'lon': point['lon'],
+            'points': [],
+        })
+        county['points'].append(point)
+
+    grid = SpatialGrid()
+    for county in counties.values():
+        county['points'].sort(key=lambda point: (point['date'], point['detail_link']))
+        county['dates'] = [point['date'] for point in county['points']]
+        grid.add(county['lat'], county['lon'], county)
+    index = {'grid': grid}
+    cache.set(MAP_INDEX_CACHE_KEY, index, MAP_INDEX_CACHE_TIMEOUT)
+    return index
+
+def get_map_index():
+    """Returns the cached map index, building it first if needed."""
+    index = cache.get(MAP_INDEX_CACHE_KEY)
+    if index is None:
+        index = build_map_index()
+    return index
+
+def clear_map_index():
+    """Removes the index from the cache so it is rebuilt when next used."""
+    cache.delete(MAP_INDEX_CACHE_KEY)
+
+def find_points(bbox=None, start=None, end=None, county_name=None):
+    """
+    Returns a list of (county, points) for the counties inside a bounding
+    box with lynchings in a time window, with the points in date order.
+
+    :param bbox:  (south, west, north, east) in degrees, or None for
+        everywhere.
+    :param start:  Earliest date as a YYYY-MM-DD string, or None.
+    :param end:  Latest date as a YYYY-MM-DD string, or None.
+    :param county_name:  Name of the only county to include, or None.
+    """
+    grid = get_map_index()['grid']
+    if bbox is None:
+        counties = grid.within(-90, -180, 90, 180)
+    else:
+        counties = grid.within(*bbox)
+    results = []
+    for county in counties:
+        if county_name is not None and county['name'] != county_name:
+            continue
+        first = bisect_left(county['dates'], start) if start else 0
+        last = bisect_right(county['dates'], end) if end else len(county['dates'])
+        if first < last:
+            results.append((county, county['points'][first:last]))
+    results.sort(key=lambda result: result[0]['name'])
+    return results
+
+def parse_bbox(value):
+    """
+    Parses a bounding box given as ``south,west,north,east`` in degrees.
+    Raises ValueError if it isn't valid.
+    """
+    try:
+        south, west, north, east = [float(part) for part in value.split(',')]
+    except ValueError:
+        raise ValueError('Invalid bounding box %r.' % value)
+    if south > north or west > east:
+        raise ValueError('Invalid bounding box %r.' % value)
+    return south, west, north, east
+
+def parse_date_bound(value, latest=False):
+    """
+    Parses the start or end of a time window, given as YYYY-MM-DD or as a
+    year, into a YYYY-MM-DD string.  A year is taken as its first day, or
+    its last if latest is true.  Raises ValueError if it isn't valid.
+    """
+    try:
+        if len(value) == 4:
+            date = datetime.strptime(value, '%Y').date()
+            if latest:
+                date = date.replace(month=12, day=31)
+        else:
+            date = datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Invalid date %r.' % value)
+    # strftime can't reliably do dates before 1900
+    return '%04d-%02d-%02d' % (date.year, date.month, date.day)
+
+def parse_zoom(value):
+    """
+    Parses a map zoom level, from :data:`MIN_ZOOM` to :data:`MAX_ZOOM`.
+    Raises ValueError if it isn't valid.
+    """
+    try:
+        zoom = int(value)
+    except ValueError:
+        raise ValueError('Invalid zoom %r.' % value)
+    if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+        raise ValueError('Invalid zoom %r.' % value)
+    return zoom
+
+def cluster_cell_size(zoom):
+    """Size in degrees of the clusters at a zoom level."""
+    return 360.0 / (256 * 2 ** zoom) * CLUSTER_CELL_PIXELS
+
+def cluster(results, zoom):
+    """
+    Groups the results of :func:`find_points` into clusters of nearby
+    counties.  Each cluster is a dict with the ``count`` of lynchings, the
+    ``lat`` and ``lon`` of their center, the ``bounds`` of the counties in
+    it as [south, west, north, east] and the names of the ``counties``.
+    """
+    # Counties join the cluster of the first county with more lynchings
+    # within a cell's size of them, rather than the cell of a fixed grid
+    # they fall in, so that neighbors aren't split by the grid lines.
+    size = cluster_cell_size(zoom)
+    seeds = []
+    for county, points in sorted(results, key=lambda result: -len(result[1])):
+        for seed, members in seeds:
+            if abs(seed['lat'] - county['lat']) <= size and \
+                    abs(seed['lon'] - county['lon']) <= size:
+                members.append((county, len(points)))
+                break
+        else:
+            seeds.append((county, [(county, len(points))]))
+
+    clusters = []
+    for seed, members in seeds:
+        count = sum(n for county, n in members)
+        lats = [county['lat'] for county, n in members]
+        lons = [county['lon'] for county, n in members]
+        clusters.append({
+            'count': count,
+            'lat': sum(county['lat'] * n for county, n in members) / count,
+            'lon': sum(county['lon'] * n for county, n in members) / count,
+            'bounds': [min(lats), min(lons), max(lats), max(lons)],
+            'counties': sorted(county['name'] for county, n in members),
+        })
+    clusters.sort(key=lambda cluster: (-cluster['count'], cluster['counties']))
+    return clusters
+
+def cluster_by_period(results, period):
+    """
+    Groups the results of :func:`find_points` by county and period, one of
+    :data:`CLUSTER_PERIODS`.  Each cluster is a dict with the ``county``
+    name and its ``lat`` and ``lon``, the ``first_year`` and ``last_year``
+    of the period and the ``count`` of lynchings in it.  Clusters are in
+    order of county and then period.
+    """
+    years = CLUSTER_PERIODS[period]
+    clusters = []
+    for county, points in results:
+        # the points are in date order, so each period's are together
+        first_years = groupby(int(point['date'][:4]) // years * years for point in points)
+        for first_year, group in first_years:
+            clusters.append({
+                'county': county['name'],
+                'lat': county['lat'],
+                'lon': county['lon'],
+                'first_year': first_year,
+                'last_year': first_year + years - 1,
+                'count': sum(1 for point in group),
+            })
+    return clusters
@@ -1,8 +1,29 @@
+from contextlib import contextmanager
+from functools import wraps
+
 from django.db import models
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, \
+    m2m_changed
+from django.dispatch import receiver
 from django.utils.encoding import smart_str
 
 from georgia_lynchings.articles.models import Article
 from georgia_lynchings.demographics.models import County
+from georgia_lynchings.lynchings import responsecache
+
+def memoized_property(method):
+    """
+    A read only property computed once per instance and kept in the
+    instance's ``_memoized`` dict until that is cleared.
+    """
+    name = method.__name__
+    @wraps(method)
+    def getter(self):
+        memoized = self.__dict__.setdefault('_memoized', {})
+        if name not in memoized:
+            memoized[name] = method(self)
+        return memoized[name]
+    return property(getter)
 
 # Tuples and classes use for controlled vocab and choices
 GENDER_CHOICES = (
@@ -99,6 +120,28 @@ class Story(models.Model):
     class Meta:
         verbose_name_plural = "stories"
 
+class LynchingQuerySet(models.query.QuerySet):
+    """
+    QuerySet for :class:`Lynching` with helpers for bulk loading related data.
+    """
+
+    def with_summary(self):
+        """
+        Loads the victims along with their counties, races and accusations for
+        every lynching in the result in a fixed number of queries, so the
+        derived properties used to describe a lynching don't query per row.
+        """
+        return self.prefetch_related('victim_set__county', 'victim_set__race',
+                                     'victim_set__accusation')
+
+class LynchingManager(models.Manager):
+
+    def get_query_set(self):
+        return LynchingQuerySet(self.model, using=self._db)
+
+    def with_summary(self):
+        return self.get_query_set().with_summary()
+
 class Lynching(models.Model):
     """
     Class to represent a connected sequence of events for an overall lynching.
@@ -113,35 +156,61 @@ class Lynching(models.Model):
 
     articles = models.ManyToManyField(Article, help_text="Related Documents and Files")
 
+    objects = LynchingManager()
+
     @models.permalink
     def get_absolute_url(self):
         return ('lynchings:lynching_detail', [self.id])
 
-    @property
+    # The victims and the properties derived from them are loaded once per
+    # instance.  Load a list of lynchings with LynchingQuerySet.with_summary
+    # to fetch the victims of all of them at once.
+
+    @memoized_property
+    def victims(self):
+        """
+        List of the victims of the lynching.
+        """
+        victims = list(self.victim_set.all())
+        # so that changes to the victims can clear the memoized properties
+        for victim in victims:
+            victim.lynching = self
+        return victims
+
+    def clear_memoized(self):
+        """
+        Drops the victims and derived properties loaded for this instance,
+        including victims loaded by :meth:`LynchingQuerySet.with_summary`, so
+        they are loaded again when next used.
+        """
+        self.__dict__.pop('_memoized', None)
+        getattr(self, '_prefetched_objects_cache', {}).clear()
+
+    @memoized_property
     def pretty_string(self):
         """
         Returns a more descriptive string for the story.
         """
         string_parts = [u'Lynching of',]
-        string_parts.append(u", ".join([u"%s" % victim for victim in self.victim_set.all()]))
-        date_set = set([u"%s" % victim.date.year for victim in self.victim_set.all() if victim.date])
+        string_parts.append(u", ".join([u"%s" % victim for victim in self.victims]))
+        date_set = set([u"%s" % victim.date.year for victim in self.victims if victim.date])
         if date_set:
             string_parts.append(u"in %s" % ", ".join(date_set))
         return u" ".join(string_parts)
 
-    @property
+    @memoized_property
     def county_list(self):
         """
         Convienence method to generate a list of all counties.
         """
-        return list(set([victim.county for victim in self.victim_set.all()]))
+        return list(set([victim.county for victim in self.victims]))
 
-    @property
+    @memoized_property
     def year(self):
         """
         Best determination of date of lynching.
         """
-        year_list = sorted([victim.date.year for victim in self.victim_set.all() if victim.date])
+        year_list = sorted([victim.date.year for victim in self.victims if victim.date])
         if year_list:
             return year_list[-1] # return the highest date
         return None
@@ -194,4 +263,239 @@ class Victim(models.Model):
             return self.pretty_name
         return u'%s' % self.name
     def __str__(self):
-        return smart_str(self.__unicode__())
\ No newline at end of file
+        return smart_str(self.__unicode__())
+
+class LynchingSummary(models.Model):
+    """
+    Denormalized description of a :class:`Lynching` and its victims so list
+    displays and data feeds can be rendered from a single table.  Rows are
+    kept current by the signal handlers below and can be rebuilt from scratch
+    with the ``rebuild_summaries`` management command.
+    """
+    help = {
+        'display': 'Descriptive string for the lynching.',
+        'date': 'Date of the first victim with a known date.',
+        'county': 'County of the first victim with a known county.',
+        'accusation_labels': 'Labels of all accusations, seperated by semicolons.',
+    }
+    lynching = models.OneToOneField(Lynching, related_name='summary')
+    display = models.TextField(help_text=help['display'])
+    date = models.DateField(null=True, blank=True, help_text=help['date'])
+    earliest_year = models.PositiveIntegerField(null=True, blank=True)
+    latest_year = models.PositiveIntegerField(null=True, blank=True)
+    county = models.ForeignKey(County, null=True, blank=True, on_delete=models.SET_NULL,
+                               help_text=help['county'])
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    accusation_labels = models.TextField(blank=True, help_text=help['accusation_labels'])
+    victim_count = models.PositiveIntegerField(default=0)
+
+    LABEL_SEPARATOR = u'; '
+    # Keeps each bulk insert under the sqlite limits on query parameters.
+    BULK_BATCH_SIZE = 50
+
+    @models.permalink
+    def get_absolute_url(self):
+        return ('lynchings:lynching_detail', [self.lynching_id])
+
+    @property
+    def accusation_list(self):
+        """List of the labels of all accusations made against the victims."""
+        if not self.accusation_labels:
+            return []
+        return self.accusation_labels.split(self.LABEL_SEPARATOR)
+
+    @classmethod
+    def for_lynching(cls, lynching):
+        """
+        Returns a new, unsaved summary of a lynching.  Pass a lynching loaded
+        with :meth:`LynchingQuerySet.with_summary` to avoid per victim queries.
+        """
+        victims = lynching.victims
+        dates = [victim.date for victim in victims if victim.date]
+        years = [date.year for date in dates]
+        counties = [victim.county for victim in victims if victim.county]
+        labels = []
+        for victim in victims:
+            for accusation in victim.accusation.all():
+                if accusation.label not in labels:
+                    labels.append(accusation.label)
+        county = counties[0] if counties else None
+        return cls(
+            lynching=lynching,
+            display=lynching.pretty_string,
+            date=dates[0] if dates else None,
+            earliest_year=min(years) if years else None,
+            latest_year=max(years) if years else None,
+            county=county,
+            latitude=county.latitude if county else None,
+            longitude=county.longitude if county else None,
+            accusation_labels=cls.LABEL_SEPARATOR.join(labels),
+            victim_count=len(victims),
+        )
+
+    @classmethod
+    def _bulk_create(cls, summaries):
+        for start in range(0, len(summaries), cls.BULK_BATCH_SIZE):
+            cls.objects.bulk_create(summaries[start:start + cls.BULK_BATCH_SIZE])
+
+    @classmethod
+    def refresh(cls, lynching_ids):
+        """
+        Recomputes the summaries for the lynchings with the given ids.
+
+        :param lynching_ids:  Iterable of lynching ids.
+        """
+        lynching_ids = set(lynching_ids)
+        if not lynching_ids:
+            return
+        lynchings = Lynching.objects.filter(id__in=lynching_ids).with_summary()
+        summaries = [cls.for_lynching(lynching) for lynching in lynchings]
+        cls.objects.filter(lynching__in=lynching_ids).delete()
+        cls._bulk_create(summaries)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Replaces all summaries with ones computed from the current data.
+        Returns the number of summaries created.
+        """
+        summaries = [cls.for_lynching(lynching) for lynching in Lynching.objects.with_summary()]
+        with responsecache.suspended_invalidation():
+            cls.objects.all().delete()
+        cls._bulk_create(summaries)
+        return len(summaries)
+
+    # String Methods
+    def __unicode__(self):
+        return u'%s' % self.display
+    def __str__(self):
+        return smart_str(self.__unicode__())
+
+    class Meta:
+        ordering = ['lynching']
+        verbose_name_plural = "lynching summaries"
+
+# Signal handlers to keep the lynching summaries, the precomputed timemap
+# feed and the site counts current.
+
+_derived_data_suspended = False
+
+def rebuild_derived_data():
+    """
+    Rebuilds the lynching summaries and the timemap feed from scratch and
+    drops the cached site counts.
+    """
+    from georgia_lynchings.lynchings.stats import clear_site_stats
+    from georgia_lynchings.lynchings.timemap import build_timemap_feed
+    LynchingSummary.rebuild()
+    build_timemap_feed()
+    clear_site_stats()
+
+@contextmanager
+def suspended_derived_data():
+    """
+    Context manager for bulk data loads.  The signal handlers below skip
+    their per-row updates while it is active and all derived data is rebuilt
+    once when the block completes without error.  Cached pages are
+    invalidated once at the end too.
+    """
+    global _derived_data_suspended
+    with responsecache.suspended_invalidation():
+        _derived_data_suspended = True
+        try:
+            yield
+        finally:
+            _derived_data_suspended = False
+        rebuild_derived_data()
+
+def _refresh_derived_data(lynching_ids):
+    """
+    Recomputes summaries and timemap entries for the given lynchings and
+    drops the cached site counts.
+    """
+    from georgia_lynchings.lynchings.stats import clear_site_stats
+    from georgia_lynchings.lynchings.timemap import update_timemap_feed
+    if _derived_data_suspended:
+        return
+    lynching_ids = set(lynching_ids)
+    LynchingSummary.refresh(lynching_ids)
+    update_timemap_feed(lynching_ids)
+    clear_site_stats()
+
+@receiver(post_save, sender=Lynching)
+@receiver(post_delete, sender=Lynching)
+def lynching_changed(sender, instance, **kwargs):
+    _refresh_derived_data([instance.pk])
+
+@receiver(pre_save, sender=Victim)
+def victim_saving(sender, instance, **kwargs):
+    # a victim moved to another lynching no longer belongs in the old one's
+    # summary, so note which it was
+    if instance.pk and not _derived_data_suspended:
+        instance._previous_lynching_ids = list(Victim.objects.filter(pk=instance.pk) \
+            .exclude(lynching=None).values_list('lynching', flat=True))
+
+@receiver(post_save, sender=Victim)
+@receiver(post_delete, sender=Victim)
+def victim_changed(sender, instance, **kwargs):
+    # the lynching the victim was loaded with, if any, describes them again
+    lynching = getattr(instance, '_lynching_cache', None)
+    if lynching is not None:
+        lynching.clear_memoized()
+    lynching_ids = getattr(instance, '_previous_lynching_ids', [])
+    instance._previous_lynching_ids = []
+    if instance.lynching_id:
+        lynching_ids.append(instance.lynching_id)
+    _refresh_derived_data(lynching_ids)
+
+@receiver(m2m_changed, sender=Victim.accusation.through)
+def victim_accusations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_') and instance.lynching_id:
+            _refresh_derived_data([instance.lynching_id])
+    elif action == 'pre_clear' and not _derived_data_suspended:
+        # clear() doesn't report which victims it removes, so note them first.
+        instance._cleared_lynching_ids = list(Lynching.objects \
+            .filter(victim__accusation=instance).values_list('id', flat=True))
+    elif action == 'post_clear':
+        _refresh_derived_data(getattr(instance, '_cleared_lynching_ids', []))
+    elif action.startswith('post_'):
+        _refresh_derived_data(Victim.objects.filter(pk__in=pk_set, lynching__isnull=False) \
+                               .values_list('lynching', flat=True))
+
+@receiver(post_save, sender=Accusation)
+def accusation_changed(sender, instance, **kwargs):
+    _refresh_derived_data(Lynching.objects.filter(victim__accusation=instance) \
+                            .values_list('id', flat=True))
+
+@receiver(pre_delete, sender=Accusation)
+def accusation_deleting(sender, instance, **kwargs):
+    # deleting removes the links to victims without m2m_changed, and they
+    # are gone by post_delete, so note the lynchings first.
+    if not _derived_data_suspended:
+        instance._deleted_lynching_ids = list(Lynching.objects \
+            .filter(victim__accusation=instance).values_list('id', flat=True))
+
+@receiver(post_delete, sender=Accusation)
+def accusation_deleted(sender, instance, **kwargs):
+    _refresh_derived_data(getattr(instance, '_deleted_lynching_ids', []))
+
+@receiver(post_save, sender=Race)
+def race_changed(sender, instance, **kwargs):
+    _refresh_derived_data(Lynching.objects.filter(victim__race=instance) \
+                            .values_list('id', flat=True))
+
+@receiver(post_save, sender=County)
+def county_changed(sender, instance, **kwargs):
+    _refresh_derived_data(Lynching.objects.filter(victim__county=instance) \
+                            .values_list('id', flat=True))
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def site_data_changed(sender, **kwargs):
+    """Invalidates the cached pages when any of the site data changes."""
+    if sender._meta.app_label in responsecache.SITE_DATA_APPS and \
+            kwargs.get('action', 'post_').startswith('post_'):
+        responsecache.data_changed()
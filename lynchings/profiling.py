@@ -0,0 +1,287 @@
+"""
+Query and latency profiling of views.
+
+Most slow pages on the site come from views that run a query for every
+object they list.  :class:`ProfilingMiddleware` records, for each request,
+the number of SQL queries, the time spent in them, the queries that were
+repeated with different parameters (the mark of one query per object) and
+the time spent rendering templates.  With ``DEBUG`` on these are added to
+the response as headers; they are also logged to the
+``georgia_lynchings.lynchings.profiling`` logger and totalled by view for
+the report at ``lynchings:profiling_report``.
+
+Each view can be given a budget, the most queries it may run, in the
+``QUERY_BUDGETS`` setting.  Requests over budget are logged as warnings,
+and the tests check the budgeted views with :func:`profile`, so changes
+that add queries per object fail the test suite.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.urlresolvers import resolve, Resolver404
+from django.core.signals import request_started
+from django.db import connection, reset_queries
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the headers added to responses when DEBUG is on.
+PROFILE_HEADER_PREFIX = 'X-Profile-'
+
+# Name used in the report for requests that don't resolve to a view.
+UNRESOLVED_VIEW = '(unresolved)'
+
+# Profiles being recorded in the current thread, innermost last.
+_local = threading.local()
+
+# Totals by view name for the requests profiled in this process.
+_view_stats = defaultdict(lambda: defaultdict(float))
+_view_stats_lock = threading.Lock()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+
+def fingerprint(sql):
+    """
+    Reduces a query to its shape by replacing its literal values with
+    ``?``, so that the queries run for each object in a list are the same.
+    """
+    sql = _LITERALS.sub('?', sql)
+    return _LISTS.sub('(?)', sql)
+
+def enabled():
+    """Whether requests are profiled, from the ``QUERY_PROFILING`` setting."""
+    return getattr(settings, 'QUERY_PROFILING', settings.DEBUG)
+
+def query_budget(view_name):
+    """The most queries the named view may run, or None if unlimited."""
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+
+def view_name_for_path(path):
+    """The namespaced url name of the view for a path, as for reverse."""
+    try:
+        return resolve(path).view_name
+    except Resolver404:
+        return UNRESOLVED_VIEW
+
+
+class Profile(object):
+    """
+    The queries and timings of a block of code, usually a request.  Set
+    ``view_name`` to compare it with the view's query budget.
+    """
+
+    def __init__(self, view_name=None):
+        self.view_name = view_name
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.duplicates = []
+        self._template_depth = 0
+        self._first_query = len(connection.queries)
+        self._start = time.time()
+
+    def finish(self):
+        self.total_time = time.time() - self._start
+        queries = connection.queries[self._first_query:]
+        self.query_count = len(queries)
+        self.sql_time = sum(float(query['time']) for query in queries)
+        counts = defaultdict(int)
+        for query in queries:
+            counts[fingerprint(query['sql'])] += 1
+        self.duplicates = sorted([(count, sql) for sql, count in counts.items() if count > 1],
+                                 reverse=True)
+
+    @property
+    def duplicate_count(self):
+        """The number of queries that repeated an earlier one's shape."""
+        return sum(count - 1 for count, sql in self.duplicates)
+
+    @property
+    def budget(self):
+        return query_budget(self.view_name)
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.query_count > self.budget
+
+    def headers(self):
+        """Response headers describing the profile."""
+        headers = {
+            'Queries': self.query_count,
+            'Duplicate-Queries': self.duplicate_count,
+            'SQL-Time': '%.1fms' % (self.sql_time * 1000),
+            'Template-Time': '%.1fms' % (self.template_time * 1000),
+            'Total-Time': '%.1fms' % (self.total_time * 1000),
+        }
+        if self.budget is not None:
+            headers['Query-Budget'] = self.budget
+        return dict((PROFILE_HEADER_PREFIX + name, str(value))
+                    for name, value in headers.items())
+
+    def summary(self):
+        return '%s: %d queries (%d duplicate) in %.1fms, templates %.1fms, total %.1fms' % \
+            (self.view_name, self.query_count, self.duplicate_count,
+             self.sql_time * 1000, self.template_time * 1000, self.total_time * 1000)
+
+
+def _profiled_render(self, context):
+    # only the outermost template is timed, as included templates are
+    # rendered within it
+    profiles = getattr(_local, 'profiles', [])
+    for active in profiles:
+        active._template_depth += 1
+    start = time.time()
+    try:
+        return _original_render(self, context)
+    finally:
+        elapsed = time.time() - start
+        for active in profiles:
+            active._template_depth -= 1
+            if not active._template_depth:
+                active.template_time += elapsed
+
+_original_render = Template.render
+
+def _instrument_templates():
+    if getattr(Template.render, 'im_func', None) is not _profiled_render:
+        Template.render = _profiled_render
+
+def start_profile(view_name=None):
+    """
+    Starts recording the queries and template rendering in this thread.
+    Queries are recorded even when DEBUG is off, until the profile is
+    passed to :func:`end_profile`.
+    """
+    _instrument_templates()
+    profiles = _local.__dict__.setdefault('profiles', [])
+    if not profiles:
+        _local.debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+    profile = Profile(view_name)
+    profiles.append(profile)
+    return profile
+
+def end_profile(profile):
+    profile.finish()
+    _local.profiles.remove(profile)
+    if not _local.profiles:
+        connection.use_debug_cursor = _local.debug_cursor
+    return profile
+
+@contextmanager
+def profile(view_name=None):
+    """
+    Profiles the enclosed block, as in the tests::
+
+        with profile('lynchings:lynching_list') as p:
+            self.client.get(reverse('lynchings:lynching_list'))
+        self.assertFalse(p.over_budget, p.summary())
+
+    The results are available on the yielded :class:`Profile` at the end of
+    the block.  Since the queries of each request would be cleared when the
+    next one starts, they aren't cleared in any thread until the block ends,
+    so this is for tests and commands rather than the running site.
+    """
+    # as assertNumQueries, so that the queries of requests made with the
+    # test client are all kept
+    _local.blocks = getattr(_local, 'blocks', 0) + 1
+    if _local.blocks == 1:
+        request_started.disconnect(reset_queries)
+    current = start_profile(view_name)
+    try:
+        yield current
+    finally:
+        end_profile(current)
+        _local.blocks -= 1
+        if not _local.blocks:
+            request_started.connect(reset_queries)
+
+def record(profile):
+    """Adds a request's profile to the totals for its view."""
+    with _view_stats_lock:
+        stats = _view_stats[profile.view_name]
+        stats['requests'] += 1
+        stats['queries'] += profile.query_count
+        stats['max_queries'] = max(stats['max_queries'], profile.query_count)
+        stats['duplicate_queries'] += profile.duplicate_count
+        stats['over_budget'] += profile.over_budget
+        stats['sql_time'] += profile.sql_time
+        stats['template_time'] += profile.template_time
+        stats['total_time'] += profile.total_time
+
+def report():
+    """
+    Returns a dict for each view profiled in this process, with the number
+    of requests, the mean and maximum queries per request, the mean times
+    in seconds and the number of requests that were over budget, ordered
+    by the total number of queries.
+    """
+    with _view_stats_lock:
+        views = [(view_name, dict(stats)) for view_name, stats in _view_stats.items()]
+    rows = []
+    for view_name, stats in views:
+        requests = stats['requests']
+        rows.append({
+            'view': view_name,
+            'requests': int(requests),
+            'total_queries': int(stats['queries']),
+            'mean_queries': stats['queries'] / requests,
+            'max_queries': int(stats['max_queries']),
+            'mean_duplicate_queries': stats['duplicate_queries'] / requests,
+            'mean_sql_time': stats['sql_time'] / requests,
+            'mean_template_time': stats['template_time'] / requests,
+            'mean_total_time': stats['total_time'] / requests,
+            'query_budget': query_budget(view_name),
+            'over_budget': int(stats['over_budget']),
+        })
+    rows.sort(key=lambda row: row['total_queries'], reverse=True)
+    return rows
+
+def reset_report():
+    with _view_stats_lock:
+        _view_stats.clear()
+
+
+class ProfilingMiddleware(object):
+    """
+    Profiles every request, when the ``QUERY_PROFILING`` setting is on
+    (it defaults to ``DEBUG``).  It should be first in
+    ``MIDDLEWARE_CLASSES``, so that the time and queries of the other
+    middleware, such as the response cache, are included.
+    """
+
+    def __init__(self):
+        if not enabled():
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        request._profile = start_profile()
+
+    def process_response(self, request, response):
+        current = getattr(request, '_profile', None)
+        if current is None:
+            return response
+        request._profile = None
+        end_profile(current)
+        current.view_name = view_name_for_path(request.path_info)
+        record(current)
+
+        if current.over_budget:
+            logger.warning('Over query budget of %d: %s', current.budget, current.summary())
+            for count, sql in current.duplicates[:5]:
+                logger.warning('  %d x %s', count, sql)
+        else:
+            logger.debug(current.summary())
+        if settings.DEBUG:
+            for header, value in current.headers().items():
+                response[header] = value
+        return response
@@ -0,0 +1,229 @@
+"""
+Site-wide cache of rendered pages.
+
+The public pages only change when data is imported or edited, so instead of
+expiring cached pages after a set time, each page is cached under the
+current *data generation*, a counter kept in the cache with the pages.  Anything
+that changes the site data bumps the counter, which invalidates every
+cached page at once: the import commands call
+:func:`bump_data_generation` when they finish, and saves and deletes of the
+site's models (from the admin, for instance) call :func:`data_changed`
+through the signal handlers in :mod:`georgia_lynchings.lynchings.models`.
+Bulk changes are made within :func:`suspended_invalidation`, so that the
+counter is bumped once rather than for every row.
+
+:class:`ResponseCacheMiddleware` serves the cached pages.  It counts hits
+and misses in the cache too; see the ``response_cache_stats`` command.
+
+Pages are kept in the ``responses`` cache if there is one in ``CACHES``,
+so that the many pages that can be cached don't push the precomputed data
+out of the default cache, and in the default cache otherwise.
+"""
+
+from contextlib import contextmanager
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, get_cache
+from django.http import HttpResponse, HttpResponseNotModified
+
+# Alias in CACHES of the cache for pages.
+RESPONSE_CACHE_ALIAS = 'responses'
+
+GENERATION_CACHE_KEY = 'responsecache:generation'
+STATS_CACHE_KEYS = {
+    'hits': 'responsecache:hits',
+    'misses': 'responsecache:misses',
+}
+# memcached will not keep anything for longer than 30 days.
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Apps whose models hold the data shown on the site.
+SITE_DATA_APPS = ('articles', 'demographics', 'lynchings', 'reldata', 'simplepages')
+
+# Header added to responses to show whether they came from the cache.
+CACHE_STATUS_HEADER = 'X-Response-Cache'
+
+# Hits and misses are counted in each process and added to the totals in
+# the cache every STATS_FLUSH_INTERVAL requests, so that counting doesn't
+# double the cache traffic of a hit.
+STATS_FLUSH_INTERVAL = 100
+_unflushed_stats = {'hits': 0, 'misses': 0}
+
+if RESPONSE_CACHE_ALIAS in settings.CACHES:
+    response_cache = get_cache(RESPONSE_CACHE_ALIAS)
+else:
+    response_cache = cache
+
+def data_generation():
+    """
+    Returns the current data generation.  If the counter isn't in the cache
+    it starts from the current time rather than from 1, so that pages cached
+    under a generation that has since been evicted can never be served
+    again.
+    """
+    generation = response_cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        response_cache.add(GENERATION_CACHE_KEY, int(time.time()), RESPONSE_CACHE_TIMEOUT)
+        generation = response_cache.get(GENERATION_CACHE_KEY, int(time.time()))
+    return generation
+
+def bump_data_generation():
+    """Starts a new data generation, invalidating all cached pages."""
+    try:
+        response_cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        # not in the cache: any new value will do
+        data_generation()
+
+# Set when site data is changed while handling a request.
+_changed = threading.local()
+
+def data_changed():
+    """
+    Called by the signal handlers when site data is saved or deleted.  The
+    generation is bumped straight away, and again by the middleware once the
+    request is finished, after its transaction has been committed, so that
+    pages can't be cached from the old data under the new generation in
+    between.
+    """
+    if getattr(_changed, 'suspended', 0):
+        _changed.deferred = True
+        return
+    bump_data_generation()
+    _changed.pending = True
+
+@contextmanager
+def suspended_invalidation():
+    """
+    Context manager for bulk changes.  :func:`data_changed` only notes the
+    changes made in the block, and is called once when it ends.
+    """
+    _changed.suspended = getattr(_changed, 'suspended', 0) + 1
+    try:
+        yield
+    finally:
+        _changed.suspended -= 1
+        if not _changed.suspended and getattr(_changed, 'deferred', False):
+            _changed.deferred = False
+            data_changed()
+
+def response_cache_key(request, generation):
+    """Cache key for a page, by full URL, in a data generation."""
+    url = hashlib.md5(request.build_absolute_uri()).hexdigest()
+    return 'responsecache:%s:%s' % (generation, url)
+
+def _count(stat):
+    _unflushed_stats[stat] += 1
+    if sum(_unflushed_stats.values()) >= STATS_FLUSH_INTERVAL:
+        flush_stats()
+
+def flush_stats():
+    """Adds the hits and misses counted in this process to the totals."""
+    for stat, count in _unflushed_stats.items():
+        if not count:
+            continue
+        try:
+            response_cache.incr(STATS_CACHE_KEYS[stat], count)
+        except ValueError:
+            response_cache.set(STATS_CACHE_KEYS[stat], count, RESPONSE_CACHE_TIMEOUT)
+        _unflushed_stats[stat] = 0
+
+def get_stats():
+    """
+    Returns a dict with the total ``hits`` and ``misses``, the ``hit_rate``
+    (None before any requests) and the current data ``generation``.
+    """
+    flush_stats()
+    totals = response_cache.get_many(STATS_CACHE_KEYS.values())
+    stats = dict((stat, totals.get(key, 0)) for stat, key in STATS_CACHE_KEYS.items())
+    requests = stats['hits'] + stats['misses']
+    stats['hit_rate'] = float(stats['hits']) / requests if requests else None
+    stats['generation'] = data_generation()
+    return stats
+
+def reset_stats():
+    """Sets the hit and miss counts back to zero."""
+    for stat in _unflushed_stats:
+        _unflushed_stats[stat] = 0
+    response_cache.delete_many(STATS_CACHE_KEYS.values())
+
+
+class ResponseCacheMiddleware(object):
+    """
+    Serves GET and HEAD requests for public pages from the cache, keyed by
+    URL and query string in the current data generation.
+
+    It should come right after the profiling middleware in
+    ``MIDDLEWARE_CLASSES`` and before the session, csrf and messages
+    middleware, so that pages are cached with the headers added by the
+    other middleware and responses that set cookies are seen (and not
+    cached).  Requests with a session or messages
+    cookie, as after logging in to the admin, are never served from the
+    cache, and only complete successful responses are cached: not streamed
+    responses like the data exports, and not responses marked private.
+    """
+
+    def process_request(self, request):
+        _changed.pending = False
+        request._response_cache_key = None
+        if not self.cacheable_request(request):
+            return None
+        key = response_cache_key(request, data_generation())
+        cached = response_cache.get(key)
+        if cached is None:
+            _count('misses')
+            request._response_cache_key = key
+            return None
+
+        _count('hits')
+        content, headers = cached
+        response = HttpResponse(content)
+        for header, value in headers:
+            response[header] = value
+        response[CACHE_STATUS_HEADER] = 'hit'
+        if self.not_modified(request, response):
+            return HttpResponseNotModified()
+        return response
+
+    def process_response(self, request, response):
+        if getattr(_changed, 'pending', False):
+            _changed.pending = False
+            bump_data_generation()
+            return response
+        key = getattr(request, '_response_cache_key', None)
+        if key is not None and self.cacheable_response(response):
+            response_cache.set(key, (response.content, response.items()), RESPONSE_CACHE_TIMEOUT)
+            response[CACHE_STATUS_HEADER] = 'miss'
+        return response
+
+    def cacheable_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        for cookie in (settings.SESSION_COOKIE_NAME, 'messages'):
+            if cookie in request.COOKIES:
+                return False
+        return True
+
+    def not_modified(self, request, response):
+        # as ConditionalGetMiddleware, since views that handle conditional
+        # requests themselves aren't called for cached pages
+        if response.has_header('ETag'):
+            return request.META.get('HTTP_IF_NONE_MATCH') == response['ETag']
+        if response.has_header('Last-Modified'):
+            return request.META.get('HTTP_IF_MODIFIED_SINCE') == response['Last-Modified']
+        return False
+
+    def cacheable_response(self, response):
+        if response.status_code != 200 or response.cookies:
+            return False
+        # iterator content is streamed, and shouldn't be read into memory
+        if getattr(response, '_base_content_is_iter', False):
+            return False
+        cache_control = response.get('Cache-Control', '')
+        for directive in ('private', 'no-cache', 'no-store'):
+            if directive in cache_control:
+                return False
+        return True
@@ -0,0 +1,46 @@
+"""
+Cached counts of the main types of data on the site, used for the front page.
+
+The counts only change when data is imported or edited, so they are
+computed once and kept in the Django cache until
+:func:`clear_site_stats` is called by the import commands or by the
+lynchings signal handlers.
+"""
+
+from django.core.cache import cache
+
+STATS_CACHE_KEY = 'lynchings:site_stats'
+# memcached will not keep anything for longer than 30 days.
+STATS_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+def compute_site_stats():
+    """
+    Counts lynchings, victims, counties with victims, accusations and
+    relations and stores the result in the cache.
+    """
+    from georgia_lynchings.demographics.models import County
+    from georgia_lynchings.lynchings.models import Lynching, Victim, Accusation
+    from georgia_lynchings.reldata.models import Relation
+    stats = {
+        'lynching': Lynching.objects.count(),
+        'victim': Victim.objects.count(),
+        'county': County.objects.filter(victim__isnull=False).distinct().count(),
+        'accusation': Accusation.objects.count(),
+        'relation': Relation.objects.count(),
+    }
+    cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+def get_site_stats():
+    """
+    Returns a dict of the site counts keyed by 'lynching', 'victim',
+    'county', 'accusation' and 'relation', computing them if needed.
+    """
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_site_stats()
+    return stats
+
+def clear_site_stats():
+    """Removes the cached counts so they are recomputed on the next request."""
+    cache.delete(STATS_CACHE_KEY)
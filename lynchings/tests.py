@@ -1,11 +1,23 @@
 from datetime import date
+from StringIO import StringIO
+import csv
+import json
+import os
+import sys
+import tempfile
 
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db.models import Count
 from django.test import TestCase
 from django.test.client import Client
 
 from georgia_lynchings.lynchings.models import Accusation, Race, \
-    County, Victim, Lynching
+    County, Victim, Lynching, LynchingSummary
+from georgia_lynchings.lynchings.export import victim_rows
+from georgia_lynchings.lynchings import responsecache
+from georgia_lynchings.lynchings.stats import get_site_stats, clear_site_stats
+from georgia_lynchings.lynchings.timemap import get_timemap_feed, clear_timemap_feed
 
 accusation1 = {'label': 'Test Crime'}
 race1 = {'label': "test race"}
@@ -90,6 +102,23 @@ class LynchingTest(TestCase):
         self.victim2.save()
         self.assertEqual(1923, self.lynching.year)
 
+    def test_memoized(self):
+        lynching = Lynching.objects.with_summary().get(pk=self.lynching.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(1893, lynching.year)
+            self.assertEqual(1, len(lynching.county_list))
+            self.assertTrue(lynching.pretty_string.startswith("Lynching of Test Victim"))
+
+        lynching = Lynching.objects.get(pk=self.lynching.pk)
+        values = (lynching.pretty_string, lynching.year, lynching.county_list)
+        with self.assertNumQueries(0):
+            self.assertEqual(values, (lynching.pretty_string, lynching.year, lynching.county_list))
+        # dropped when a victim is changed
+        victim = lynching.victims[0]
+        victim.name = "Renamed Victim"
+        victim.save()
+        self.assertTrue("Renamed Victim" in lynching.pretty_string)
+
 class VictimTest(TestCase):
 
     def setUp(self):
@@ -114,3 +143,808 @@ class VictimTest(TestCase):
         self.assertEqual("Test Name", self.victim.pretty_name)
 
 
+
+class TimemapDataTest(TestCase):
+
+    def setUp(self):
+        clear_timemap_feed()
+        county = County.objects.get(name="Decatur")
+        self.acc = Accusation(**accusation1)
+        self.acc.save()
+        self.lynching = Lynching(pca_id="22394")
+        self.lynching.save()
+        self.victim = Victim(lynching=self.lynching, county=county, **named_victim)
+        self.victim.save()
+        self.victim.accusation.add(self.acc)
+        # Lynching with no victims can't be placed on the map.
+        Lynching(pca_id="22395").save()
+
+    def tearDown(self):
+        clear_timemap_feed()
+
+    def test_timemap_data(self):
+        response = self.client.get(reverse('lynchings:timemap_data'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/json', response['Content-Type'])
+        data = json.loads(response.content)
+        self.assertEqual(1, len(data))
+        self.assertEqual("Lynching of Test Victim in 1893", data[0]['title'])
+        self.assertEqual("1893-02-18", data[0]['start'])
+        self.assertEqual("Decatur", data[0]['options']['county'])
+        self.assertEqual("Test Crime", data[0]['options']['alleged_crime'])
+
+    def test_conditional_get(self):
+        url = reverse('lynchings:timemap_data')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, response.status_code)
+
+    def test_conditional_get_validators(self):
+        # a conditional request only reads the etag, not the whole feed
+        from django.core.cache import cache
+        from georgia_lynchings.lynchings.timemap import FEED_CACHE_KEY
+        url = reverse('lynchings:timemap_data')
+        etag = self.client.get(url)['ETag']
+        responsecache.bump_data_generation()
+        cache.delete(FEED_CACHE_KEY)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(None, cache.get(FEED_CACHE_KEY))
+
+    def test_feed_updates(self):
+        etag = get_timemap_feed()['etag']
+        self.victim.date = date(1901, 5, 2)
+        self.victim.save()
+        feed = get_timemap_feed()
+        self.assertNotEqual(etag, feed['etag'])
+        self.assertEqual("1901-05-02", feed['entries'][self.lynching.id]['start'])
+
+        self.acc.label = "Other Crime"
+        self.acc.save()
+        entry = get_timemap_feed()['entries'][self.lynching.id]
+        self.assertEqual("Other Crime", entry['options']['alleged_crime'])
+
+        self.victim.delete()
+        self.assertFalse(self.lynching.id in get_timemap_feed()['entries'])
+
+class LynchingSummaryQueryTest(TestCase):
+
+    def setUp(self):
+        county = County.objects.get(name="Decatur")
+        acc = Accusation(**accusation1)
+        acc.save()
+        race = Race(**race1)
+        race.save()
+        for pca_id in range(1, 6):
+            lynching = Lynching(pca_id=pca_id)
+            lynching.save()
+            for victim_data in [named_victim, unnamed_victim]:
+                victim = Victim(lynching=lynching, county=county, race=race, **victim_data)
+                victim.save()
+                victim.accusation.add(acc)
+
+    def test_with_summary(self):
+        # lynchings, victims, counties, races and accusations
+        with self.assertNumQueries(5):
+            lynchings = list(Lynching.objects.with_summary())
+            for lynching in lynchings:
+                self.assertEqual("Lynching of Test Victim, Unknown test race Male in 1893",
+                                 lynching.pretty_string)
+                self.assertEqual(1893, lynching.year)
+                self.assertEqual(["Decatur"], [c.name for c in lynching.county_list])
+        self.assertEqual(5, len(lynchings))
+
+    def test_list_views(self):
+        county = County.objects.get(name="Decatur")
+        acc = Accusation.objects.get(label=accusation1['label'])
+        for url in [reverse('lynchings:lynching_list'),
+                    reverse('lynchings:county_detail', args=[county.id]),
+                    reverse('lynchings:lynching_list_by_accusation', args=[acc.id])]:
+            response = self.client.get(url)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(5, len(response.context['lynching_list']))
+
+class LynchingSummaryTest(TestCase):
+
+    def setUp(self):
+        self.county = County.objects.get(name="Decatur")
+        self.acc = Accusation(**accusation1)
+        self.acc.save()
+        self.lynching = Lynching(pca_id="22394")
+        self.lynching.save()
+        self.victim1 = Victim(lynching=self.lynching, county=self.county, **named_victim)
+        self.victim1.save()
+        self.victim2 = Victim(lynching=self.lynching, **unnamed_victim)
+        self.victim2.date = date(1895, 3, 1)
+        self.victim2.save()
+
+    def test_summary(self):
+        summary = LynchingSummary.objects.get(lynching=self.lynching)
+        self.assertEqual(self.lynching.pretty_string, summary.display)
+        self.assertEqual(self.lynching.pretty_string, "%s" % summary)
+        self.assertEqual(date(1893, 2, 18), summary.date)
+        self.assertEqual(1893, summary.earliest_year)
+        self.assertEqual(1895, summary.latest_year)
+        self.assertEqual(self.county, summary.county)
+        self.assertEqual(self.county.latitude, summary.latitude)
+        self.assertEqual(self.county.longitude, summary.longitude)
+        self.assertEqual(2, summary.victim_count)
+        self.assertEqual([], summary.accusation_list)
+        self.assertEqual(reverse('lynchings:lynching_detail', args=[self.lynching.id]),
+                         summary.get_absolute_url())
+
+    def test_signals(self):
+        self.victim1.accusation.add(self.acc)
+        summary = LynchingSummary.objects.get(lynching=self.lynching)
+        self.assertEqual(["Test Crime"], summary.accusation_list)
+
+        self.acc.victim_set.clear()
+        summary = LynchingSummary.objects.get(lynching=self.lynching)
+        self.assertEqual([], summary.accusation_list)
+
+        self.victim1.accusation.add(self.acc)
+        self.acc.delete()
+        summary = LynchingSummary.objects.get(lynching=self.lynching)
+        self.assertEqual([], summary.accusation_list)
+
+        # moving a victim to another lynching updates both
+        other = Lynching.objects.create(pca_id="22395")
+        self.victim1.lynching = other
+        self.victim1.save()
+        self.assertEqual(1, LynchingSummary.objects.get(lynching=self.lynching).victim_count)
+        self.assertEqual("Lynching of Test Victim in 1893",
+                         LynchingSummary.objects.get(lynching=other).display)
+        self.victim1.lynching = self.lynching
+        self.victim1.save()
+        self.assertEqual(0, LynchingSummary.objects.get(lynching=other).victim_count)
+        other.delete()
+
+        self.victim2.delete()
+        summary = LynchingSummary.objects.get(lynching=self.lynching)
+        self.assertEqual(1, summary.victim_count)
+        self.assertEqual("Lynching of Test Victim in 1893", summary.display)
+
+        self.lynching.delete()
+        self.assertEqual(0, LynchingSummary.objects.count())
+
+    def test_rebuild(self):
+        LynchingSummary.objects.all().delete()
+        self.assertEqual(1, LynchingSummary.rebuild())
+        summary = LynchingSummary.objects.get(lynching=self.lynching)
+        self.assertEqual(2, summary.victim_count)
+
+class SiteStatsTest(TestCase):
+
+    def setUp(self):
+        clear_site_stats()
+        county = County.objects.get(name="Decatur")
+        lynching = Lynching(pca_id="22394")
+        lynching.save()
+        for victim_data in [named_victim, unnamed_victim]:
+            Victim(lynching=lynching, county=county, **victim_data).save()
+
+    def tearDown(self):
+        clear_site_stats()
+
+    def test_index(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(200, response.status_code)
+        expected = {'lynching': 1, 'victim': 2, 'county': 1, 'accusation': 0, 'relation': 0}
+        self.assertEqual(expected, response.context['count'])
+        # render the page again rather than serving it from the response cache
+        responsecache.bump_data_generation()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+
+    def test_stats_data(self):
+        get_site_stats()
+        Accusation(**accusation1).save() # saving data clears the counts
+        response = self.client.get(reverse('lynchings:stats_data'))
+        self.assertEqual('application/json', response['Content-Type'])
+        data = json.loads(response.content)
+        self.assertEqual(1, data['lynching'])
+        self.assertEqual(1, data['accusation'])
+
+class ImportVictimsTest(TestCase):
+
+    rows = [
+        ['event_id', 'date', 'name', 'race', 'gender', 'reason', 'accusation', 'county'],
+        ['100', '02/18/1893', 'Test Victim', 'Black', 'male', 'None given', 'Murder', 'Decatur'],
+        ['100', '02/18/1893', '', 'black', 'Man', '', 'murder', 'decatur'],
+        ['101', '07/04/1901', 'Other Victim', 'White', 'female', '', '', 'Nowhere'],
+    ]
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'wb') as csv_file:
+            csv.writer(csv_file).writerows(self.rows)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_import(self):
+        Race(label="BLACK").save()
+        existing = Lynching(pca_id=100)
+        existing.save()
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('import_victims', self.filename, silent=True, batch_size=2)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        self.assertEqual(3, Victim.objects.count())
+        self.assertEqual(2, Lynching.objects.count())
+        self.assertEqual(["BLACK", "White"], sorted([r.label for r in Race.objects.all()]))
+        self.assertEqual(["Murder"], [a.label for a in Accusation.objects.all()])
+
+        victims = existing.victim_set.order_by('id')
+        self.assertEqual(2, len(victims))
+        for victim in victims:
+            self.assertEqual("Decatur", victim.county.name)
+            self.assertEqual("BLACK", victim.race.label)
+            self.assertEqual('M', victim.gender)
+            self.assertEqual(["Murder"], [a.label for a in victim.accusation.all()])
+        other = Victim.objects.get(name="Other Victim")
+        self.assertEqual(None, other.county)
+        self.assertEqual([], list(other.accusation.all()))
+        self.assertEqual(date(1901, 7, 4), other.date)
+        self.assertTrue("Nowhere (1 victims)" in output)
+
+        # derived data is rebuilt once the import completes
+        summary = LynchingSummary.objects.get(lynching=existing)
+        self.assertEqual(2, summary.victim_count)
+        self.assertEqual(["Murder"], summary.accusation_list)
+
+    def test_existing_victims(self):
+        # victims already in the database aren't mistaken for new ones
+        lynching = Lynching.objects.create(pca_id=100)
+        Victim.objects.create(lynching=lynching, name='Test Victim', date=date(1893, 2, 18),
+                              detailed_reason='None given', gender='M')
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('import_victims', self.filename, silent=True, batch_size=2)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(4, Victim.objects.count())
+        victims = lynching.victim_set.order_by('id')
+        self.assertEqual([0, 1, 1], [victim.accusation.count() for victim in victims])
+
+    def test_confirm(self):
+        import __builtin__
+        raw_input = __builtin__.raw_input
+        __builtin__.raw_input = lambda prompt: 'n'
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, call_command, 'import_victims', self.filename)
+            self.assertTrue('User Aborted' in sys.stderr.getvalue())
+        finally:
+            __builtin__.raw_input = raw_input
+            sys.stderr = stderr
+        self.assertEqual(0, Victim.objects.count())
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        county = County.objects.get(name="Decatur")
+        self.acc = Accusation.objects.create(**accusation1)
+        self.lynching = Lynching.objects.create(pca_id="22394")
+        self.victims = []
+        for victim_data in [named_victim, unnamed_victim]:
+            victim = Victim.objects.create(lynching=self.lynching, county=county, **victim_data)
+            self.victims.append(victim)
+        self.victims[0].accusation.add(self.acc)
+
+    def test_victims_csv(self):
+        response = self.client.get(reverse('lynchings:export_victims', args=['csv']))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/csv; charset=utf-8', response['Content-Type'])
+        self.assertEqual('attachment; filename=victims.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(response.content)))
+        self.assertEqual(2, len(rows))
+        self.assertEqual('Test Victim', rows[0]['name'])
+        self.assertEqual('1893-02-18', rows[0]['date'])
+        self.assertEqual('Decatur', rows[0]['county'])
+        self.assertEqual('Test Crime', rows[0]['accusations'])
+        self.assertEqual('', rows[1]['accusations'])
+        self.assertEqual(str(self.lynching.id), rows[1]['lynching_id'])
+
+    def test_victims_ndjson(self):
+        response = self.client.get(reverse('lynchings:export_victims', args=['ndjson']))
+        lines = response.content.splitlines()
+        self.assertEqual(2, len(lines))
+        victim = json.loads(lines[0])
+        self.assertEqual(self.victims[0].id, victim['victim_id'])
+        self.assertEqual(['Test Crime'], victim['accusations'])
+
+    def test_chunked(self):
+        # each chunk takes one query for the victims and one for accusations,
+        # plus a final query that finds no more victims
+        with self.assertNumQueries(5):
+            rows = list(victim_rows(chunk_size=1))
+        self.assertEqual([v.id for v in self.victims], [row['victim_id'] for row in rows])
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        # start each test with nothing cached
+        responsecache.bump_data_generation()
+        responsecache.reset_stats()
+        self.url = reverse('lynchings:stats_data')
+
+    def test_bulk_changes(self):
+        from georgia_lynchings.lynchings.models import suspended_derived_data
+        lynching = Lynching.objects.create(pca_id="22394")
+        for victim_data in [named_victim, unnamed_victim, named_victim]:
+            Victim.objects.create(lynching=lynching, **victim_data)
+        bumps = []
+        bump_data_generation = responsecache.bump_data_generation
+        responsecache.bump_data_generation = lambda: bumps.append(1)
+        try:
+            # for every row by default
+            Victim.objects.filter(name='Test Victim').delete()
+            self.assertTrue(len(bumps) >= 2, bumps)
+            # but once for a bulk change
+            del bumps[:]
+            with suspended_derived_data():
+                Victim.objects.all().delete()
+            self.assertEqual(1, len(bumps))
+            del bumps[:]
+            LynchingSummary.rebuild()
+            self.assertEqual(1, len(bumps))
+            del bumps[:]
+            with responsecache.suspended_invalidation():
+                pass
+            self.assertEqual(0, len(bumps))
+        finally:
+            responsecache.bump_data_generation = bump_data_generation
+
+    def test_hit(self):
+        response = self.client.get(self.url)
+        self.assertEqual('miss', response[responsecache.CACHE_STATUS_HEADER])
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual('hit', cached[responsecache.CACHE_STATUS_HEADER])
+        self.assertEqual(response.content, cached.content)
+        self.assertEqual('application/json', cached['Content-Type'])
+        # the query string is part of the key
+        response = self.client.get(self.url, {'q': 'x'})
+        self.assertEqual('miss', response[responsecache.CACHE_STATUS_HEADER])
+
+    def test_invalidation(self):
+        self.client.get(self.url)
+        generation = responsecache.data_generation()
+        Lynching(pca_id="22394").save()
+        self.assertTrue(responsecache.data_generation() > generation)
+        response = self.client.get(self.url)
+        self.assertEqual('miss', response[responsecache.CACHE_STATUS_HEADER])
+        self.assertEqual(1, json.loads(response.content)['lynching'])
+
+        # the import commands bump the generation when they finish
+        generation = responsecache.data_generation()
+        call_command('build_timemap', verbosity=0)
+        self.assertTrue(responsecache.data_generation() > generation)
+
+    def test_not_cached(self):
+        # streamed exports
+        response = self.client.get(reverse('lynchings:export_victims', args=['csv']))
+        self.assertFalse(responsecache.CACHE_STATUS_HEADER in response)
+        # requests from logged in users
+        self.client.cookies['sessionid'] = 'abc'
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertFalse(responsecache.CACHE_STATUS_HEADER in response)
+
+    def test_stats(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.client.get(self.url)
+        stats = responsecache.get_stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertAlmostEqual(2.0 / 3, stats['hit_rate'])
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('response_cache_stats', reset=True)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue("Hit rate: 66.7%" in output)
+        self.assertEqual(0, responsecache.get_stats()['hits'])
+
+class QueryBudgetTest(TestCase):
+    fixtures = ['test_lynchings', 'test_reldata', 'test_articles']
+
+    def setUp(self):
+        # enough data that a view querying per object goes over budget
+        race = Race.objects.create(**race1)
+        counties = County.objects.filter(population__isnull=False).distinct()[:4]
+        for i, lynching in enumerate(Lynching.objects.all()):
+            accusation = Accusation.objects.create(label='Crime %d' % i)
+            for county in counties:
+                victim = Victim.objects.create(lynching=lynching, county=county, race=race,
+                                               name='Victim %d' % i, gender='M',
+                                               date=date(1890 + i, 2, 18))
+                victim.accusation.add(accusation)
+        self.lynching = Lynching.objects.all()[0]
+        self.county = counties[0]
+        self.accusation = accusation
+
+    def _clear_caches(self):
+        from django.core.cache import cache
+        from georgia_lynchings.demographics.models import STATEWIDE_CACHE_KEY
+        from georgia_lynchings.reldata.graph import clear_graph_data
+        clear_site_stats()
+        clear_timemap_feed()
+        clear_graph_data()
+        cache.delete(STATEWIDE_CACHE_KEY)
+        responsecache.bump_data_generation()
+
+    def test_budgets(self):
+        from django.conf import settings
+        from georgia_lynchings.lynchings.profiling import profile
+        urls = {
+            'home': reverse('home'),
+            'lynchings:lynching_detail': reverse('lynchings:lynching_detail', args=[self.lynching.id]),
+            'lynchings:lynching_list': reverse('lynchings:lynching_list'),
+            'lynchings:alleged_crimes_list': reverse('lynchings:alleged_crimes_list'),
+            'lynchings:lynching_list_by_accusation': reverse('lynchings:lynching_list_by_accusation',
+                                                            args=[self.accusation.id]),
+            'lynchings:timemap_data': reverse('lynchings:timemap_data'),
+            'lynchings:map_data': reverse('lynchings:map_data'),
+            'lynchings:county_list': reverse('lynchings:county_list'),
+            'lynchings:county_detail': reverse('lynchings:county_detail', args=[self.county.id]),
+            'lynchings:stats_data': reverse('lynchings:stats_data'),
+            'articles:list': reverse('articles:list'),
+            'relations:graph': reverse('relations:graph'),
+            'relations:graph_data': reverse('relations:graph_data'),
+            'relations:event_lookup': reverse('relations:event_lookup') + '?participant=3',
+        }
+        # a budget for a view not checked here would never fail
+        self.assertEqual(sorted(settings.QUERY_BUDGETS), sorted(urls))
+        for view_name, url in urls.items():
+            self._clear_caches()
+            with profile(view_name) as result:
+                response = self.client.get(url)
+            self.assertEqual(200, response.status_code, url)
+            self.assertFalse(result.over_budget, '%s over budget of %d: %s' %
+                             (result.summary(), result.budget, result.duplicates))
+        self._clear_caches()
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        from georgia_lynchings.lynchings import profiling
+        self.profiling = profiling
+        profiling.reset_report()
+        responsecache.bump_data_generation()
+        lynching = Lynching.objects.create(pca_id="22394")
+        for victim_data in [named_victim, unnamed_victim]:
+            Victim.objects.create(lynching=lynching, **victim_data)
+
+    def tearDown(self):
+        self.profiling.reset_report()
+
+    def test_fingerprint(self):
+        self.assertEqual(self.profiling.fingerprint(
+                             "SELECT a FROM b WHERE c = 12 AND d = 'it''s' AND e IN (1, 2, 3)"),
+                         "SELECT a FROM b WHERE c = ? AND d = ? AND e IN (?)")
+
+    def test_profile(self):
+        with self.profiling.profile('lynchings:lynching_list') as result:
+            self.client.get(reverse('lynchings:lynching_list'))
+            for lynching in Lynching.objects.all():
+                list(lynching.victim_set.all())
+            # nothing cached for a second request
+            self.client.get(reverse('lynchings:county_list'))
+        self.assertEqual(4, result.query_count)
+        self.assertEqual(0, result.duplicate_count)
+        self.assertTrue(result.template_time > 0)
+        self.assertEqual(1, result.budget)
+        self.assertTrue(result.over_budget)
+
+    def test_middleware(self):
+        from django.test.utils import override_settings
+        from django.contrib.auth.models import User
+        with override_settings(DEBUG=True):
+            client = Client()
+            response = client.get(reverse('lynchings:lynching_list'))
+            self.assertEqual('1', response['X-Profile-Queries'])
+            self.assertEqual('1', response['X-Profile-Query-Budget'])
+            self.assertTrue(response['X-Profile-Template-Time'].endswith('ms'))
+            client.get(reverse('lynchings:lynching_list'))
+
+            User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+            client.login(username='admin', password='pass')
+            response = client.get(reverse('lynchings:profiling_report'))
+        data = json.loads(response.content)
+        self.assertTrue(data['enabled'])
+        report = dict((row['view'], row) for row in data['views'])
+        self.assertEqual(2, report['lynchings:lynching_list']['requests'])
+        # the second was served by the response cache
+        self.assertEqual(1, report['lynchings:lynching_list']['total_queries'])
+        self.assertEqual(1, report['lynchings:lynching_list']['max_queries'])
+        self.assertEqual(0, report['lynchings:lynching_list']['over_budget'])
+
+    def test_request_profile_keeps_reset(self):
+        # other threads' requests must still clear their queries while one
+        # request is being profiled
+        from django.core.signals import request_started
+        from django.db import connection
+        current = self.profiling.start_profile()
+        try:
+            Lynching.objects.count()
+            request_started.send(sender=self.__class__)
+            self.assertEqual([], connection.queries)
+        finally:
+            self.profiling.end_profile(current)
+
+    def test_report_staff_only(self):
+        response = self.client.get(reverse('lynchings:profiling_report'))
+        self.assertNotEqual('application/json', response['Content-Type'])
+
+class GenerateDatasetTest(TestCase):
+
+    def _generate(self, **options):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('generate_dataset', **options)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_generate(self):
+        from georgia_lynchings.articles.models import Article
+        from georgia_lynchings.demographics.models import Population, YEAR_CHOICES
+        from georgia_lynchings.reldata.models import Relation
+        output = self._generate(lynchings=20, victims=30, articles=10, relations=500,
+                                actors=50, actions=5, batch_size=7)
+        self.assertTrue('Generated 20 lynchings, 30 victims, 10 articles, 500 relations' in output)
+        self.assertEqual(20, Lynching.objects.count())
+        self.assertEqual(30, Victim.objects.count())
+        self.assertEqual(0, Lynching.objects.filter(victim__isnull=True).count())
+        self.assertEqual(0, Victim.objects.filter(accusation__isnull=True).count())
+        self.assertEqual(10, Article.objects.filter(lynching__isnull=False).count())
+        self.assertEqual(500, Relation.objects.count())
+        # census figures for every county in every year
+        self.assertEqual(County.objects.count() * len(YEAR_CHOICES), Population.objects.count())
+        # derived data is rebuilt
+        self.assertEqual(20, LynchingSummary.objects.count())
+        self.assertEqual(20, len(get_timemap_feed()['entries']))
+
+        # a few actors take part in most of the relations
+        counts = sorted(Relation.objects.values('subject').annotate(count=Count('id'))
+                                        .values_list('count', flat=True), reverse=True)
+        self.assertTrue(sum(counts[:5]) > 250, counts)
+
+    def test_batches(self):
+        # more rows than sqlite takes in one insert
+        from georgia_lynchings.reldata.models import Actor
+        self._generate(lynchings=5, victims=5, articles=0, relations=10,
+                       accusations=1200, actors=1200, actions=1200, batch_size=2000)
+        self.assertEqual(1200, Actor.objects.count())
+        self.assertEqual(1200, Accusation.objects.count())
+
+    def test_existing_data(self):
+        Lynching(pca_id="22394").save()
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, self._generate, lynchings=10)
+            self.assertTrue('already lynchings' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+class BenchmarkViewsTest(TestCase):
+
+    def setUp(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('generate_dataset', lynchings=10, victims=15, articles=5,
+                         relations=100, actors=10, actions=3, verbosity=0)
+        finally:
+            sys.stdout = stdout
+        handle, self.filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def _benchmark(self, *args, **options):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('benchmark_views', *args, **options)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_benchmark(self):
+        from django.conf import settings
+        output = self._benchmark(repeat=2, output=self.filename)
+        with open(self.filename) as results_file:
+            results = json.load(results_file)
+        self.assertEqual(10, results['data']['lynchings'])
+        views = dict((view['view'], view) for view in results['views'])
+        # every view with a query budget, and more
+        self.assertTrue(set(settings.QUERY_BUDGETS) < set(views))
+        for view in views.values():
+            self.assertEqual(200, view['status'], view['url'])
+            self.assertTrue(view['bytes'] > 0)
+            self.assertTrue(view['warm']['min'] <= view['warm']['median'])
+            self.assertTrue(view['view'] in output)
+        self.assertEqual(0, views['home']['cached']['queries'])
+        self.assertTrue(views['home']['cold']['queries'] > 0)
+
+        output = self._benchmark('home', 'lynchings:timemap_data', repeat=1,
+                                 compare=self.filename, verbosity=0)
+        self.assertTrue('Compared with' in output)
+        self.assertTrue('lynchings:timemap_data' in output)
+        self.assertFalse('lynchings:county_list' in output)
+
+class LynchingAdminTest(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+        self.county = County.objects.get(name="Decatur")
+        self.race = Race.objects.create(**race1)
+        self.add_lynchings(2)
+
+    def add_lynchings(self, count):
+        for i in range(count):
+            lynching = Lynching.objects.create(pca_id=Lynching.objects.count() + 1)
+            for victim_data in [named_victim, unnamed_victim]:
+                Victim.objects.create(lynching=lynching, county=self.county, race=self.race,
+                                      **victim_data)
+
+    def query_count(self, url):
+        from georgia_lynchings.lynchings.profiling import profile
+        with profile() as result:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return result.query_count
+
+    def test_changelists(self):
+        for model in ['lynching', 'victim']:
+            url = reverse('admin:lynchings_%s_changelist' % model)
+            before = self.query_count(url)
+            self.add_lynchings(5)
+            self.assertEqual(before, self.query_count(url), model)
+
+class MapDataTest(TestCase):
+
+    def setUp(self):
+        clear_timemap_feed()
+        responsecache.bump_data_generation()
+        self.counties = {}
+        for name in ["Decatur", "Grady", "Fulton"]:
+            self.counties[name] = County.objects.get(name=name)
+        for i, (name, year) in enumerate([("Decatur", 1893), ("Decatur", 1905),
+                                          ("Grady", 1899), ("Fulton", 1906)]):
+            lynching = Lynching.objects.create(pca_id=i + 1)
+            Victim.objects.create(lynching=lynching, county=self.counties[name],
+                                  name='Victim %d' % i, date=date(year, 6, 1))
+        # no date, so not on the map
+        lynching = Lynching.objects.create(pca_id=99)
+        Victim.objects.create(lynching=lynching, county=self.counties["Fulton"])
+        # no coordinates, so not on the map
+        lynching = Lynching.objects.create(pca_id=98)
+        Victim.objects.create(lynching=lynching, county=County.objects.create(name='Nowhere'),
+                              date=date(1900, 1, 1))
+
+    def tearDown(self):
+        clear_timemap_feed()
+
+    def _get(self, **params):
+        response = self.client.get(reverse('lynchings:map_data'), params)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/json', response['Content-Type'])
+        return json.loads(response.content)
+
+    def _bbox(self, *names):
+        counties = [self.counties[name] for name in names]
+        return '%f,%f,%f,%f' % (min(c.latitude for c in counties), min(c.longitude for c in counties),
+                                max(c.latitude for c in counties), max(c.longitude for c in counties))
+
+    def test_points(self):
+        data = self._get()
+        self.assertFalse(data['clustered'])
+        self.assertEqual(4, data['total'])
+        self.assertEqual(["Decatur", "Decatur", "Fulton", "Grady"],
+                         [point['county'] for point in data['points']])
+        self.assertEqual(['1893-06-01', '1905-06-01'], [point['date'] for point in data['points'][:2]])
+        self.assertEqual(self.counties["Fulton"].latitude, data['points'][2]['lat'])
+
+        # south west Georgia only
+        data = self._get(bbox=self._bbox("Decatur", "Grady"))
+        self.assertEqual(["Decatur", "Decatur", "Grady"],
+                         [point['county'] for point in data['points']])
+        data = self._get(start='1899', end='1905-06-01')
+        self.assertEqual(['1899-06-01', '1905-06-01'],
+                         sorted(point['date'] for point in data['points']))
+        data = self._get(bbox=self._bbox("Decatur"), start='1900')
+        self.assertEqual(1, data['total'])
+
+    def test_clusters(self):
+        # Decatur and Grady are neighbors; Fulton is across the state
+        data = self._get(zoom=6)
+        self.assertTrue(data['clustered'])
+        self.assertEqual(4, data['total'])
+        self.assertEqual([3, 1], [cluster['count'] for cluster in data['clusters']])
+        self.assertEqual(["Decatur", "Grady"], data['clusters'][0]['counties'])
+        self.assertEqual(["Fulton"], data['clusters'][1]['counties'])
+        south, west, north, east = data['clusters'][0]['bounds']
+        self.assertTrue(south <= data['clusters'][0]['lat'] <= north)
+        # points when zoomed in
+        self.assertFalse(self._get(zoom=10)['clustered'])
+
+    def test_county(self):
+        data = self._get(county='Decatur', end='1900')
+        self.assertEqual(['1893-06-01'], [point['date'] for point in data['points']])
+        self.assertEqual(0, self._get(county='Atlantis')['total'])
+
+    def test_timemap_clusters(self):
+        url = reverse('lynchings:timemap_data')
+        response = self.client.get(url, {'cluster': 'decade'})
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.content)
+        self.assertEqual(['1 lynching in Decatur County, 1890s',
+                          '1 lynching in Decatur County, 1900s',
+                          '1 lynching in Fulton County, 1900s',
+                          '1 lynching in Grady County, 1890s'],
+                         [entry['title'] for entry in data])
+        self.assertEqual('1890-01-01', data[0]['start'])
+        self.assertEqual('1899-12-31', data[0]['end'])
+        self.assertEqual(self.counties["Decatur"].latitude, data[0]['point']['lat'])
+        self.assertEqual(1, data[0]['options']['count'])
+
+        # the detail link lists the lynchings in the cluster
+        response = self.client.get(data[1]['options']['detail_link'])
+        points = json.loads(response.content)['points']
+        self.assertEqual(['1905-06-01'], [point['date'] for point in points])
+
+        lynching = Lynching.objects.create(pca_id=100)
+        Victim.objects.create(lynching=lynching, county=self.counties["Decatur"],
+                              date=date(1898, 1, 1))
+        data = json.loads(self.client.get(url, {'cluster': 'decade'}).content)
+        self.assertEqual('2 lynchings in Decatur County, 1890s', data[0]['title'])
+        data = json.loads(self.client.get(url, {'cluster': 'year'}).content)
+        self.assertEqual(['1893', '1898', '1905', '1906', '1899'],
+                         [entry['options']['period'] for entry in data])
+        self.assertEqual(400, self.client.get(url, {'cluster': 'century'}).status_code)
+
+    def test_updates(self):
+        self.assertEqual(4, self._get()['total'])
+        lynching = Lynching.objects.create(pca_id=100)
+        Victim.objects.create(lynching=lynching, county=self.counties["Grady"],
+                              date=date(1910, 1, 1))
+        self.assertEqual(5, self._get()['total'])
+
+    def test_invalid(self):
+        url = reverse('lynchings:map_data')
+        for params in [{'bbox': '1,2,3'}, {'bbox': '33,-84,31,-85'}, {'start': '1890-13-01'},
+                       {'end': 'x'}, {'zoom': 'far'}, {'zoom': '-1'}, {'zoom': '-1100'},
+                       {'zoom': '22'}]:
+            self.assertEqual(400, self.client.get(url, params).status_code, params)
+
+    def test_grid(self):
+        from georgia_lynchings.lynchings.mapdata import SpatialGrid
+        grid = SpatialGrid(cell_size=1)
+        grid.add(31.5, -84.5, 'a')
+        grid.add(31.9, -84.1, 'b')
+        grid.add(33.7, -84.4, 'c')
+        self.assertEqual(['a'], list(grid.within(31, -85, 31.6, -84.3)))
+        self.assertEqual(['a', 'b'], sorted(grid.within(31, -85, 32, -84)))
+        # larger than the cells in use
+        self.assertEqual(['a', 'b', 'c'], sorted(grid.within(-90, -180, 90, 180)))
@@ -0,0 +1,206 @@
+"""
+Precomputed data feed for the lynchings timemap.
+
+The timemap shows every lynching, so rather than being recomputed on every
+request the complete JSON document is built once from the
+:class:`~georgia_lynchings.lynchings.models.LynchingSummary` table and kept
+in the Django cache.
+Entries for individual lynchings are refreshed as the underlying data
+changes (see the signal handlers at the end of
+:mod:`georgia_lynchings.lynchings.models`) and the whole feed can be rebuilt
+with the ``build_timemap`` management command.
+
+For a lighter map, :func:`clustered_timemap_feed` gives one datapoint for
+each county and year or decade instead, with a link to the lynchings in it.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from urllib import urlencode
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+
+from georgia_lynchings.lynchings.mapdata import clear_map_index, cluster_by_period, \
+    find_points
+
+FEED_CACHE_KEY = 'lynchings:timemap_feed'
+# The feed's etag and last modified time, kept apart so that conditional
+# requests don't need the whole feed.
+FEED_VALIDATORS_CACHE_KEY = 'lynchings:timemap_feed_validators'
+# memcached will not keep anything for longer than 30 days.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+def timemap_datapoint(summary):
+    """
+    Formats a datapoint for an individual lynching story.
+
+    :param summary:  :class:`~georgia_lynchings.lynchings.models.LynchingSummary`
+        of the lynching.
+    """
+    data = {
+        'title': u'%s' % summary,
+        'options': {
+            'detail_link': reverse('lynchings:lynching_detail', args=[summary.lynching_id,]),
+            }
+    }
+    if summary.county:
+        data['options']['county'] = summary.county.name
+        data['point'] = {
+            'lat': summary.latitude,
+            'lon': summary.longitude,
+        }
+
+    accusations = summary.accusation_list
+    if accusations:
+        data['options']['alleged_crime'] = accusations[0] # all crimes are the same or none.
+
+    if summary.date:
+        # strftime can't reliably do dates before 1900
+        date = summary.date
+        date_str = "%04d-%02d-%02d" % (date.year, date.month, date.day)
+        data['start'] = date_str
+        data['options']['date'] = date_str
+
+    return data
+
+def timemap_cluster_datapoint(cluster):
+    """
+    Formats a datapoint for the lynchings in a county during a period, with
+    a ``detail_link`` to the ``map_data`` view for them.
+
+    :param cluster:  A cluster from
+        :func:`~georgia_lynchings.lynchings.mapdata.cluster_by_period`.
+    """
+    if cluster['first_year'] == cluster['last_year']:
+        period = u'%d' % cluster['first_year']
+    else:
+        period = u'%ds' % cluster['first_year']
+    query = urlencode({
+        'county': cluster['county'].encode('utf-8'),
+        'start': '%04d' % cluster['first_year'],
+        'end': '%04d' % cluster['last_year'],
+    })
+    return {
+        'title': u'%d %s in %s County, %s' % (cluster['count'],
+            'lynching' if cluster['count'] == 1 else 'lynchings', cluster['county'], period),
+        'start': '%04d-01-01' % cluster['first_year'],
+        'end': '%04d-12-31' % cluster['last_year'],
+        'point': {
+            'lat': cluster['lat'],
+            'lon': cluster['lon'],
+        },
+        'options': {
+            'county': cluster['county'],
+            'period': period,
+            'count': cluster['count'],
+            'detail_link': '%s?%s' % (reverse('lynchings:map_data'), query),
+        }
+    }
+
+def _is_mappable(data):
+    """Only datapoints with both a date and a location can go on the timemap."""
+    return data.get('start', None) and data.get('point', None)
+
+def _store_feed(entries):
+    """
+    Serializes the feed entries and stores the result in the cache.
+
+    :param entries:  Dict of timemap datapoints keyed by lynching id.
+    """
+    json_literal = [entries[lynching_id] for lynching_id in sorted(entries)]
+    content = json.dumps(json_literal, indent=4)
+    feed = {
+        'entries': entries,
+        'content': content,
+        'etag': hashlib.md5(content).hexdigest(),
+        'last_modified': datetime.utcnow().replace(microsecond=0),
+    }
+    cache.set(FEED_CACHE_KEY, feed, FEED_CACHE_TIMEOUT)
+    cache.set(FEED_VALIDATORS_CACHE_KEY, {
+        'etag': feed['etag'],
+        'last_modified': feed['last_modified'],
+    }, FEED_CACHE_TIMEOUT)
+    clear_map_index()
+    return feed
+
+def build_timemap_feed():
+    """
+    Builds the complete timemap feed from scratch and stores it in the cache.
+    """
+    from georgia_lynchings.lynchings.models import LynchingSummary
+    entries = {}
+    for summary in LynchingSummary.objects.select_related('county'):
+        data = timemap_datapoint(summary)
+        if _is_mappable(data):
+            entries[summary.lynching_id] = data
+    return _store_feed(entries)
+
+def get_timemap_feed():
+    """
+    Returns the cached timemap feed, building it first if it is not available.
+
+    The feed is a dict with the serialized JSON ``content``, the ``etag``
+    and ``last_modified`` values to use for conditional requests and the
+    individual ``entries`` keyed by lynching id.
+    """
+    feed = cache.get(FEED_CACHE_KEY)
+    if feed is None:
+        feed = build_timemap_feed()
+    return feed
+
+def get_timemap_validators():
+    """
+    Returns a dict with the ``etag`` and ``last_modified`` values of the
+    timemap feed, building the feed first if it is not available.
+    """
+    validators = cache.get(FEED_VALIDATORS_CACHE_KEY)
+    if validators is None:
+        feed = get_timemap_feed()
+        validators = {'etag': feed['etag'], 'last_modified': feed['last_modified']}
+    return validators
+
+def update_timemap_feed(lynching_ids):
+    """
+    Recomputes the feed entries for the given lynchings only.  Nothing is
+    done if the feed hasn't been built yet since it will be built in full
+    the next time it is requested.
+
+    :param lynching_ids:  Iterable of ids of lynchings that have changed or
+        been removed.
+    """
+    from georgia_lynchings.lynchings.models import LynchingSummary
+    feed = cache.get(FEED_CACHE_KEY)
+    if feed is None:
+        return None
+    lynching_ids = set(lynching_ids)
+    if not lynching_ids:
+        return feed
+    entries = feed['entries']
+    for lynching_id in lynching_ids:
+        entries.pop(lynching_id, None)
+    summaries = LynchingSummary.objects.filter(lynching__in=lynching_ids) \
+                                       .select_related('county')
+    for summary in summaries:
+        data = timemap_datapoint(summary)
+        if _is_mappable(data):
+            entries[summary.lynching_id] = data
+    return _store_feed(entries)
+
+def clear_timemap_feed():
+    """Removes the feed from the cache so it is rebuilt on the next request."""
+    cache.delete_many([FEED_CACHE_KEY, FEED_VALIDATORS_CACHE_KEY])
+    clear_map_index()
+
+def clustered_timemap_feed(period):
+    """
+    Returns the timemap feed as a list of datapoints for each county and
+    period with lynchings, from the map index, so that its size depends on
+    the number of counties rather than lynchings.
+
+    :param period:  One of
+        :data:`~georgia_lynchings.lynchings.mapdata.CLUSTER_PERIODS`.
+    """
+    return [timemap_cluster_datapoint(cluster)
+            for cluster in cluster_by_period(find_points(), period)]
@@ -11,7 +11,11 @@ urlpatterns = patterns('georgia_lynchings.lynchings.views',
     url(r'^accusations/(?P<accusation_id>[0-9]+)/$', 'lynching_list_by_accusation', name='lynching_list_by_accusation'),
     url(r'timemap/$', 'timemap', name='timemap'),                        # timemap prototype
     url(r'timemap/data/$','timemap_data', name='timemap_data'),
+    url(r'^map/data/$', 'map_data', name='map_data'),
     url(r'counties/$','county_list', name='county_list'),
     url(r'^counties/(?P<county_id>[0-9]+)/$', 'county_detail', name='county_detail'),
+    url(r'^stats/$', 'stats_data', name='stats_data'),
+    url(r'^profiling/$', 'profiling_report', name='profiling_report'),
+    url(r'^export/victims\.(?P<format>csv|ndjson)$', 'export_victims', name='export_victims'),
 )
 
@@ -1,34 +1,61 @@
 import json
 
-from django.http import Http404, HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.db.models import Count, Q, Sum, Avg
 from django.shortcuts import render, get_object_or_404
-from django.core.urlresolvers import reverse
-
-from georgia_lynchings.lynchings.models import Story, Lynching, Accusation, Victim
+from django.views.decorators.http import condition
+
+from georgia_lynchings.lynchings.models import Story, Lynching, LynchingSummary, \
+    Accusation
+from georgia_lynchings.lynchings.export import export_response, victim_rows, \
+    VICTIM_FIELDS
+from georgia_lynchings.lynchings import mapdata, profiling
+from georgia_lynchings.lynchings.stats import get_site_stats
+from georgia_lynchings.lynchings.timemap import get_timemap_feed, \
+    get_timemap_validators, clustered_timemap_feed
 from georgia_lynchings.demographics.models import County, Population
-from georgia_lynchings.reldata.models import Relation
 
 def index(request):
     """
     A Basic index view for the front page of the site.
     """
-    count  = {
-        'lynching': Lynching.objects.all().count,
-        'victim': Victim.objects.all().count,
-        'county': County.objects.filter(victim__isnull=False).count,
-        'accusation': Accusation.objects.all().count,
-        'relation': Relation.objects.all().count,
-        }
     return render(request, 'index.html', {
-            'count': count,
+            'count': get_site_stats(),
         })
 
+def stats_data(request):
+    """
+    Renders a json return of the counts shown on the front page.
+    """
+    return HttpResponse(json.dumps(get_site_stats()),
+        mimetype='application/json')
+
+@staff_member_required
+def profiling_report(request):
+    """
+    Renders a json return of the queries and timings of each view profiled
+    in this server process, for staff.  Pass ``reset=1`` to start again.
+    """
+    data = {'enabled': profiling.enabled(), 'views': profiling.report()}
+    if request.GET.get('reset'):
+        profiling.reset_report()
+    return HttpResponse(json.dumps(data), mimetype='application/json')
+
+def export_victims(request, format):
+    """
+    Streams every victim with the details of their lynching, county and
+    accusations as a CSV or newline-delimited JSON download.
+
+    :param format:  'csv' or 'ndjson'.
+    """
+    return export_response(victim_rows(), VICTIM_FIELDS, format, 'victims')
+
 def lynching_detail(request, lynching_id):
     """
     Renders a detailed view for a specific story_id.
     """
-    lynching = get_object_or_404(Lynching, pk=lynching_id)
+    lynching = get_object_or_404(Lynching.objects.with_summary(), pk=lynching_id)
 
     population_list, closest_census, state_averages = None, None, None
     if lynching.year:
@@ -36,19 +63,9 @@ def lynching_detail(request, lynching_id):
         if lynching.year%10 > 5 and lynching.year < 1930:
             closest_census = closest_census + 10
 
-        population_list = Population.objects.filter(county__in=lynching.county_list, year=closest_census)
-        state_averages = Population.objects.filter(year=closest_census).aggregate(
-            total=Sum('total'),
-            white=Sum('white'),
-            black=Sum('black'),
-            ilterate_blacks=Sum('iltr_black'),
-            iliterate_whites=Sum('iltr_white'),
-            county_avg_total=Sum('total'),
-            county_avg_white=Sum('white'),
-            county_avg_black=Sum('black'),
-            county_avg_ilterate_blacks=Sum('iltr_black'),
-            county_avg_iliterate_whites=Sum('iltr_white'),
-        )
+        population_list = Population.objects.filter(county__in=lynching.county_list, year=closest_census) \
+                                            .select_related('county')
+        state_averages = Population.statewide_totals_for_year(closest_census)
 
     return render(request, 'lynchings/details.html',{
         'lynching': lynching,
@@ -61,7 +78,7 @@ def lynching_list(request):
     """
     Renders a simple list of lynching stories.
     """
-    lynching_list = Lynching.objects.all()
+    lynching_list = LynchingSummary.objects.all()
 
     return render(request, 'lynchings/list_events.html', {
         'lynching_list': lynching_list,
@@ -73,7 +90,7 @@ def lynching_list_by_accusation(request, accusation_id):
     Returns a list of lynchings based on the accusations that lead to the event.
     """
     crime = get_object_or_404(Accusation, id=accusation_id)
-    lynching_list = Lynching.objects.filter(victim__accusation=crime).distinct()
+    lynching_list = LynchingSummary.objects.filter(lynching__victim__accusation=crime).distinct()
 
     return render(request, 'lynchings/list_events.html', {
         'lynching_list': lynching_list,
@@ -112,65 +129,73 @@ def county_detail(request, county_id):
     """
     county = get_object_or_404(County, id=county_id)
 
-    lynching_list = Lynching.objects.filter(victim__county=county).distinct()
+    lynching_list = LynchingSummary.objects.filter(lynching__victim__county=county).distinct()
+    statewide_totals = Population.statewide_totals_by_year()
+    census_list = [(pop, statewide_totals.get(pop.year)) for pop in county.population_set.all()]
     return render(request, 'lynchings/list_events.html', {
         'title': 'Lynchings in %s County' % county.name,
         'county': county,
+        'census_list': census_list,
         'lynching_list': lynching_list,
     })
 
 def timemap(request):
     return render(request, 'lynchings/timemap.html')
 
+def _timemap_validators(request):
+    # fetched once for both of the condition functions
+    if not hasattr(request, '_timemap_validators'):
+        request._timemap_validators = get_timemap_validators()
+    return request._timemap_validators
+
+def _timemap_etag(request):
+    return _timemap_validators(request)['etag']
+
+def _timemap_last_modified(request):
+    return _timemap_validators(request)['last_modified']
+
+@condition(etag_func=_timemap_etag, last_modified_func=_timemap_last_modified)
 def timemap_data(request):
     """
-    Renders a json return for use with timemap.
-    """
-    story_data = [_story_timemap_data(lynching) for lynching in Lynching.objects.all()]
-    json_literal = [d for d in story_data
-                    if d.get('start', None) and
-                       d.get('point', None)]
-
-    return HttpResponse(json.dumps(json_literal, indent=4),
+    Renders a json return for use with timemap from the precomputed feed.
+    With ``cluster`` set to ``year`` or ``decade`` there is one datapoint
+    for each county and period instead of each lynching, with a count and a
+    link to the lynchings in it.
+    """
+    period = request.GET.get('cluster')
+    if not period:
+        return HttpResponse(get_timemap_feed()['content'],
+            mimetype='application/json')
+    if period not in mapdata.CLUSTER_PERIODS:
+        return HttpResponseBadRequest('Invalid cluster period %r.' % period)
+    return HttpResponse(json.dumps(clustered_timemap_feed(period)),
         mimetype='application/json')
 
-def _story_timemap_data(lynching):
+def map_data(request):
     """
-    Formats a datapoint for an individual lynching story.
-
+    Renders a json return of the lynchings on the map within a bounding box
+    (``bbox``, as south,west,north,east), time window (``start`` and
+    ``end``, as YYYY-MM-DD or a year) and ``county``, all optional.  With a map ``zoom``
+    level below :data:`~georgia_lynchings.lynchings.mapdata.CLUSTER_MAX_ZOOM`
+    nearby counties are returned as clusters with counts instead of points.
     """
+    try:
+        bbox = mapdata.parse_bbox(request.GET['bbox']) if request.GET.get('bbox') else None
+        start = mapdata.parse_date_bound(request.GET['start']) \
+            if request.GET.get('start') else None
+        end = mapdata.parse_date_bound(request.GET['end'], latest=True) \
+            if request.GET.get('end') else None
+        zoom = mapdata.parse_zoom(request.GET['zoom']) if request.GET.get('zoom') else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    results = mapdata.find_points(bbox, start, end, request.GET.get('county') or None)
     data = {
-        'title': u'%s' % lynching,
-        'options': {
-            'detail_link': reverse('lynchings:lynching_detail', args=[lynching.id,]),
-            }
+        'total': sum(len(points) for county, points in results),
+        'clustered': zoom is not None and zoom < mapdata.CLUSTER_MAX_ZOOM,
     }
-    try:
-        county = lynching.county_list[0]
-        if county:
-            data['options']['county'] = county.name
-            data['point'] = {
-                'lat': county.latitude,
-                'lon': county.longitude,
-            }
-    except IndexError:
-        pass
-
-    try:
-        accusations = []
-        for victim in [victim for victim in lynching.victim_set.all() if victim.accusation]:
-            accusations.extend(victim.accusation.all())
-        data['options']['alleged_crime'] = accusations[0].label # all crimes are the same or none.
-    except IndexError:
-        pass
-
-    try:
-        date = [victim.date for victim in lynching.victim_set.all() if victim.date][0]
-        # strftime can't reliably do dates before 1900
-        date_str = "%04d-%02d-%02d" % (date.year, date.month, date.day)
-        data['start'] = date_str
-        data['options']['date'] = date_str
-    except IndexError:
-        pass
-
-    return data
+    if data['clustered']:
+        data['clusters'] = mapdata.cluster(results, zoom)
+    else:
+        data['points'] = [point for county, points in results for point in points]
+    return HttpResponse(json.dumps(data), mimetype='application/json')
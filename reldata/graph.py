@@ -0,0 +1,248 @@
+"""
+Precomputed data for the relationship graph and its filters.
+
+The graph shows how often each kind of actor acts on each other kind,
+either for all relations or for a single type of action.  Every variation
+of the graph is built together in a single pass over the relations when
+data is imported and the serialized JSON is kept in the Django cache, so
+switching between actions in the graph doesn't touch the database.  The
+graphs are rebuilt automatically by the ``import_relationships`` command,
+or on the first request if they aren't in the cache.  Saving or deleting
+relations, actors or actions clears them (see the signal handlers at the
+end of :mod:`georgia_lynchings.reldata.models`).
+
+The counts of relations for each value of the graph filters are computed
+the same way, with a single aggregate query for all of the filters.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+
+from django.core.cache import cache
+from django.db.models import Count
+
+GRAPH_CACHE_KEY = 'reldata:graph_data'
+FACETS_CACHE_KEY = 'reldata:filter_facets'
+# memcached will not keep anything for longer than 30 days.
+GRAPH_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Fields the graph can be filtered by.  The value_field and label_field
+# are lookups on Relation, unless source is 'story', in which case they are
+# lookups on the LynchingSummary of the relation's story, for example:
+#    {'field_label': 'County', 'http_name': 'county', 'source': 'story',
+#     'value_field': 'county', 'label_field': 'county__name'}
+FILTER_FIELDS = [
+    {
+        'field_label': 'Type of Interaction',
+        'http_name': 'action',
+        'value_field': 'action',
+        'label_field': 'action__description',
+    },
+]
+
+_graph_updates_suspended = False
+
+# key of the graph including every action
+ALL_ACTIONS = ''
+EMPTY_GRAPH = json.dumps({'nodes': [], 'links': []})
+
+def _graph(actors, pair_counts):
+    """
+    Builds the nodes and links of a graph.
+
+    :param actors:  Dict of actor descriptions keyed by actor id.
+    :param pair_counts:  Dict of the number of relations keyed by
+        (subject id, object id).
+    """
+    totals = defaultdict(int)
+    for (subject, object), count in pair_counts.iteritems():
+        totals[subject] += count
+        totals[object] += count
+
+    nodes = [{
+        'name': actors[actor_id],
+        'value': totals[actor_id],
+        'actor_id': actor_id,
+    } for actor_id in sorted(totals) if totals[actor_id]]
+    node_index = dict((node['actor_id'], i) for i, node in enumerate(nodes))
+
+    links = [{
+        'source': node_index[subject],
+        'source_id': subject,
+        'target': node_index[object],
+        'target_id': object,
+        'value': pair_counts[(subject, object)],
+    } for subject, object in sorted(pair_counts)]
+
+    return {
+        'nodes': nodes,
+        'links': links,
+    }
+
+def _actor_descriptions():
+    from georgia_lynchings.reldata.models import Actor
+    return dict(Actor.objects.values_list('id', 'description'))
+
+def compute_graph(relations):
+    """
+    Builds and serializes the graph for any set of relations, for
+    combinations of filters that aren't precomputed.
+
+    :param relations:  :class:`~georgia_lynchings.reldata.models.Relation`
+        QuerySet with no incomplete relations.
+    """
+    rows = relations.values_list('subject', 'object').annotate(Count('id')).order_by()
+    pair_counts = dict(((subject, object), count) for subject, object, count in rows)
+    return json.dumps(_graph(_actor_descriptions(), pair_counts))
+
+def build_graph_data():
+    """
+    Builds the graph for all relations and for each action and stores them
+    in the cache.  Returns a dict of the serialized graphs keyed by action id
+    as a string, or :data:`ALL_ACTIONS`.
+    """
+    rows = _complete_relations().values_list('action', 'subject', 'object') \
+                                .annotate(Count('id')).order_by()
+    pair_counts = defaultdict(lambda: defaultdict(int))
+    for action, subject, object, count in rows:
+        pair_counts[str(action)][(subject, object)] += count
+        pair_counts[ALL_ACTIONS][(subject, object)] += count
+
+    actors = _actor_descriptions()
+    graphs = dict((action, json.dumps(_graph(actors, counts)))
+                  for action, counts in pair_counts.iteritems())
+    cache.set(GRAPH_CACHE_KEY, graphs, GRAPH_CACHE_TIMEOUT)
+    return graphs
+
+def get_graph_data(action=ALL_ACTIONS):
+    """
+    Returns the serialized graph for an action id, or for all actions by
+    default, building the graphs first if they aren't in the cache.  Actions
+    without any relations get an empty graph.
+    """
+    graphs = cache.get(GRAPH_CACHE_KEY)
+    if graphs is None:
+        graphs = build_graph_data()
+    return graphs.get(str(action), EMPTY_GRAPH)
+
+def _complete_relations():
+    from georgia_lynchings.reldata.models import Relation
+    return Relation.objects.filter(subject__isnull=False,
+                                   action__isnull=False,
+                                   object__isnull=False)
+
+def compute_facets(fields=None):
+    """
+    Counts the relations for every value of each filter field, along with
+    the total number of relations, in one aggregate query over the
+    relations plus one over the story summaries if any field needs them.
+
+    Returns a list with a dict for each field giving its ``label``,
+    ``http_name`` and ``values``.  The values are sorted by count, starting
+    with an entry for all relations with an empty ``value``, and each has a
+    ``label``, ``value`` and ``count``.
+
+    :param fields:  List of filter field definitions.  Defaults to
+        :data:`FILTER_FIELDS`.
+    """
+    from georgia_lynchings.lynchings.models import LynchingSummary
+    if fields is None:
+        fields = FILTER_FIELDS
+    story_fields = [field for field in fields if field.get('source') == 'story']
+    group_by = []
+    for field in fields:
+        if field not in story_fields:
+            group_by += [field['value_field'], field['label_field']]
+    if story_fields:
+        group_by.append('story_id')
+    rows = _complete_relations().values(*group_by).annotate(Count('id')).order_by()
+
+    stories = {}
+    if story_fields:
+        story_lookups = []
+        for field in story_fields:
+            story_lookups += [field['value_field'], field['label_field']]
+        for story in LynchingSummary.objects.values('lynching', *story_lookups):
+            stories[story['lynching']] = story
+
+    total = 0
+    counts = [defaultdict(int) for field in fields]
+    labels = [{} for field in fields]
+    for row in rows:
+        total += row['id__count']
+        story = stories.get(row.get('story_id'), {})
+        for field, field_counts, field_labels in zip(fields, counts, labels):
+            source = story if field in story_fields else row
+            value = source.get(field['value_field'])
+            if value is None:
+                continue
+            field_counts[value] += row['id__count']
+            field_labels[value] = source.get(field['label_field'])
+
+    facets = []
+    for field, field_counts, field_labels in zip(fields, counts, labels):
+        values = [{
+            'label': '%s (%d)' % (field_labels[value], count),
+            'value': value,
+            'count': count,
+        } for value, count in sorted(field_counts.iteritems())]
+        all_rels = {
+            'label': 'All (%d)' % (total,),
+            'value': '',
+            'count': total,
+        }
+        facets.append({
+            'label': field['field_label'],
+            'http_name': field['http_name'],
+            'values': sorted([all_rels] + values, key=lambda v:v['count'], reverse=True),
+        })
+    return facets
+
+def build_filter_facets():
+    """
+    Counts the values of :data:`FILTER_FIELDS` and stores them in the cache.
+    """
+    facets = compute_facets()
+    cache.set(FACETS_CACHE_KEY, facets, GRAPH_CACHE_TIMEOUT)
+    return facets
+
+def get_filter_facets():
+    """
+    Returns the counts of the values of :data:`FILTER_FIELDS`, as described
+    in :func:`compute_facets`, counting them first if they aren't in the
+    cache.
+    """
+    facets = cache.get(FACETS_CACHE_KEY)
+    if facets is None:
+        facets = build_filter_facets()
+    return facets
+
+def clear_graph_data():
+    """
+    Removes the graphs and filter counts from the cache so they are rebuilt
+    on the next request.
+    """
+    cache.delete_many([GRAPH_CACHE_KEY, FACETS_CACHE_KEY])
+
+def relations_changed():
+    """
+    Called by the signal handlers when relations, actors or actions are
+    saved or deleted, to clear the graphs unless updates are suspended.
+    """
+    if not _graph_updates_suspended:
+        clear_graph_data()
+
+@contextmanager
+def suspended_graph_updates():
+    """
+    Context manager for bulk changes to relations.  The graphs are cleared
+    once when the block completes rather than for every relation.
+    """
+    global _graph_updates_suspended
+    _graph_updates_suspended = True
+    try:
+        yield
+    finally:
+        _graph_updates_suspended = False
+    clear_graph_data()
@@ -0,0 +1,233 @@
+"""
+Benchmarks the relationship graph queries against a synthetic table of
+relations, first without and then with the composite indexes on Relation
+added in migration 0003.
+
+Randomly generated relations (a million by default) are loaded, the query
+plan and best timing of each query are reported for both sets of indexes,
+and the synthetic data is removed again.  The indexes are left as they were
+found.  The command refuses to run if there are already relations in the
+database, so run it against a scratch database set up with syncdb and
+migrate.
+
+Usage::
+
+    $ ./manage.py benchmark_relations
+    $ ./manage.py benchmark_relations --rows 100000 --repeat 5
+
+"""
+
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Count, Q
+from south.db import db
+
+from georgia_lynchings.reldata import models
+
+# Composite indexes created by migration 0003_add_relation_graph_indexes.
+INDEXES = [
+    ['action_id', 'subject_id', 'object_id'],
+    ['subject_id', 'object_id'],
+    ['subject_id', 'story_id'],
+    ['object_id', 'story_id'],
+]
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+class Command(BaseCommand):
+    help = 'Benchmark relationship graph queries with and without their indexes.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--rows',
+            dest='rows',
+            type='int',
+            default=1000000,
+            help='Number of synthetic relations to load.  Defaults to 1000000.'),
+        make_option('--actors',
+            dest='actors',
+            type='int',
+            default=300,
+            help='Number of synthetic actors.  Defaults to 300.'),
+        make_option('--actions',
+            dest='actions',
+            type='int',
+            default=20,
+            help='Number of synthetic actions.  Defaults to 20.'),
+        make_option('--stories',
+            dest='stories',
+            type='int',
+            default=5000,
+            help='Number of story ids to spread the relations across.  Defaults to 5000.'),
+        make_option('--repeat',
+            dest='repeat',
+            type='int',
+            default=3,
+            help='Number of times to run each query; the best time is reported.  Defaults to 3.'),
+        make_option('--batch-size',
+            dest='batch_size',
+            type='int',
+            default=100,
+            help='Number of relations to insert per query.  Defaults to 100.'),
+        make_option('--seed',
+            dest='seed',
+            type='int',
+            default=0,
+            help='Random seed for the synthetic data.'),
+    )
+
+    def handle(self, *args, **options):
+        if models.Relation.objects.exists():
+            raise CommandError('There are already relations in the database.  ' +
+                               'Run the benchmark against an empty database.')
+        self.verbosity = int(options['verbosity'])
+        self.repeat = max(options['repeat'], 1)
+        self.rng = random.Random(options['seed'])
+
+        actor_ids = self.create_labels(models.Actor, options['actors'])
+        action_ids = self.create_labels(models.Action, options['actions'])
+        try:
+            start_time = time.time()
+            self.load_relations(options['rows'], actor_ids, action_ids,
+                                options['stories'], options['batch_size'])
+            print 'Loaded %d relations in %.1fs' % \
+                (options['rows'], time.time() - start_time)
+
+            # the most common actor and action, like 'mob' in the real data
+            queries = self.query_shapes(actor_ids[0], action_ids[0])
+            originally_present = self.set_indexes(False)
+            try:
+                print '\n== Without composite indexes'
+                before = self.run_queries(queries)
+                self.set_indexes(True)
+                print '\n== With composite indexes'
+                after = self.run_queries(queries)
+            finally:
+                self.set_indexes(True)
+                self.drop_indexes([columns for columns in INDEXES
+                                   if columns not in originally_present])
+
+            print '\n== Summary'
+            for (name, qs), time_before, time_after in zip(queries, before, after):
+                print '%-20s %9.4fs %9.4fs  %6.1fx' % \
+                    (name, time_before, time_after, time_before / max(time_after, 1e-6))
+        finally:
+            self.remove_data(actor_ids, action_ids)
+
+    def create_labels(self, model, count):
+        '''Create synthetic actors or actions, returning their ids.'''
+        prefix = 'synthetic %s' % model._meta.object_name.lower()
+        model.objects.bulk_create([model(description='%s %d' % (prefix, i))
+                                   for i in range(count)])
+        return list(model.objects.filter(description__startswith=prefix)
+                                 .order_by('id').values_list('id', flat=True))
+
+    def skewed_choice(self, ids):
+        '''Pick an id, with a strong bias toward the start of the list so a
+        few actors and actions are much more common than the rest.'''
+        index = int(self.rng.expovariate(10.0 / len(ids)))
+        return ids[min(index, len(ids) - 1)]
+
+    def load_relations(self, rows, actor_ids, action_ids, stories, batch_size):
+        story_ids = range(1, stories + 1)
+        batch = []
+        for i in xrange(rows):
+            batch.append(models.Relation(
+                story_id=self.skewed_choice(story_ids) if i % 2 else
+                         self.rng.choice(story_ids),
+                event_id=i // 10,
+                sequence_id=i % 10,
+                triplet_id=i,
+                subject_id=self.skewed_choice(actor_ids),
+                action_id=self.skewed_choice(action_ids),
+                # some relations are incomplete, as in the imported data
+                object_id=self.skewed_choice(actor_ids) if i % 20 else None,
+            ))
+            if len(batch) >= batch_size:
+                models.Relation.objects.bulk_create(batch)
+                batch = []
+                if self.verbosity > 1 and i % 100000 < batch_size:
+                    print 'Loaded %d relations' % (i + 1)
+        if batch:
+            models.Relation.objects.bulk_create(batch)
+
+    def query_shapes(self, actor_id, action_id):
+        '''The queries run by the graph, filter and event lookup views.'''
+        complete = models.Relation.objects.filter(subject__isnull=False,
+                                                  action__isnull=False,
+                                                  object__isnull=False)
+        return [
+            ('graph (all)', complete.values_list('action', 'subject', 'object')
+                                    .annotate(Count('id')).order_by()),
+            ('graph (action)', complete.filter(action=action_id)
+                                       .values_list('subject', 'object')
+                                       .annotate(Count('id')).order_by()),
+            ('filter facets', complete.values('action', 'action__description')
+                                      .annotate(Count('id')).order_by()),
+            ('event lookup', complete.filter(Q(subject=actor_id) | Q(object=actor_id))
+                                     .values('story_id').annotate(Count('id'))
+                                     .order_by('-id__count', 'story_id')),
+        ]
+
+    def run_queries(self, queries):
+        '''Print the plan and best time of each query, returning the times.'''
+        times = []
+        for name, qs in queries:
+            sql, params = qs.query.sql_with_params()
+            cursor = connection.cursor()
+            prefix = EXPLAIN_PREFIX.get(connection.vendor, 'EXPLAIN ')
+            cursor.execute(prefix + sql, params)
+            plan = cursor.fetchall()
+
+            best = None
+            for i in range(self.repeat):
+                start_time = time.time()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                elapsed = time.time() - start_time
+                if best is None or elapsed < best:
+                    best = elapsed
+            times.append(best)
+
+            print '\n%s: %.4fs' % (name, best)
+            for row in plan:
+                print '    %s' % ' | '.join(unicode(col) for col in row)
+        return times
+
+    def set_indexes(self, present):
+        '''Create or drop the composite indexes.  Returns the indexes that
+        were changed; those already in the requested state are skipped.'''
+        changed = []
+        for columns in INDEXES:
+            db.start_transaction()
+            try:
+                if present:
+                    db.create_index(models.Relation._meta.db_table, columns)
+                else:
+                    db.delete_index(models.Relation._meta.db_table, columns)
+            except DatabaseError:
+                db.rollback_transaction()
+            else:
+                db.commit_transaction()
+                changed.append(columns)
+        return changed
+
+    def drop_indexes(self, indexes):
+        for columns in indexes:
+            db.start_transaction()
+            db.delete_index(models.Relation._meta.db_table, columns)
+            db.commit_transaction()
+
+    def remove_data(self, actor_ids, action_ids):
+        '''Delete the synthetic data without loading it into Python.'''
+        cursor = connection.cursor()
+        qn = connection.ops.quote_name
+        cursor.execute('DELETE FROM %s' % qn(models.Relation._meta.db_table))
+        transaction.commit_unless_managed()
+        models.Actor.objects.filter(id__in=actor_ids).delete()
+        models.Action.objects.filter(id__in=action_ids).delete()
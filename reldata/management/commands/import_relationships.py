@@ -16,11 +16,19 @@ This imports a CSV file in the following format:
 
 import csv
 import datetime
+import time
 from optparse import make_option
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.encoding import smart_unicode
 from georgia_lynchings.reldata import models
 from georgia_lynchings.lynchings.models import Story
+from georgia_lynchings.lynchings.responsecache import bump_data_generation, \
+    suspended_invalidation
+from georgia_lynchings.lynchings.stats import clear_site_stats
+from georgia_lynchings.reldata.graph import build_filter_facets, build_graph_data, \
+    suspended_graph_updates
 
 class Command(BaseCommand):
     help = 'Import relationship data from a CSV report file.'
@@ -30,28 +38,46 @@ class Command(BaseCommand):
         make_option('--wipe',
             action='store_true',
             help='Remove all existing relationships from the database before loading new ones'),
+        make_option('--batch-size',
+            dest='batch_size',
+            type='int',
+            default=100,
+            help='Number of relationships to insert per query.  Defaults to 100.'),
     )
 
     def handle(self, *args, **options):
         verbosity = int(options['verbosity'])
+        self.batch_size = options.get('batch_size') or 100
 
         # set input source before wiping: it seems rude to wipe the db if we
         # can't even open the input file
         self.set_input_source(args)
         skipped_header = self.in_csv.next()
 
-        if options['wipe']:
-            if verbosity > 1:
-                print 'Wiping existing relationships from database'
-            self.wipe_existing_relationships()
-
-        row_count = 0
-        for row in self.in_csv:
-            self.handle_row(row)
-            row_count += 1
+        start_time = time.time()
+        with transaction.commit_on_success(), suspended_graph_updates(), \
+                suspended_invalidation():
+            if options['wipe']:
+                if verbosity > 1:
+                    print 'Wiping existing relationships from database'
+                self.wipe_existing_relationships()
+
+            self.load_descriptions()
+            row_count = 0
+            for batch in self.batches(self.in_csv):
+                self.handle_batch(batch)
+                row_count += len(batch)
+                if verbosity > 1:
+                    print 'Loaded %d relationships (%s)' % \
+                        (row_count, self.throughput(row_count, start_time))
+        clear_site_stats()
+        build_graph_data()
+        build_filter_facets()
+        bump_data_generation()
 
         if verbosity > 1:
-            print 'Added %d new relationships' % (row_count,)
+            print 'Added %d new relationships (%s)' % \
+                (row_count, self.throughput(row_count, start_time))
 
     # field names in the order they appear in the input csv file. since
     # there's a one-to-one mapping between csv fields and Relationship
@@ -81,10 +107,85 @@ class Command(BaseCommand):
 
         models.Relation.objects.all().delete()
 
-    def handle_row(self, row):
+    def throughput(self, row_count, start_time):
+        'Format the number of rows handled per second since start_time.'
+        elapsed = time.time() - start_time
+        rate = row_count / elapsed if elapsed else 0
+        return '%.1f seconds, %d rows/second' % (elapsed, rate)
+
+    def batches(self, rows):
+        'Group input rows into lists of at most the configured batch size.'
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def description_key(self, description):
+        '''
+        Normalize a description for matching.  MySQL compares descriptions
+        without regard to case or trailing spaces, so "Mob" must find an
+        existing "mob" rather than be inserted as a duplicate of it.
+        '''
+        return description.lower().strip()
+
+    def load_descriptions(self):
+        '''
+        Load the ids of all existing :class:`~georgia_lynchings.reldata.models.Actor`
+        and :class:`~georgia_lynchings.reldata.models.Action` objects into
+        dictionaries keyed by normalized description.
+        '''
+        self.actor_ids = {}
+        self.action_ids = {}
+        # Descriptions may match more than one. Use the first, as get() would have.
+        for model, ids in ((models.Actor, self.actor_ids), (models.Action, self.action_ids)):
+            for description, id in model.objects.order_by('-id') \
+                                        .values_list('description', 'id'):
+                ids[self.description_key(description)] = id
+
+    def add_descriptions(self, model, ids, descriptions):
+        '''
+        Create any of the descriptions that aren't already in the ids
+        dictionary with a single bulk insert and add them to the dictionary.
+        '''
+        new = {}
+        for d in descriptions:
+            if d and self.description_key(d) not in ids:
+                new.setdefault(self.description_key(d), d)
+        if not new:
+            return
+        model.objects.bulk_create([model(description=d) for d in new.values()])
+        for description, id in model.objects.filter(description__in=new.values()) \
+                                            .values_list('description', 'id'):
+            ids.setdefault(self.description_key(description), id)
+
+    def handle_batch(self, rows):
+        '''
+        Handle a batch of CSV input rows as dictionaries: Create any actors
+        and actions that don't exist yet, then insert a
+        :class:`~georgia_lynchings.reldata.models.Relation` for each row.
+        '''
+        for row in rows:
+            for field in ('subject', 'action', 'object'):
+                row[field] = smart_unicode(row[field])
+        self.add_descriptions(models.Actor, self.actor_ids,
+            [row['subject'] for row in rows] + [row['object'] for row in rows])
+        self.add_descriptions(models.Action, self.action_ids,
+            [row['action'] for row in rows])
+        models.Relation.objects.bulk_create([self.make_relation(row) for row in rows])
+
+    def actor_id(self, description):
+        if not description:
+            return None
+        return self.actor_ids[self.description_key(description)]
+
+    def make_relation(self, row):
         '''
-        Handle a single row of CSV input as a dictionary: Parse its field
-        values, and create a :class:`~georgia_lynchings.reldata.models.Relationship
+        Parse the field values of a single row of CSV input, and return an
+        unsaved :class:`~georgia_lynchings.reldata.models.Relationship
         object representing the row.
         '''
 
@@ -94,13 +195,10 @@ class Command(BaseCommand):
             'sequence_id': int(row['sequence_id']),
             'triplet_id': int(row['triplet_id']),
 
-            'subject': models.Actor.objects.get_or_create(description=row['subject'])[0]
-                            if row['subject'] else None,
-            'action': models.Action.objects.get_or_create(description=row['action'])[0]
-                            if row['action'] else None,
-            'object': models.Actor.objects.get_or_create(description=row['object'])[0]
-                            if row['object'] else None,
+            'subject_id': self.actor_id(row['subject']),
+            'action_id': self.action_ids[self.description_key(row['action'])] \
+                if row['action'] else None,
+            'object_id': self.actor_id(row['object']),
         }
 
-        rel = models.Relation(**object_properties)
-        rel.save()
+        return models.Relation(**object_properties)
@@ -0,0 +1,92 @@
+"""
+Resolves the typed values of PC-ACE simplex fields directly from the CSV
+files exported by ``scripts/mdb2csv.sh``, without loading them into a
+triplestore, and either loads them into the
+:class:`~georgia_lynchings.reldata.models.SimplexValue` table, replacing any
+values already there, or writes them to a CSV file for bulk loading
+elsewhere.  See :mod:`georgia_lynchings.reldata.simplex` for the details.
+
+Usage::
+
+    $ ./manage.py import_simplex <csv directory>
+    $ ./manage.py import_simplex <csv directory> --csv simplex_values.csv
+
+"""
+
+import csv
+import os
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.encoding import smart_str, smart_unicode
+
+from georgia_lynchings.lynchings.responsecache import bump_data_generation, \
+    suspended_invalidation
+from georgia_lynchings.reldata import models
+from georgia_lynchings.reldata.simplex import simplex_values, VALUE_FIELDS
+
+class Command(BaseCommand):
+    help = 'Resolve simplex values from the PC-ACE CSV export into a table or CSV file.'
+    args = "<csv directory>"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--csv',
+            dest='csv',
+            help='Write the values to this CSV file instead of the database.'),
+        make_option('--batch-size',
+            dest='batch_size',
+            type='int',
+            default=1000,
+            help='Number of values to insert per query.  Defaults to 1000.'),
+    )
+
+    def handle(self, *args, **options):
+        if not args or not os.path.isdir(args[0]):
+            raise CommandError('Specify the directory of CSV files exported by mdb2csv.sh.')
+        verbosity = int(options['verbosity'])
+        start_time = time.time()
+        values = simplex_values(args[0])
+        if options['csv']:
+            count = self.write_csv(values, options['csv'])
+        else:
+            count = self.load_values(values, max(options['batch_size'], 1))
+            bump_data_generation()
+        if verbosity > 0:
+            print 'Resolved %d simplex values in %.1f seconds' % \
+                (count, time.time() - start_time)
+
+    def write_csv(self, values, filename):
+        count = 0
+        with open(filename, 'wb') as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(VALUE_FIELDS)
+            for value in values:
+                writer.writerow(['' if value[field] is None else smart_str(value[field])
+                                 for field in VALUE_FIELDS])
+                count += 1
+        return count
+
+    def load_values(self, values, batch_size):
+        '''
+        Replace the :class:`~georgia_lynchings.reldata.models.SimplexValue`
+        objects in the database, in a single transaction.
+        '''
+        count = 0
+        with transaction.commit_on_success(), suspended_invalidation():
+            models.SimplexValue.objects.all().delete()
+            batch = []
+            for value in values:
+                if value['text_value'] is not None:
+                    value['text_value'] = smart_unicode(value['text_value'])
+                value['field_name'] = smart_unicode(value['field_name'])
+                batch.append(models.SimplexValue(**value))
+                if len(batch) >= batch_size:
+                    models.SimplexValue.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                models.SimplexValue.objects.bulk_create(batch)
+                count += len(batch)
+        return count
@@ -0,0 +1,69 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+    
+    def forwards(self, orm):
+        
+        # Adding index on 'Relation', fields ['story_id']
+        db.create_index('reldata_relation', ['story_id'])
+
+        # Adding index on 'Relation', fields ['action', 'subject', 'object']
+        db.create_index('reldata_relation', ['action_id', 'subject_id', 'object_id'])
+
+        # Adding index on 'Relation', fields ['subject', 'object']
+        db.create_index('reldata_relation', ['subject_id', 'object_id'])
+
+        # Adding index on 'Relation', fields ['subject', 'story_id']
+        db.create_index('reldata_relation', ['subject_id', 'story_id'])
+
+        # Adding index on 'Relation', fields ['object', 'story_id']
+        db.create_index('reldata_relation', ['object_id', 'story_id'])
+    
+    
+    def backwards(self, orm):
+        
+        # Removing index on 'Relation', fields ['object', 'story_id']
+        db.delete_index('reldata_relation', ['object_id', 'story_id'])
+
+        # Removing index on 'Relation', fields ['subject', 'story_id']
+        db.delete_index('reldata_relation', ['subject_id', 'story_id'])
+
+        # Removing index on 'Relation', fields ['subject', 'object']
+        db.delete_index('reldata_relation', ['subject_id', 'object_id'])
+
+        # Removing index on 'Relation', fields ['action', 'subject', 'object']
+        db.delete_index('reldata_relation', ['action_id', 'subject_id', 'object_id'])
+
+        # Removing index on 'Relation', fields ['story_id']
+        db.delete_index('reldata_relation', ['story_id'])
+    
+    
+    models = {
+        'reldata.action': {
+            'Meta': {'object_name': 'Action'},
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '80'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'reldata.actor': {
+            'Meta': {'object_name': 'Actor'},
+            'description': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'reldata.relation': {
+            'Meta': {'object_name': 'Relation'},
+            'action': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['reldata.Action']", 'null': 'True', 'blank': 'True'}),
+            'event_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'relations_as_object'", 'null': 'True', 'to': "orm['reldata.Actor']"}),
+            'sequence_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'story_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'subject': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'relations_as_subject'", 'null': 'True', 'to': "orm['reldata.Actor']"}),
+            'triplet_id': ('django.db.models.fields.PositiveIntegerField', [], {})
+        }
+    }
+    
+    complete_apps = ['reldata']
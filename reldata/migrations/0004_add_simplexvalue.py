@@ -0,0 +1,74 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+    
+    def forwards(self, orm):
+        
+        # Adding model 'SimplexValue'
+        db.create_table('reldata_simplexvalue', (
+            ('subject_type', self.gf('django.db.models.fields.CharField')(max_length=8)),
+            ('text_value', self.gf('django.db.models.fields.TextField')(null=True, blank=True)),
+            ('subject_id', self.gf('django.db.models.fields.PositiveIntegerField')(db_index=True)),
+            ('datetime_value', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('field_id', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('number_value', self.gf('django.db.models.fields.FloatField')(null=True, blank=True)),
+            ('date_value', self.gf('django.db.models.fields.DateField')(null=True, blank=True)),
+            ('value_type', self.gf('django.db.models.fields.PositiveSmallIntegerField')()),
+            ('simplex_id', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('field_name', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('boolean_value', self.gf('django.db.models.fields.NullBooleanField')(null=True, blank=True)),
+        ))
+        db.send_create_signal('reldata', ['SimplexValue'])
+    
+    
+    def backwards(self, orm):
+        
+        # Deleting model 'SimplexValue'
+        db.delete_table('reldata_simplexvalue')
+    
+    
+    models = {
+        'reldata.action': {
+            'Meta': {'object_name': 'Action'},
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '80'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'reldata.actor': {
+            'Meta': {'object_name': 'Actor'},
+            'description': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'reldata.relation': {
+            'Meta': {'object_name': 'Relation'},
+            'action': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['reldata.Action']", 'null': 'True', 'blank': 'True'}),
+            'event_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'relations_as_object'", 'null': 'True', 'to': "orm['reldata.Actor']"}),
+            'sequence_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'story_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'subject': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'relations_as_subject'", 'null': 'True', 'to': "orm['reldata.Actor']"}),
+            'triplet_id': ('django.db.models.fields.PositiveIntegerField', [], {})
+        },
+        'reldata.simplexvalue': {
+            'Meta': {'object_name': 'SimplexValue'},
+            'boolean_value': ('django.db.models.fields.NullBooleanField', [], {'null': 'True', 'blank': 'True'}),
+            'date_value': ('django.db.models.fields.DateField', [], {'null': 'True', 'blank': 'True'}),
+            'datetime_value': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'field_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'field_name': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'number_value': ('django.db.models.fields.FloatField', [], {'null': 'True', 'blank': 'True'}),
+            'simplex_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'subject_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'subject_type': ('django.db.models.fields.CharField', [], {'max_length': '8'}),
+            'text_value': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'value_type': ('django.db.models.fields.PositiveSmallIntegerField', [], {})
+        }
+    }
+    
+    complete_apps = ['reldata']
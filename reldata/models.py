@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from georgia_lynchings.lynchings.models import Story
+from georgia_lynchings.reldata.graph import relations_changed
 
 class Actor(models.Model):
     """
@@ -26,8 +29,13 @@ class Relation(models.Model):
     A relationship between a subject, action, and object in input
     relationship data. Includes links to story and PC-ACE identifiers for
     context.
+
+    Migration 0003 adds composite indexes for the graph and event lookup
+    queries on (action, subject, object), (subject, object),
+    (subject, story_id) and (object, story_id); see the
+    ``benchmark_relations`` command.
     """
-    story_id = models.PositiveIntegerField()
+    story_id = models.PositiveIntegerField(db_index=True)
     event_id = models.PositiveIntegerField()
     sequence_id = models.PositiveIntegerField()
     triplet_id = models.PositiveIntegerField()
@@ -43,3 +51,60 @@ class Relation(models.Model):
             (self.__class__.__name__,
              self.subject.description if self.subject else None,
              self.object.description if self.object else None)
+
+
+class SimplexValue(models.Model):
+    """
+    The typed value of a PC-ACE simplex field for a complex or document,
+    resolved from the CSV export by the ``import_simplex`` command (see
+    :mod:`georgia_lynchings.reldata.simplex`).  Only the value field for
+    the field's ``value_type`` is set.
+    """
+    SUBJECT_TYPE_CHOICES = (
+        ('complex', 'Complex'),
+        ('document', 'Document'),
+    )
+    VALUE_TYPE_CHOICES = (
+        (1, 'Text'),
+        (2, 'Number'),
+        (3, 'Date'),
+        (4, 'Boolean'),
+        (5, 'Date and time'),
+    )
+
+    subject_type = models.CharField(max_length=8, choices=SUBJECT_TYPE_CHOICES)
+    subject_id = models.PositiveIntegerField(db_index=True)
+    simplex_id = models.PositiveIntegerField()
+    field_id = models.PositiveIntegerField()
+    field_name = models.CharField(max_length=255)
+    value_type = models.PositiveSmallIntegerField(choices=VALUE_TYPE_CHOICES)
+
+    text_value = models.TextField(null=True, blank=True)
+    number_value = models.FloatField(null=True, blank=True)
+    date_value = models.DateField(null=True, blank=True)
+    datetime_value = models.DateTimeField(null=True, blank=True)
+    boolean_value = models.NullBooleanField()
+
+    @property
+    def value(self):
+        'The value of whichever type the field has.'
+        for field in ('text_value', 'number_value', 'date_value',
+                      'datetime_value', 'boolean_value'):
+            value = getattr(self, field)
+            if value is not None:
+                return value
+
+    def __repr__(self):
+        return '<%s: %s %d %r=%r>' % \
+            (self.__class__.__name__, self.subject_type, self.subject_id,
+             self.field_name, self.value)
+
+# Signal handlers to drop the precomputed graphs when the relations change.
+@receiver(post_save, sender=Relation)
+@receiver(post_delete, sender=Relation)
+@receiver(post_save, sender=Actor)
+@receiver(post_delete, sender=Actor)
+@receiver(post_save, sender=Action)
+@receiver(post_delete, sender=Action)
+def relation_data_changed(sender, **kwargs):
+    relations_changed()
@@ -0,0 +1,166 @@
+"""
+Typed simplex values resolved directly from the PC-ACE CSV export.
+
+In the PC-ACE database the values of simplex fields are stored indirectly:
+each ``data_Simplex`` row gives a field (its ``SimplexType``, a row of
+``setup_Simplex``) and a ``refValue``, which is looked up in
+``data_SimplexText``, ``data_SimplexNumber`` or ``data_SimplexDate``
+depending on the ``ValueType`` of the field, or is itself the value for
+boolean fields.  The ``data_xref_Simplex-Complex`` and
+``data_xref_Simplex-Simplex-Document`` tables then link the simplex to the
+complex or document it describes.
+
+These are the same joins the ``setup-queries/0001-simplex-properties.rq``
+updates make in the triplestore, done here with hash joins in memory over
+the CSV files written by ``scripts/mdb2csv.sh``: the lookup tables are read
+into dictionaries keyed by id and ``data_Simplex`` is streamed past them,
+so a full export is resolved in seconds.  The values are written to a CSV
+file or loaded into :class:`~georgia_lynchings.reldata.models.SimplexValue`
+by the ``import_simplex`` command.
+"""
+
+from collections import defaultdict
+import csv
+import datetime
+import os
+
+# setup_Simplex ValueType codes
+TEXT, NUMBER, DATE, BOOLEAN, DATETIME = 1, 2, 3, 4, 5
+
+# The lookup table holding the values of each ValueType.  Boolean values
+# are stored directly in data_Simplex.refValue.
+VALUE_TABLES = {
+    TEXT: 'data_SimplexText',
+    NUMBER: 'data_SimplexNumber',
+    DATE: 'data_SimplexDate',
+    DATETIME: 'data_SimplexDate',
+}
+
+# Tables linking simplexes to the complex or document they describe, with
+# the column holding the subject's id.
+SUBJECT_TABLES = [
+    ('complex', 'data_xref_Simplex-Complex', 'Complex'),
+    ('document', 'data_xref_Simplex-Simplex-Document', 'Document'),
+]
+
+# Columns of the output, matching the fields of SimplexValue.
+VALUE_FIELDS = ['subject_type', 'subject_id', 'simplex_id', 'field_id',
+                'field_name', 'value_type', 'text_value', 'number_value',
+                'date_value', 'datetime_value', 'boolean_value']
+
+# The xsd:boolean lexical forms for true.  The boolean simplex update takes
+# the effective boolean value of the refValue as an xsd:boolean, which is
+# false for anything else, including values that aren't valid booleans.
+TRUE_VALUES = ('true', '1')
+
+def read_table(csv_dir, table):
+    """
+    Yields the rows of a table exported by mdb2csv.sh as dicts keyed by
+    column name.  A table that wasn't exported has no rows.
+    """
+    path = os.path.join(csv_dir, table + '.csv')
+    if not os.path.exists(path):
+        return
+    with open(path, 'rU') as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield row
+
+def parse_datetime(value):
+    """
+    Parses a data_SimplexDate value, like ``01/02/89 00:00:00``.  Access
+    exports two-digit years, which strptime puts in 1969-2068; as in
+    csv2rdf.py they are moved back a century.  Returns None for values that
+    can't be parsed.
+    """
+    try:
+        parsed = datetime.datetime.strptime(value, '%m/%d/%y %H:%M:%S')
+        return parsed.replace(year=parsed.year - 100)
+    except ValueError:
+        return None
+
+def _text(value):
+    return value
+
+def _number(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def _boolean(value):
+    return value in TRUE_VALUES
+
+def _date(value):
+    parsed = parse_datetime(value)
+    return parsed.date() if parsed else None
+
+# Converts a looked up value for each ValueType, and the field of the
+# output it goes in.
+CONVERTERS = {
+    TEXT: (_text, 'text_value'),
+    NUMBER: (_number, 'number_value'),
+    DATE: (_date, 'date_value'),
+    BOOLEAN: (_boolean, 'boolean_value'),
+    DATETIME: (parse_datetime, 'datetime_value'),
+}
+
+def _lookup_table(csv_dir, table):
+    return dict((row['ID'], row['Value']) for row in read_table(csv_dir, table))
+
+def simplex_values(csv_dir):
+    """
+    Yields a dict with the keys in :data:`VALUE_FIELDS` for each value of a
+    simplex field of a complex or document.  Simplexes that aren't linked to
+    anything, reference missing values, or have values that can't be
+    converted to their type are skipped, as they are by the triplestore
+    updates.
+
+    :param csv_dir:  Directory of CSV files written by mdb2csv.sh.
+    """
+    fields = dict((row['ID'], (int(row['ValueType']), row['Name']))
+                  for row in read_table(csv_dir, 'setup_Simplex'))
+
+    subjects = defaultdict(list)
+    for subject_type, table, column in SUBJECT_TABLES:
+        for row in read_table(csv_dir, table):
+            subjects[row['Simplex']].append((subject_type, int(row[column])))
+
+    # each value table is read once, even if several types use it
+    tables = {}
+    lookups = {}
+    for value_type, table in VALUE_TABLES.items():
+        if table not in tables:
+            tables[table] = _lookup_table(csv_dir, table)
+        lookups[value_type] = tables[table]
+
+    for row in read_table(csv_dir, 'data_Simplex'):
+        field = fields.get(row['SimplexType'])
+        linked = subjects.get(row['ID'])
+        if field is None or not linked:
+            continue
+        value_type, field_name = field
+        if value_type not in CONVERTERS:
+            continue
+        if value_type in lookups:
+            raw_value = lookups[value_type].get(row['refValue'])
+            if raw_value is None:
+                continue
+        else:
+            raw_value = row['refValue']
+        convert, value_field = CONVERTERS[value_type]
+        value = convert(raw_value)
+        if value is None:
+            continue
+
+        for subject_type, subject_id in linked:
+            result = dict.fromkeys(VALUE_FIELDS)
+            result.update({
+                'subject_type': subject_type,
+                'subject_id': subject_id,
+                'simplex_id': int(row['ID']),
+                'field_id': int(row['SimplexType']),
+                'field_name': field_name,
+                'value_type': value_type,
+                value_field: value,
+            })
+            yield result
@@ -229,22 +229,27 @@ function set_sidebar_event_dom(events) {
   if (typeof node === 'undefined') { return; }
 
   var node_data = d3.select(node).datum();
+  var results = events.results;
   var times = (node_data.value == 1) ? 'time' : 'times';
-  var stories = (events.length == 1) ? 'story' : 'stories';
+  var stories = (events.total == 1) ? 'story' : 'stories';
   var html = '<p><em>' + node_data.name + '</em> appears as an actor ' +
              'description ' + node_data.value + ' ' + times + ' in the ' +
-             'following ' + events.length + ' ' + stories + ':</p>';
+             'following ' + events.total + ' ' + stories + ':</p>';
   html += '<ul class="stories">';
-  for (i in events) {
-    var matches = (events[i].appearances == 1) ? 'match' : 'matches'
-    var ev_html = '<li><a href="' + events[i].url + '">' +
-                  events[i].name + '</a> ' +
+  for (i in results) {
+    var matches = (results[i].appearances == 1) ? 'match' : 'matches'
+    var ev_html = '<li><a href="' + results[i].url + '">' +
+                  results[i].name + '</a> ' +
                   '<span class="match_count">(' +
-                    events[i].appearances + ' ' + matches +
+                    results[i].appearances + ' ' + matches +
                   ')</span></li>';
     html += ev_html;
   }
   html += '</ul>';
+  if (events.total > results.length) {
+    html += '<p>Showing the ' + results.length + ' stories with the most ' +
+            'matches.</p>';
+  }
 
   $("#graph_infobar_content").html(html);
 }
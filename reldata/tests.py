@@ -1,10 +1,30 @@
+import csv
+import datetime
 import json
+import os
+import shutil
+from StringIO import StringIO
+import sys
+import tempfile
+
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+
+from georgia_lynchings.reldata import models
+from georgia_lynchings.lynchings.models import LynchingSummary, Victim
+from georgia_lynchings.reldata.graph import clear_graph_data, compute_facets, \
+    get_graph_data
 
 class GraphViewTest(TestCase):
     fixtures = ['test_lynchings', 'test_reldata']
 
+    def setUp(self):
+        clear_graph_data()
+
+    def tearDown(self):
+        clear_graph_data()
+
     def test_filters(self):
         response = self.client.get(reverse('relations:graph'))
         self.assertEqual(response.status_code, 200)
@@ -35,10 +55,40 @@ class GraphViewTest(TestCase):
         self.assertEqual(values[3]['value'], 3)
         self.assertEqual(values[3]['count'], 1)
 
+        # the counts are kept for later requests
+        with self.assertNumQueries(0):
+            self.client.get(reverse('relations:graph'))
+
+    def test_facets(self):
+        for story_id, year in [(1, 1890), (2, 1899), (3, 1890)]:
+            Victim.objects.create(lynching_id=story_id, date=datetime.date(year, 5, 1))
+        fields = [
+            {'field_label': 'Subject', 'http_name': 'subject',
+             'value_field': 'subject', 'label_field': 'subject__description'},
+            {'field_label': 'Year', 'http_name': 'year', 'source': 'story',
+             'value_field': 'earliest_year', 'label_field': 'earliest_year'},
+        ]
+        # one query over the relations and one for the stories
+        with self.assertNumQueries(2):
+            facets = compute_facets(fields)
+        self.assertEqual(['subject', 'year'], [facet['http_name'] for facet in facets])
+        for facet in facets:
+            self.assertEqual('All (6)', facet['values'][0]['label'])
+        subjects = dict((v['value'], v['count']) for v in facets[0]['values'])
+        self.assertEqual({'': 6, 1: 2, 2: 2, 3: 2}, subjects)
+        years = [(v['label'], v['count']) for v in facets[1]['values']]
+        self.assertEqual([('All (6)', 6), ('1890 (3)', 3), ('1899 (3)', 3)], years)
+
 
 class GraphDataViewTest(TestCase):
     fixtures = ['test_lynchings', 'test_reldata']
 
+    def setUp(self):
+        clear_graph_data()
+
+    def tearDown(self):
+        clear_graph_data()
+
     def test_basic_structure(self):
         response = self.client.get(reverse('relations:graph_data'))
         self.assertEqual(response.status_code, 200)
@@ -139,6 +189,36 @@ class GraphDataViewTest(TestCase):
         self.assertEqual(data['nodes'][links[1]['source']]['actor_id'], 3)
         self.assertEqual(data['nodes'][links[1]['target']]['actor_id'], 2)
 
+    def test_precomputed(self):
+        url = reverse('relations:graph_data')
+        self.client.get(url)
+        # every action is built along with the full graph
+        with self.assertNumQueries(0):
+            for action in ['', '1', '2', '3']:
+                response = self.client.get(url, {'action': action})
+                self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(1, sum(link['value'] for link in data['links']))
+
+    def test_updates(self):
+        url = reverse('relations:graph_data')
+        total = lambda: sum(link['value'] for link in json.loads(self.client.get(url).content)['links'])
+        before = total()
+        relation = models.Relation.objects.filter(subject__isnull=False, object__isnull=False)[0]
+        relation.pk = None
+        relation.save()
+        self.assertEqual(before + 1, total())
+        relation.delete()
+        self.assertEqual(before, total())
+        relation.subject.description = 'renamed actor'
+        relation.subject.save()
+        names = [node['name'] for node in json.loads(self.client.get(url).content)['nodes']]
+        self.assertTrue('renamed actor' in names)
+
+    def test_unknown_action(self):
+        response = self.client.get(reverse('relations:graph_data'), {'action': 99})
+        self.assertEqual({'nodes': [], 'links': []}, json.loads(response.content))
+
 
 class EventViewTest(TestCase):
     fixtures = ['test_lynchings', 'test_reldata']
@@ -148,15 +228,19 @@ class EventViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['content-type'], 'application/json')
         data = json.loads(response.content)
+        self.assertEqual(3, data['total'])
+        self.assertEqual(0, data['offset'])
+        self.assertTrue('limit' in data)
 
-        self.assertTrue('url' in data[0])
-        self.assertTrue('name' in data[0])
-        self.assertTrue(data[0]['name'].startswith('Lynching of '))
-        self.assertTrue('appearances' in data[0])
+        results = data['results']
+        self.assertTrue('url' in results[0])
+        self.assertTrue('name' in results[0])
+        self.assertTrue(results[0]['name'].startswith('Lynching of '))
+        self.assertTrue('appearances' in results[0])
 
     def test_participant_only(self):
         response = self.client.get(reverse('relations:event_lookup'), {'participant': 3})
-        data = json.loads(response.content)
+        data = json.loads(response.content)['results']
 
         self.assertEqual(len(data), 3)
 
@@ -172,7 +256,7 @@ class EventViewTest(TestCase):
     def test_filter_action(self):
         response = self.client.get(reverse('relations:event_lookup'),
                                    {'participant': 3, 'action': 2})
-        data = json.loads(response.content)
+        data = json.loads(response.content)['results']
 
         self.assertEqual(len(data), 2)
 
@@ -181,3 +265,238 @@ class EventViewTest(TestCase):
 
         self.assertEqual(data[1]['url'], reverse('lynchings:lynching_detail', args=[3]))
         self.assertEqual(data[1]['appearances'], 1)
+
+    def test_pagination(self):
+        url = reverse('relations:event_lookup')
+        response = self.client.get(url, {'participant': 3, 'offset': 1, 'limit': 1})
+        data = json.loads(response.content)
+        self.assertEqual(3, data['total'])
+        self.assertEqual(1, len(data['results']))
+        self.assertEqual(reverse('lynchings:lynching_detail', args=[1]),
+                         data['results'][0]['url'])
+
+        response = self.client.get(url, {'participant': 3, 'limit': 10000})
+        self.assertEqual(100, json.loads(response.content)['limit'])
+
+        response = self.client.get(url, {'participant': 3, 'offset': 'x'})
+        self.assertEqual(400, response.status_code)
+
+    def test_query_count(self):
+        # count, page and names, whatever the number of stories
+        with self.assertNumQueries(3):
+            self.client.get(reverse('relations:event_lookup'), {'participant': 2})
+
+    def test_missing_summary(self):
+        LynchingSummary.objects.filter(lynching=2).delete()
+        response = self.client.get(reverse('relations:event_lookup'), {'participant': 3})
+        data = json.loads(response.content)['results']
+        self.assertTrue(data[0]['name'].startswith('Lynching of '))
+
+
+class ImportRelationshipsTest(TestCase):
+    fixtures = ['test_reldata']
+
+    rows = [
+        ['story_id', 'event_id', 'sequence_id', 'triplet_id', 'subject', 'action', 'object'],
+        ['1', '10', '1', '100', 'police', 'threat', 'mob'],
+        ['1', '10', '2', '101', 'mob', 'violence against people', 'citizens'],
+        ['2', '11', '1', '102', 'mob', 'arrest', ''],
+    ]
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'wb') as csv_file:
+            csv.writer(csv_file).writerows(self.rows)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_import(self):
+        call_command('import_relationships', self.filename, wipe=True,
+                     batch_size=2, verbosity=0)
+        self.assertEqual(3, models.Relation.objects.count())
+        # existing actors and actions are reused; new ones are created once
+        self.assertEqual(4, models.Actor.objects.count())
+        self.assertEqual(4, models.Action.objects.count())
+
+        rel = models.Relation.objects.get(triplet_id=100)
+        self.assertEqual(1, rel.subject.id)
+        self.assertEqual(2, rel.action.id)
+        self.assertEqual('mob', rel.object.description)
+        rel = models.Relation.objects.get(triplet_id=102)
+        self.assertEqual('mob', rel.subject.description)
+        self.assertEqual('arrest', rel.action.description)
+        self.assertEqual(None, rel.object)
+
+    def test_import_matches_case(self):
+        with open(self.filename, 'ab') as csv_file:
+            csv.writer(csv_file).writerows([
+                ['2', '11', '2', '103', 'Mob', 'Arrest', 'Citizens '],
+                ['2', '11', '3', '104', 'POLICE', 'arrest', 'Sheriff'],
+                ['2', '11', '4', '105', 'sheriff', 'arrest', ''],
+            ])
+        call_command('import_relationships', self.filename, wipe=True,
+                     batch_size=4, verbosity=0)
+        self.assertEqual(6, models.Relation.objects.count())
+        # only the sheriff is new
+        self.assertEqual(5, models.Actor.objects.count())
+        self.assertEqual(4, models.Action.objects.count())
+        rel = models.Relation.objects.get(triplet_id=103)
+        self.assertEqual('mob', rel.subject.description)
+        self.assertEqual('arrest', rel.action.description)
+        self.assertEqual(1, models.Relation.objects.get(triplet_id=104).subject.id)
+        self.assertEqual(models.Relation.objects.get(triplet_id=104).object,
+                         models.Relation.objects.get(triplet_id=105).subject)
+
+    def test_import_builds_graph(self):
+        get_graph_data() # cache the graph of the fixture data
+        call_command('import_relationships', self.filename, wipe=True,
+                     verbosity=0)
+        with self.assertNumQueries(0):
+            data = json.loads(get_graph_data())
+        self.assertEqual(['police', 'citizens', 'mob'],
+                         [node['name'] for node in data['nodes']])
+        self.assertEqual(2, len(data['links']))
+        clear_graph_data()
+
+
+class BenchmarkRelationsTest(TransactionTestCase):
+    # creating and dropping indexes commits the transaction on sqlite
+
+    def test_benchmark(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('benchmark_relations', rows=500, actors=10, actions=3,
+                         stories=20, repeat=1, verbosity=0)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue('Loaded 500 relations' in output)
+        for name in ['graph (all)', 'graph (action)', 'filter facets', 'event lookup']:
+            self.assertEqual(3, output.count(name), msg=name)
+        # the synthetic data is removed
+        self.assertEqual(0, models.Relation.objects.count())
+        self.assertEqual(0, models.Actor.objects.count())
+
+    def test_existing_relations(self):
+        models.Relation.objects.create(story_id=1, event_id=1, sequence_id=1, triplet_id=1)
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            # call_command reports the CommandError and exits
+            self.assertRaises(SystemExit, call_command, 'benchmark_relations', rows=10)
+            self.assertTrue('already relations' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+
+class ExportRelationsTest(TestCase):
+    fixtures = ['test_reldata']
+
+    def test_csv(self):
+        response = self.client.get(reverse('relations:export_relations', args=['csv']))
+        self.assertEqual(200, response.status_code)
+        rows = list(csv.reader(response.content.splitlines()))
+        # the same format as import_relationships reads
+        self.assertEqual(ImportRelationshipsTest.rows[0], rows[0])
+        self.assertEqual(7, len(rows))
+        self.assertEqual(['1', '139841', '100009', '139963', 'police',
+                          'violence against people', 'citizens'], rows[1])
+
+    def test_ndjson(self):
+        response = self.client.get(reverse('relations:export_relations', args=['ndjson']))
+        rows = [json.loads(line) for line in response.content.splitlines()]
+        self.assertEqual(6, len(rows))
+        self.assertEqual('police', rows[0]['subject'])
+        self.assertEqual(139963, rows[0]['triplet_id'])
+
+
+class ImportSimplexTest(TestCase):
+
+    tables = {
+        'setup_Simplex': [
+            ['ID', 'Name', 'ValueType', 'Locked'],
+            ['1', 'Victim name', '1', '0'],
+            ['2', 'Victim age', '2', '0'],
+            ['3', 'Date of event', '3', '0'],
+            ['4', 'Confirmed', '4', '0'],
+        ],
+        'data_Simplex': [
+            ['ID', 'SimplexType', 'refValue', 'Locked'],
+            ['10', '1', '100', '0'],
+            ['11', '2', '200', '0'],
+            ['12', '3', '300', '0'],
+            ['13', '4', '1', '0'],
+            ['14', '1', '999', '0'], # missing text value
+            ['15', '1', '100', '0'], # not linked to anything
+        ],
+        'data_SimplexText': [
+            ['ID', 'Value'],
+            ['100', 'Sam Hose'],
+        ],
+        'data_SimplexNumber': [
+            ['ID', 'Value'],
+            ['200', '21'],
+        ],
+        'data_SimplexDate': [
+            ['ID', 'Value'],
+            ['300', '04/23/99 00:00:00'],
+        ],
+        'data_xref_Simplex-Complex': [
+            ['xrefID', 'Simplex', 'Complex', 'Order'],
+            ['1', '10', '500', '1'],
+            ['2', '11', '500', '1'],
+            ['3', '12', '501', '1'],
+            ['4', '14', '500', '1'],
+        ],
+        'data_xref_Simplex-Simplex-Document': [
+            ['xrefID', 'Simplex', 'Document', 'Order'],
+            ['1', '10', '42', '1'],
+            ['2', '13', '42', '1'],
+        ],
+    }
+
+    def setUp(self):
+        self.csv_dir = tempfile.mkdtemp()
+        for table, rows in self.tables.items():
+            with open(os.path.join(self.csv_dir, table + '.csv'), 'wb') as csv_file:
+                csv.writer(csv_file).writerows(rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.csv_dir)
+
+    def test_import(self):
+        models.SimplexValue.objects.create(subject_type='complex', subject_id=1,
+            simplex_id=1, field_id=1, field_name='old', value_type=1)
+        call_command('import_simplex', self.csv_dir, batch_size=2, verbosity=0)
+        # existing values are replaced
+        self.assertEqual(5, models.SimplexValue.objects.count())
+
+        values = models.SimplexValue.objects.filter(subject_type='complex', subject_id=500)
+        self.assertEqual({'Victim name': u'Sam Hose', 'Victim age': 21.0},
+                         dict((v.field_name, v.value) for v in values))
+        date_value = models.SimplexValue.objects.get(subject_id=501)
+        self.assertEqual(datetime.date(1899, 4, 23), date_value.date_value)
+        self.assertEqual(None, date_value.text_value)
+
+        # a simplex linked to a complex and a document gives a value for each
+        document_values = models.SimplexValue.objects.filter(subject_type='document')
+        self.assertEqual(set([(10, u'Sam Hose'), (13, True)]),
+                         set((v.simplex_id, v.value) for v in document_values))
+
+    def test_csv(self):
+        handle, filename = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        try:
+            call_command('import_simplex', self.csv_dir, csv=filename, verbosity=0)
+            with open(filename) as csv_file:
+                rows = list(csv.DictReader(csv_file))
+        finally:
+            os.remove(filename)
+        self.assertEqual(0, models.SimplexValue.objects.count())
+        self.assertEqual(5, len(rows))
+        row = [r for r in rows if r['field_name'] == 'Date of event'][0]
+        self.assertEqual('1899-04-23', row['date_value'])
+        self.assertEqual('3', row['value_type'])
+        self.assertEqual('', row['text_value'])
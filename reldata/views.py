@@ -6,54 +6,20 @@ from django.db.models import Count, Q
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
 
-from georgia_lynchings.lynchings.models import Story, Lynching
+from georgia_lynchings.lynchings.export import chunks, export_response
+from georgia_lynchings.lynchings.models import Story, Lynching, LynchingSummary
 from georgia_lynchings.reldata import models
-
-FILTER_FIELDS = [
-    {
-        'field_label': 'Type of Interaction',
-        'http_name': 'action',
-        'value_field': 'action',
-        'label_field': 'action__description',
-    },
-]
+from georgia_lynchings.reldata.graph import ALL_ACTIONS, FILTER_FIELDS, \
+    compute_graph, get_filter_facets, get_graph_data
 
 def graph(request):
     '''Display a force-directed graph showing relationships between types of
     people.
     '''
-
-    rel_qs = models.Relation.objects.filter(subject__isnull=False,
-                                            action__isnull=False,
-                                            object__isnull=False)
-
-    filters = []
-    for field in FILTER_FIELDS:
-        value_data = rel_qs.values(field['value_field'], field['label_field'])\
-                           .annotate(Count('id'))
-        raw_values = [{
-            'label': '%s (%d)' % (v[field['label_field']],
-                                  v['id__count']),
-            'value': v[field['value_field']],
-            'count': v['id__count'],
-        } for v in value_data]
-        all_rels = {
-            'label': 'All (%d)' % (len(rel_qs),),
-            'value': '',
-            'count': len(rel_qs),
-        }
-        values = sorted([all_rels] + raw_values, key=lambda v:v['count'], reverse=True)
-        filter = {
-            'label': field['field_label'],
-            'http_name': field['http_name'],
-            'values': values,
-        }
-        filters.append(filter)
-
     return render(request, 'reldata/graph.html', {
             'data_url': reverse('relations:graph_data'),
             'event_url': reverse('relations:event_lookup'),
-            'filters': filters,
+            'filters': get_filter_facets(),
         })
 
 def wordcloud(request):
@@ -75,45 +41,56 @@ def filtered_relation_query(request):
                                             object__isnull=False)
     for field in FILTER_FIELDS:
         value = request.GET.get(field['http_name'], '')
-        if value:
+        if value and field.get('source') == 'story':
+            stories = LynchingSummary.objects.filter(**{field['value_field']: value})
+            rel_qs = rel_qs.filter(story_id__in=stories.values('lynching'))
+        elif value:
             rel_qs = rel_qs.filter(**{field['value_field']: value})
     return rel_qs
 
 def graph_data(request):
-    '''Collect data for a (force-directed) relationship graph from available
-    :class:`~georgia_lynchings.reldata.models.Relation` data.
+    '''Serve data for a (force-directed) relationship graph from available
+    :class:`~georgia_lynchings.reldata.models.Relation` data, optionally
+    filtered.  The graphs for each action are precomputed; see
+    :mod:`georgia_lynchings.reldata.graph`.
     '''
-    rel_qs = filtered_relation_query(request)
-    subjects = rel_qs.values('subject').annotate(Count('id'))
-    subjects_dict = {subj['subject']: subj['id__count'] for subj in subjects}
-    objects = rel_qs.values('object').annotate(Count('id'))
-    objects_dict = {obj['object']: obj['id__count'] for obj in objects}
-
-    actors = models.Actor.objects.order_by('id')
-    raw_nodes = [{
-        'name': actor.description,
-        'value': subjects_dict.get(actor.id, 0) + \
-                 objects_dict.get(actor.id, 0),
-        'actor_id': actor.id,
-    } for actor in actors]
-    nodes = [n for n in raw_nodes if n['value']]
-    node_dict = {n['actor_id']: (n, i) for i, n in enumerate(nodes)}
-
-    pairs = rel_qs.values('subject', 'object').annotate(Count('id'))
-    links = [{
-        'source': node_dict[pair['subject']][1],
-        'source_id': node_dict[pair['subject']][0]['actor_id'],
-        'target': node_dict[pair['object']][1],
-        'target_id': node_dict[pair['object']][0]['actor_id'],
-        'value': pair['id__count'],
-    } for pair in pairs.order_by('subject', 'object')]
-
-    result = {
-        'nodes': nodes,
-        'links': links,
-    }
-    result_s = json.dumps(result)
-    return HttpResponse(result_s, content_type='application/json')
+    other_filters = [field for field in FILTER_FIELDS
+                     if field['http_name'] != 'action' and request.GET.get(field['http_name'])]
+    if other_filters:
+        data = compute_graph(filtered_relation_query(request))
+    else:
+        data = get_graph_data(request.GET.get('action', ALL_ACTIONS))
+    return HttpResponse(data, content_type='application/json')
+
+
+# Same columns as the import_relationships input file.
+RELATION_FIELDS = ['story_id', 'event_id', 'sequence_id', 'triplet_id',
+                   'subject', 'action', 'object']
+
+def relation_rows():
+    '''Yield a dict for each relation with the descriptions of its subject,
+    action and object.
+    '''
+    relations = models.Relation.objects.values('id', 'story_id', 'event_id',
+            'sequence_id', 'triplet_id', 'subject__description',
+            'action__description', 'object__description')
+    for chunk in chunks(relations):
+        for rel in chunk:
+            yield OrderedDict([
+                ('story_id', rel['story_id']),
+                ('event_id', rel['event_id']),
+                ('sequence_id', rel['sequence_id']),
+                ('triplet_id', rel['triplet_id']),
+                ('subject', rel['subject__description']),
+                ('action', rel['action__description']),
+                ('object', rel['object__description']),
+            ])
+
+def export_relations(request, format):
+    '''Stream every relation as a CSV or newline-delimited JSON download.
+    The CSV can be loaded again with the ``import_relationships`` command.
+    '''
+    return export_response(relation_rows(), RELATION_FIELDS, format, 'relations')
 
 
 def cloud_data(request):
@@ -127,33 +104,64 @@ def cloud_data(request):
     return HttpResponse(json.dumps(data), content_type='application/json')
 
 
+EVENTS_PER_PAGE = 25
+MAX_EVENTS_PER_PAGE = 100
+
+def _story_names(story_ids):
+    '''Get the display name of each lynching story, keyed by id, from the
+    :class:`~georgia_lynchings.lynchings.models.LynchingSummary` table,
+    falling back to the lynchings themselves for any summary that hasn't
+    been built.
+    '''
+    names = dict(LynchingSummary.objects.filter(lynching__in=story_ids)
+                                        .values_list('lynching', 'display'))
+    missing = [story_id for story_id in story_ids if story_id not in names]
+    if missing:
+        for lynching in Lynching.objects.with_summary().filter(id__in=missing):
+            names[lynching.id] = "%s" % lynching # Use the string method.
+    return names
+
 def event_lookup(request):
     '''Look up lynching stories and instance counts for relations matching
-    query terms.
+    query terms.  Stories are returned a page at a time, most appearances
+    first; ``offset`` and ``limit`` (up to :data:`MAX_EVENTS_PER_PAGE`)
+    select the page, and ``total`` gives the number of matching stories.
     '''
     if 'participant' not in request.GET:
         msg = "Event search requires search terms. Current recognized " + \
               "search terms are: participant"
         return HttpResponseBadRequest(msg)
-    participant = int(request.GET.get('participant'))
+    try:
+        participant = int(request.GET.get('participant'))
+        offset = int(request.GET.get('offset', 0))
+        limit = int(request.GET.get('limit', EVENTS_PER_PAGE))
+    except ValueError:
+        return HttpResponseBadRequest("participant, offset and limit must be integers")
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), MAX_EVENTS_PER_PAGE)
 
     qs = filtered_relation_query(request)
     qs = qs.filter(Q(subject=participant) |
                    Q(object=participant))
+    qs = qs.filter(story_id__in=Lynching.objects.values('id'))
     rel_data = qs.values('story_id') \
-                 .annotate(Count('id'))
-
-    lynching_data = []
-    for rel in rel_data:
-        try:
-            lynching = Lynching.objects.get(id=rel['story_id'])
-            lynching_data.append({
-                'url': reverse('lynchings:lynching_detail', args=[lynching.id,]),
-                'name': "%s" % lynching, # Use the string method.
-                'appearances': rel['id__count'],
-                })
-        except Lynching.DoesNotExist:
-            pass
-    sorted_data = sorted(lynching_data, key=lambda s:s['appearances'], reverse=True)
-    return HttpResponse(json.dumps(sorted_data),
+                 .annotate(Count('id')) \
+                 .order_by('-id__count', 'story_id')
+
+    total = rel_data.count()
+    page = list(rel_data[offset:offset + limit])
+    names = _story_names([rel['story_id'] for rel in page])
+    lynching_data = [{
+        'url': reverse('lynchings:lynching_detail', args=[rel['story_id'],]),
+        'name': names[rel['story_id']],
+        'appearances': rel['id__count'],
+    } for rel in page]
+
+    result = {
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'results': lynching_data,
+    }
+    return HttpResponse(json.dumps(result),
                         content_type='application/json')
@@ -2,7 +2,17 @@
 
 '''Convert project CSV files to RDF.
 
-Usage: csv2rdf.py file.csv ...
+Usage: csv2rdf.py [-j jobs] [-i] [-f ttl|nt] [-z] [-s size] file.csv ...
+
+  -j, --jobs N       convert up to N files at once in separate processes
+  -i, --incremental  write each file's output to a fixed name, replacing any
+                     earlier output, and skip input files that haven't
+                     changed since they were last converted
+  -f, --format FMT   write turtle (ttl, the default) or N-Triples (nt)
+  -z, --gzip         gzip the output files
+  -s, --chunk-size SIZE
+                     split each file's output into files of about SIZE
+                     bytes (e.g. 50M), named like name.part0001.nt
 
 Another script, mdb2csv.sh, exports Georgia Lynchings data from a PC-ACE MS
 Access relational database to CSV files. csv2rdf.py converts those CSV files
@@ -19,14 +29,33 @@ translating the value according to file-specific and column-specific code in
 the script. The URIs of the Row class, all properties, and all individual
 Row objects are defined here within a namespace derived from the source
 file's name.
+
+Each file is converted independently, so with ``--jobs`` large dumps are
+split across processes. In incremental mode a ``.sha1`` file is kept next to
+each output file recording the input file (and converter script) it was
+generated from, so re-running the conversion over a full dump only converts
+the tables that have changed.
+
+Loading a large turtle file into a triplestore takes memory in proportion to
+the size of the file. N-Triples output has one statement per line with
+absolute URIs, so it can be split into chunks (each turtle chunk repeats the
+@base and @prefix header instead) and loaded one chunk at a time with
+upload-ttl.sh.
 '''
 
 import csv
 import datetime
+import glob
+import gzip
+import hashlib
 import os
 import re
 import sys
 import urllib
+import urlparse
+from cStringIO import StringIO
+from multiprocessing import Pool
+from optparse import OptionParser
 
 URI_BASE = 'http://galyn.example.com/source_data_files/'
 '''The base URI for the source files we're creating. This is defined in
@@ -41,6 +70,122 @@ def uri_from_path(fpath, base=None):
     dirname, fname = os.path.split(fpath)
     return base + fname
 
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+
+OUTPUT_FORMATS = {
+    'ttl': '.ttl',
+    'nt': '.nt',
+}
+'''File extensions of the supported output formats: turtle and N-Triples.'''
+
+def output_extension(format, compress=False):
+    '''The file extension for an output format, with ``.gz`` added for
+    compressed output.'''
+    ext = OUTPUT_FORMATS[format]
+    if compress:
+        ext += '.gz'
+    return ext
+
+def existing_output_files(out_base, ext):
+    '''List the output files already present for an output filename
+    (without its extension), including any numbered chunks.'''
+    return sorted(glob.glob(out_base + ext) +
+                  glob.glob(out_base + '.part[0-9]*' + ext))
+
+def parse_size(size):
+    '''Parse a size in bytes, optionally with a K, M or G suffix.'''
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    size = size.strip().upper()
+    if size and size[-1] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+def resolve_uri(base, uri):
+    '''Resolve a URI reference against a base URI. Unlike
+    :func:`urlparse.urljoin`, this keeps empty fragments, as used in
+    namespaces like ``<setup_Complex.csv#>``.'''
+    path, hash, fragment = uri.partition('#')
+    return urlparse.urljoin(base, path) + hash + fragment
+
+class ChunkedOutput(object):
+    '''File-like object for converter output, optionally compressed and
+    split into chunks of about ``chunk_size`` bytes. A new chunk is only
+    started at the end of a row (see :meth:`end_row`), and each chunk starts
+    with the output of the ``header`` function, if any, so that every
+    chunk can be parsed on its own.
+
+    Chunks are written to temporary files that are only moved into place
+    by :meth:`close`.'''
+
+    def __init__(self, out_base, ext, compress=False, chunk_size=None,
+                 header=None):
+        self.out_base = out_base
+        self.ext = ext
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.header = header
+        self.fnames = []
+        self.softspace = 0
+        self._raw = self._file = None
+        self._size = 0
+
+    def chunk_filename(self, index):
+        if not self.chunk_size:
+            return self.out_base + self.ext
+        return '%s.part%04d%s' % (self.out_base, index + 1, self.ext)
+
+    def _open_chunk(self):
+        fname = self.chunk_filename(len(self.fnames))
+        self.fnames.append(fname)
+        self._raw = open(fname + '.tmp', 'wb')
+        if self.compress:
+            # fixed mtime so that unchanged input gives identical output
+            self._file = gzip.GzipFile(os.path.basename(fname), 'wb',
+                                       fileobj=self._raw, mtime=0)
+        else:
+            self._file = self._raw
+        self._size = 0
+        if self.header is not None:
+            self.header(self)
+
+    def _close_chunk(self):
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
+        self._raw = self._file = None
+
+    def write(self, data):
+        if self._file is None:
+            self._open_chunk()
+        self._file.write(data)
+        self._size += len(data)
+
+    def end_row(self):
+        '''Mark the end of a row, starting a new chunk for the next row if
+        the current one is full.'''
+        if self.chunk_size and self._size >= self.chunk_size:
+            self._close_chunk()
+
+    def close(self):
+        '''Finish the output, moving the chunks into place. Returns the
+        list of output filenames.'''
+        if not self.fnames:
+            # no rows: still output a (header only) file
+            self._open_chunk()
+        if self._file is not None:
+            self._close_chunk()
+        for fname in self.fnames:
+            os.rename(fname + '.tmp', fname)
+        return self.fnames
+
+    def discard(self):
+        '''Abandon the output, removing any partial chunks.'''
+        if self._file is not None:
+            self._close_chunk()
+        for fname in self.fnames:
+            if os.path.exists(fname + '.tmp'):
+                os.remove(fname + '.tmp')
+
 class Converter(object):
     '''Base class for file-specific CSV to RDF converters. This class
     contains the basic shared logic for reading a CSV file and outputting
@@ -56,34 +201,61 @@ class Converter(object):
     this object.
     '''
 
-    def process_file(self, in_fname):
-        'Process a single CSV file into turtle (TTL) RDF.'
+    def process_file(self, in_fname, out_fname=None, format='ttl',
+                     compress=False, chunk_size=None):
+        '''Process a single CSV file into turtle (``ttl``) or N-Triples
+        (``nt``) RDF, optionally gzip-compressed. If no output filename is
+        given, one is generated with :meth:`make_output_filename`.
+
+        If ``chunk_size`` is given, the output is split into files of about
+        that many (uncompressed) bytes, named like ``<name>.part0001.nt``,
+        each of which can be loaded on its own. Rows are never split across
+        files. Returns the list of output filenames.'''
         self.in_uri = uri_from_path(in_fname)
-        out_fname = self.make_output_filename(in_fname)
-        with open(in_fname) as inf, open(out_fname, 'w') as outf:
-            reader = csv.reader(inf)
-            row_iter = iter(reader)
-            columns = row_iter.next()
-            
-            print >>outf, '@base <%s> .' % (self.in_uri,)
-            self.output_prefixes(outf)
-
-            for row in row_iter:
-                self.process_row(outf, row, columns)
-
-    def make_output_filename(self, in_fname):
+        self.format = format
+        ext = output_extension(format, compress)
+        if out_fname is None:
+            out_fname = self.make_output_filename(in_fname, ext)
+        if format == 'nt':
+            self.namespaces = self.declared_namespaces()
+            header = None
+        else:
+            header = self.output_header
+        outf = ChunkedOutput(out_fname[:-len(ext)], ext, compress=compress,
+                             chunk_size=chunk_size, header=header)
+        try:
+            with open(in_fname) as inf:
+                reader = csv.reader(inf)
+                row_iter = iter(reader)
+                columns = row_iter.next()
+
+                writers = self.compile_columns(columns)
+                for row in row_iter:
+                    self.process_row(outf, row, writers)
+                    outf.end_row()
+        except:
+            outf.discard()
+            raise
+        return outf.close()
+
+    def make_output_filename(self, in_fname, out_ext='.ttl'):
         '''Generate an output filename from an input filename, adding
         numeric suffixes to make sure the output file doesn't overwrite any
         files already present in the filesystem.'''
         in_base, ext = os.path.splitext(in_fname)
-        out_ext = '.ttl'
         out_fname = in_base + out_ext
         i = 0
-        while os.path.exists(out_fname):
+        while existing_output_files(out_fname[:-len(out_ext)], out_ext):
             i += 1
             out_fname = '%s.%d%s' % (in_base, i, out_ext)
         return out_fname
 
+    def output_header(self, outf):
+        '''Output the TTL @base and @prefix statements that start each
+        turtle file.'''
+        print >>outf, '@base <%s> .' % (self.in_uri,)
+        self.output_prefixes(outf)
+
     def output_prefixes(self, outf):
         '''Empty hook for subclasses to outuput necessary TTL @prefix
         statements at the beginning of the output file. Subclasses that use
@@ -91,19 +263,96 @@ class Converter(object):
         define those prefixes.'''
         pass
 
-    def process_row(self, outf, row, columns):
-        # row[0] is always ID
-        print >>outf, '<#r%s> a <#Row>' % (row[0],),
-        for prop, val in zip(columns, row):
-            output = getattr(self, 'output_' + prop, self.output_property)
+    PREFIX_DECLARATION = re.compile(r'^@prefix\s+(\w*):\s*<([^>]*)>\s*\.\s*$', re.M)
+    def declared_namespaces(self):
+        '''Collect the namespaces declared by :meth:`output_prefixes` as a
+        dict of absolute URIs keyed by prefix, for expanding prefixed names
+        in N-Triples output.'''
+        buf = StringIO()
+        self.output_prefixes(buf)
+        return dict((prefix, resolve_uri(self.in_uri, uri))
+                    for prefix, uri in self.PREFIX_DECLARATION.findall(buf.getvalue()))
+
+    TTL_LITERAL = re.compile(r'^(?:"""(.*)"""|"(.*)")(?:\^\^(\S+))?$', re.S)
+    def expand_term(self, term):
+        '''Translate a TTL-encoded value, as returned by the encode methods,
+        to N-Triples: prefixed names and relative URIs are made absolute,
+        and literals are put on a single line.'''
+        if term.startswith('"'):
+            match = self.TTL_LITERAL.match(term)
+            text, long_text, datatype = match.group(2), match.group(1), match.group(3)
+            if long_text is not None:
+                text = long_text
+            text = text.replace('"', '\\"') \
+                       .replace('\n', '\\n') \
+                       .replace('\r', '\\r')
+            if datatype:
+                return '"%s"^^%s' % (text, self.expand_term(datatype))
+            return '"%s"' % (text,)
+        if term.startswith('<'):
+            return '<%s>' % (resolve_uri(self.in_uri, term[1:-1]),)
+        prefix, local = term.split(':', 1)
+        return '<%s%s>' % (self.namespaces[prefix], local)
+
+    def compile_columns(self, columns):
+        '''Look up the function that writes each column of the file, once
+        per file rather than once per value. Returns a list of functions
+        taking the output file and the value for that column.
+
+        Columns with an ``output_<fieldname>`` method are written with that
+        method. Otherwise the column's ``encode_<fieldname>`` method (or
+        :meth:`encode`) is bound into a writer for the property.'''
+        writers = []
+        for prop in columns:
+            output = getattr(self, 'output_' + prop, None)
+            if output is not None:
+                writers.append(self._bind_output(output, prop))
+            else:
+                encode = getattr(self, 'encode_' + prop, self.encode)
+                writers.append(self._property_writer(prop, encode))
+        return writers
+
+    def _bind_output(self, output, prop):
+        def write(outf, val):
             output(outf, prop, val)
-        print >>outf, '.'
+        return write
+
+    def _property_writer(self, prop, encode):
+        if self.format == 'nt':
+            predicate = ' <%s#%s> ' % (self.in_uri, prop)
+            expand = self.expand_term
+            def write(outf, val):
+                encoded = encode(val)
+                if encoded is not None:
+                    outf.write(self.subject + predicate + expand(encoded) + ' .\n')
+        else:
+            prefix = ' ;\n   <#%s> ' % (prop,)
+            def write(outf, val):
+                encoded = encode(val)
+                if encoded is not None:
+                    outf.write(prefix + encoded)
+        return write
+
+    def process_row(self, outf, row, writers):
+        # row[0] is always ID
+        if self.format == 'nt':
+            self.subject = '<%s#r%s>' % (self.in_uri, row[0])
+            outf.write('%s <%s> <%s#Row> .\n' % (self.subject, RDF_TYPE, self.in_uri))
+            for write, val in zip(writers, row):
+                write(outf, val)
+        else:
+            outf.write('<#r%s> a <#Row>' % (row[0],))
+            for write, val in zip(writers, row):
+                write(outf, val)
+            outf.write(' .\n')
 
     def output_property(self, outf, prop, val):
         encode = getattr(self, 'encode_' + prop, self.encode)
-        encoded = encode(val)
-        if encoded is not None:
-            print >>outf, ';\n   <#%s> %s' % (prop, encoded),
+        self._property_writer(prop, encode)(outf, val)
+
+    def output_term(self, outf, prop, term):
+        '''Output a property whose value is already TTL-encoded.'''
+        self._property_writer(prop, lambda val: val)(outf, term)
 
     NORMALIZE_NAME = re.compile('[^_A-Za-z0-9]+')
     def normalize_name_for_uri(self, name):
@@ -438,8 +687,8 @@ class Converter_setup_Complex(Converter):
         # do default property processing
         self.output_property(outf, prop, val)
         # and then also add an alternate spelling
-        print >>outf, ';\n   <#Name-URI> scxn:%s' % \
-                (self.normalize_name_for_uri(val),),
+        self.output_term(outf, 'Name-URI',
+                         'scxn:' + self.normalize_name_for_uri(val))
 
 
 class Converter_setup_Document(Converter):
@@ -459,8 +708,8 @@ class Converter_setup_Simplex(Converter):
         # do default property processing
         self.output_property(outf, prop, val)
         # and then also add an alternate spelling
-        print >>outf, ';\n   <#Name-URI> ssxn:%s' % \
-                (self.normalize_name_for_uri(val),),
+        self.output_term(outf, 'Name-URI',
+                         'ssxn:' + self.normalize_name_for_uri(val))
 
     def encode_ValueType(self, val):
         # TODO: Find a more meaningful way to encode the actual meaning of
@@ -489,8 +738,8 @@ class Converter_setup_xref_Complex_Complex(Converter):
         # do default property processing
         self.output_property(outf, prop, val)
         # and then also add an alternate spelling
-        print >>outf, ';\n   <#Name-URI> sxcxcxn:%s' % \
-                (self.normalize_name_for_uri(val),),
+        self.output_term(outf, 'Name-URI',
+                         'sxcxcxn:' + self.normalize_name_for_uri(val))
 
     def encode_HigherComplex(self, val):
         if val != '-1':
@@ -582,14 +831,124 @@ def converter_for_filename(fname):
     converter_name = 'Converter_' + basename.replace('-', '_')
     return globals().get(converter_name, Converter)
 
-def convert_file(fname):
+def convert_file(fname, out_fname=None, **output):
     '''Convert a single file by name, using the appropriate
-    :class:`Converter` according to the filename.'''
+    :class:`Converter` according to the filename. Output options are passed
+    on to :meth:`Converter.process_file`. Returns the list of output
+    files.'''
     dirpart, filepart = os.path.split(fname)
     ConverterClass = converter_for_filename(filepart)
     converter = ConverterClass()
-    converter.process_file(fname)
-            
+    return converter.process_file(fname, out_fname, **output)
+
+def file_digest(fname):
+    '''Return the SHA-1 hex digest of the contents of a file.'''
+    sha1 = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), ''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+SCRIPT_DIGEST = file_digest(os.path.splitext(__file__)[0] + '.py')
+'''Digest of this script, recorded along with each input file digest so
+that changes to the converters also cause files to be converted again.'''
+
+def fixed_output_filename(in_fname, ext='.ttl'):
+    '''The output filename used in incremental mode: the input filename
+    with its extension replaced.'''
+    in_base, in_ext = os.path.splitext(in_fname)
+    return in_base + ext
+
+def source_digest(fname, output):
+    '''Identify the input file contents, the version of this script and the
+    output options a file is converted with.'''
+    options = ' '.join('%s=%s' % item for item in sorted(output.items()))
+    return '%s %s %s' % (file_digest(fname), SCRIPT_DIGEST, options)
+
+def is_current(out_fname, digest):
+    '''Check whether the output for a file was generated from the current
+    contents of the input file by the current version of this script, with
+    the same options, and that all of its output files are still there. The
+    ``.sha1`` file records the digest on its first line followed by the
+    names of the output files.'''
+    try:
+        with open(out_fname + '.sha1') as f:
+            lines = f.read().splitlines()
+    except IOError:
+        return False
+    dirname = os.path.dirname(out_fname)
+    return len(lines) > 1 and lines[0] == digest and \
+        all(os.path.exists(os.path.join(dirname, name)) for name in lines[1:])
+
+def _convert_task(task):
+    '''Convert a file in a worker process. When a digest is given, any
+    output files left from a previous conversion that weren't replaced are
+    removed, and the digest is recorded.'''
+    fname, out_fname, digest, output = task
+    out_fnames = convert_file(fname, out_fname, **output)
+    if digest is not None:
+        ext = output_extension(output['format'], output['compress'])
+        for stale in existing_output_files(out_fname[:-len(ext)], ext):
+            if stale not in out_fnames:
+                os.remove(stale)
+        with open(out_fname + '.sha1', 'w') as f:
+            f.write(digest + '\n')
+            for name in out_fnames:
+                f.write(os.path.basename(name) + '\n')
+    return fname, out_fnames
+
+def convert_files(fnames, jobs=1, incremental=False, format='ttl',
+                  compress=False, chunk_size=None):
+    '''Convert a list of files, up to ``jobs`` at a time. In incremental
+    mode the output for each file replaces any previous output, and files
+    that haven't changed since they were last converted are skipped.
+    Returns a list of (input filename, output filenames) pairs for the files
+    that were converted.'''
+    output = {'format': format, 'compress': compress, 'chunk_size': chunk_size}
+    tasks = []
+    for fname in fnames:
+        if incremental:
+            out_fname = fixed_output_filename(fname,
+                                              output_extension(format, compress))
+            digest = source_digest(fname, output)
+            if is_current(out_fname, digest):
+                print >>sys.stderr, 'Skipping unchanged %s' % (fname,)
+                continue
+            tasks.append((fname, out_fname, digest, output))
+        else:
+            tasks.append((fname, None, None, output))
+
+    # start the largest files first so they don't hold up the end of the run
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+    if jobs > 1 and len(tasks) > 1:
+        pool = Pool(jobs)
+        try:
+            return pool.map(_convert_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return map(_convert_task, tasks)
+
 if __name__ == '__main__':
-    for fname in sys.argv[1:]:
-        convert_file(fname)
+    parser = OptionParser(usage='%prog [-j jobs] [-i] [-f ttl|nt] [-z] [-s size] file.csv ...')
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='number of files to convert at once')
+    parser.add_option('-i', '--incremental', action='store_true', default=False,
+                      help='overwrite earlier output and skip unchanged files')
+    parser.add_option('-f', '--format', type='choice', default='ttl',
+                      choices=sorted(OUTPUT_FORMATS.keys()),
+                      help='output format: ttl (turtle, the default) or nt (N-Triples)')
+    parser.add_option('-z', '--gzip', dest='compress', action='store_true',
+                      default=False, help='gzip the output files')
+    parser.add_option('-s', '--chunk-size', metavar='SIZE',
+                      help='split the output into files of about SIZE bytes (e.g. 50M)')
+    options, args = parser.parse_args()
+    chunk_size = None
+    if options.chunk_size:
+        try:
+            chunk_size = parse_size(options.chunk_size)
+        except ValueError:
+            parser.error('invalid chunk size: %s' % (options.chunk_size,))
+    convert_files(args, jobs=max(options.jobs, 1),
+                  incremental=options.incremental, format=options.format,
+                  compress=options.compress, chunk_size=chunk_size)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+'''Run the setup-queries inference rules against a local triplestore.
+
+Usage: run-setup-queries.py [-q file.rq ...] [-s store_dir] [-o inferred.nq] file.ttl ...
+
+  -q, --query FILE   run the SPARQL updates in FILE (may be repeated);
+                     defaults to all of the setup-queries/*.rq files
+  -s, --store DIR    keep the statements in an on-disk (Sleepycat) store in
+                     DIR instead of in memory. A store that has already been
+                     loaded can be reused by giving no RDF files.
+  -o, --output FILE  write the inferred statements to FILE as N-Quads
+                     (gzipped if FILE ends with .gz)
+
+add-inferred-statements.sh runs the SPARQL Update statements in
+setup-queries against a live Sesame repository. This script runs the same
+statements locally with rdflib, against the turtle or N-Triples files
+written by csv2rdf.py (gzipped or split into chunks or not), so the rules
+can be timed and tuned without a server. Each file is loaded into the same
+graph context upload-ttl.sh would use, so the rules see the same data they
+would in Sesame.
+
+Each .rq file is split into its separate update operations, and the time
+each one takes and the number of statements it adds are reported. The
+inferred statements (the ``constructed_statements`` graphs) can be written
+out as N-Quads and bulk loaded into Sesame in place of running
+add-inferred-statements.sh, e.g.::
+
+  curl -T inferred.nq -X POST -H 'Content-Type: text/x-nquads' \\
+       http://host:port/openrdf-sesame/repositories/my_repo/statements
+
+Requires rdflib 4.0 or later.
+'''
+
+import glob
+import gzip
+import os
+import re
+import time
+from optparse import OptionParser
+
+try:
+    import rdflib
+except ImportError:
+    rdflib = None
+
+CONTEXT_ROOT = 'http://galyn.example.com/source_data_files/'
+'''The URI root of the graph contexts the source files are loaded into.
+This must match the context root used by upload-ttl.sh.'''
+
+INFERRED_ROOT = 'http://galyn.example.com/constructed_statements/'
+'''The URI root of the graph contexts the setup queries insert into.'''
+
+QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, 'setup-queries')
+
+RDF_FORMATS = {
+    '.ttl': 'turtle',
+    '.nt': 'nt',
+}
+
+def context_for_filename(fname):
+    '''Derive the graph context URI for an RDF file the same way
+    upload-ttl.sh does: all chunks of a file share the context of the whole
+    file, named with .ttl whatever the format.'''
+    base = os.path.basename(fname)
+    if base.endswith('.gz'):
+        base = base[:-len('.gz')]
+    base = os.path.splitext(base)[0]
+    base = re.sub(r'\.part[0-9]*$', '', base)
+    return CONTEXT_ROOT + base + '.ttl'
+
+def rdf_format(fname):
+    '''Look up the rdflib parser format for an RDF file by its extension.'''
+    if fname.endswith('.gz'):
+        fname = fname[:-len('.gz')]
+    ext = os.path.splitext(fname)[1]
+    return RDF_FORMATS[ext]
+
+def open_graph(store_dir=None):
+    '''Open the graph to load data into, in memory or in an on-disk store.'''
+    if store_dir is None:
+        return rdflib.ConjunctiveGraph()
+    graph = rdflib.ConjunctiveGraph('Sleepycat')
+    graph.open(store_dir, create=not os.path.exists(store_dir))
+    return graph
+
+def load_files(graph, fnames):
+    '''Load RDF files into their graph contexts. Returns the number of
+    statements loaded.'''
+    total = 0
+    for fname in fnames:
+        context = graph.get_context(rdflib.URIRef(context_for_filename(fname)))
+        before = len(context)
+        if fname.endswith('.gz'):
+            f = gzip.open(fname, 'rb')
+        else:
+            f = open(fname, 'rb')
+        try:
+            context.parse(file=f, format=rdf_format(fname))
+        finally:
+            f.close()
+        total += len(context) - before
+    return total
+
+PROLOGUE_LINE = re.compile(r'^\s*(BASE|PREFIX)\b', re.I)
+def parse_updates(fname):
+    '''Split a file of SPARQL updates into its separate operations. Returns
+    the prologue (BASE and PREFIX declarations) shared by the operations,
+    and a list of (label, operation) pairs. An operation is labeled with its
+    file and position, and with the comment just before it when that is a
+    single line, like "# Text simplex statements".
+
+    Operations are separated by ``;`` at the end of a line outside of any
+    braces, as in the files in setup-queries.'''
+    name = os.path.basename(fname)
+    prologue = []
+    operations = []
+    lines = []
+    comments = [] # the last block of comment lines before an operation
+    comment_break = False
+    depth = 0
+    with open(fname) as f:
+        for line in f:
+            stripped = line.strip()
+            if not lines:
+                if stripped.startswith('#'):
+                    if comment_break:
+                        comments = []
+                        comment_break = False
+                    comments.append(stripped.lstrip('#').strip())
+                    continue
+                if not stripped:
+                    comment_break = True
+                    continue
+                if PROLOGUE_LINE.match(line):
+                    prologue.append(line)
+                    continue
+            elif stripped.startswith('#'):
+                continue
+            lines.append(line)
+            depth += stripped.count('{') - stripped.count('}')
+            if depth == 0 and stripped.endswith(';'):
+                lines[-1] = line.rstrip()[:-1] + '\n'
+                operations.append((_label(name, len(operations), comments),
+                                   ''.join(lines)))
+                lines = []
+                comments = []
+                comment_break = False
+    if ''.join(lines).strip():
+        operations.append((_label(name, len(operations), comments),
+                           ''.join(lines)))
+    return ''.join(prologue), operations
+
+def _label(name, index, comments):
+    label = '%s:%d' % (name, index + 1)
+    if len(comments) == 1:
+        label += ' (%s)' % (comments[0],)
+    return label
+
+def inferred_contexts(graph):
+    return [context for context in graph.contexts()
+            if unicode(context.identifier).startswith(INFERRED_ROOT)]
+
+def count_inferred(graph):
+    return sum(len(context) for context in inferred_contexts(graph))
+
+def run_updates(graph, query_files):
+    '''Run each update operation in the query files, printing the time each
+    takes and the number of statements it adds. Returns a list of (label,
+    seconds, statements added) tuples.'''
+    results = []
+    for fname in query_files:
+        prologue, operations = parse_updates(fname)
+        for label, operation in operations:
+            before = count_inferred(graph)
+            start_time = time.time()
+            graph.update(prologue + operation)
+            elapsed = time.time() - start_time
+            added = count_inferred(graph) - before
+            print '%-60s %9.3fs %9d statements' % (label, elapsed, added)
+            results.append((label, elapsed, added))
+    return results
+
+def write_inferred(graph, fname):
+    '''Write the statements in the inferred graph contexts as N-Quads,
+    sorted so that the same data always gives the same file. Returns the
+    number of statements written.'''
+    quads = []
+    for context in inferred_contexts(graph):
+        graph_term = context.identifier.n3()
+        for s, p, o in context:
+            quads.append(u'%s %s %s %s .\n' % (s.n3(), p.n3(), o.n3(), graph_term))
+    quads.sort()
+    if fname.endswith('.gz'):
+        # fixed mtime so that the same statements give an identical file
+        f = gzip.GzipFile(fname, 'wb', mtime=0)
+    else:
+        f = open(fname, 'wb')
+    try:
+        for quad in quads:
+            f.write(quad.encode('utf-8'))
+    finally:
+        f.close()
+    return len(quads)
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [-q file.rq ...] [-s store_dir] [-o inferred.nq] file.ttl ...')
+    parser.add_option('-q', '--query', dest='queries', action='append',
+                      metavar='FILE', help='SPARQL update file to run (default: setup-queries/*.rq)')
+    parser.add_option('-s', '--store', metavar='DIR',
+                      help='keep the statements in an on-disk store in DIR')
+    parser.add_option('-o', '--output', metavar='FILE',
+                      help='write the inferred statements to FILE as N-Quads')
+    options, args = parser.parse_args()
+    if rdflib is None:
+        parser.error('rdflib 4.0 or later is required: pip install rdflib')
+    if not args and not options.store:
+        parser.error('no RDF files to load')
+    query_files = options.queries or sorted(glob.glob(os.path.join(QUERY_DIR, '*.rq')))
+
+    try:
+        graph = open_graph(options.store)
+    except ImportError:
+        parser.error('the on-disk store requires the bsddb (or bsddb3) module')
+    try:
+        start_time = time.time()
+        loaded = load_files(graph, args)
+        print 'Loaded %d statements from %d files in %.1fs' % \
+            (loaded, len(args), time.time() - start_time)
+
+        results = run_updates(graph, query_files)
+        print 'Ran %d updates in %.1fs, adding %d statements' % \
+            (len(results), sum(r[1] for r in results), sum(r[2] for r in results))
+
+        if options.output:
+            written = write_inferred(graph, options.output)
+            print 'Wrote %d inferred statements to %s' % (written, options.output)
+    finally:
+        graph.close()
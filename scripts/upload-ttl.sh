@@ -1,13 +1,20 @@
 #!/bin/bash
 
-# Upload turtle (.ttl) RDF files to a Sesame repository. See usage below:
+# Upload turtle (.ttl) or N-Triples (.nt) RDF files to a Sesame repository.
+# See usage below:
 
 function usage () {
   cat <<EOF
-usage: $0 [-r web root] [-c graph context root] file.ttl ...
+usage: $0 [-r web root] [-c graph context root] [-n attempts] file.ttl ...
 
-Post Turtle (.ttl) RDF files into a Sesame or compatible triplestore. Derive
-the graph context URI from the filename.
+Post Turtle (.ttl) or N-Triples (.nt) RDF files into a Sesame or compatible
+triplestore. Derive the graph context URI from the filename. Files may be
+gzipped (.ttl.gz, .nt.gz).
+
+Files are uploaded one at a time. Chunks written by csv2rdf.py -s (e.g.
+data_Simplex.part0001.nt, data_Simplex.part0002.nt, ...) are uploaded into
+the same graph context: the first chunk replaces the context, and the rest
+are added to it. Give the chunks of a file together and in order.
 
   -r web root: The URI that receives POSTed statements. e.g.:
         http://host:port/openrdf-sesame/repositories/myrepo/statements
@@ -21,27 +28,72 @@ the graph context URI from the filename.
         will need to change in several places across this project for the
         code to all work correctly together.
 
+  -n attempts: Number of times to try uploading each file before giving up
+        (default 3). Uploads stop at the first file that fails.
+
 EOF
 }
 
 WEB_ROOT=http://localhost:8080/openrdf-sesame/repositories/galyn/statements
 CONTEXT_ROOT=http://galyn.example.com/source_data_files/
+ATTEMPTS=3
 
-while getopts "c:hr:" opt; do
+# fail an upload if a gzipped file can't be read, not just if curl fails
+set -o pipefail
+
+while getopts "c:hn:r:" opt; do
   case $opt in
     h) usage; exit 1;;
     c) CONTEXT_ROOT=$OPTARG;;
+    n) ATTEMPTS=$OPTARG;;
     r) WEB_ROOT=$OPTARG;;
     ?) usage; exit 1;;
   esac
 done
 shift $((OPTIND-1))
 
+# upload <method> <file> <content type> <context url>
+function upload () {
+  if [[ $2 == *.gz ]]; then
+    gunzip -c "$2" | curl -s -S -f -X $1 -T - -H "Content-Type: $3" "$4"
+  else
+    curl -s -S -f -X $1 -T "$2" -H "Content-Type: $3" "$4"
+  fi
+}
+
+previous_context=
 while [ $# -gt 0 ]; do 
   fname=$1
   base=$(basename $fname)
   shift
 
-  curl -v -T $fname -H 'Content-Type: text/turtle' \
-       "$WEB_ROOT?context=%3C$CONTEXT_ROOT$base%3e";
+  base=${base%.gz}
+  case $base in
+    *.nt) content_type='text/plain';;
+    *) content_type='text/turtle';;
+  esac
+  # all chunks of a file share the context of the whole file, always named
+  # with .ttl so the context doesn't depend on the upload format
+  context=$(echo ${base%.*} | sed -e 's/\.part[0-9]*$//').ttl
+
+  # replace the context with its first file, then add any further chunks
+  if [ "$context" == "$previous_context" ]; then
+    method=POST
+  else
+    method=PUT
+  fi
+  previous_context=$context
+
+  url="$WEB_ROOT?context=%3C$CONTEXT_ROOT$context%3e"
+  attempt=1
+  until upload $method "$fname" $content_type "$url"; do
+    if [ $attempt -ge $ATTEMPTS ]; then
+      echo "Failed to upload $fname after $attempt attempts" >&2
+      exit 1
+    fi
+    echo "Retrying $fname" >&2
+    sleep $((attempt * 5))
+    attempt=$((attempt + 1))
+  done
+  echo "Uploaded $fname"
 done
@@ -59,6 +59,10 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    # first, so that the queries and time of the other middleware are included
+    'georgia_lynchings.lynchings.profiling.ProfilingMiddleware',
+    # next, so that it caches the response as the other middleware leave it
+    'georgia_lynchings.lynchings.responsecache.ResponseCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,6 +72,26 @@ MIDDLEWARE_CLASSES = (
 
 ROOT_URLCONF = 'georgia_lynchings.urls'
 
+# The most SQL queries each view may run, whatever the amount of data, with
+# nothing cached.  Checked by the tests, and logged as warnings by
+# ProfilingMiddleware when QUERY_PROFILING is on (it defaults to DEBUG).
+QUERY_BUDGETS = {
+    'home': 5,
+    'lynchings:lynching_detail': 8,
+    'lynchings:lynching_list': 1,
+    'lynchings:alleged_crimes_list': 1,
+    'lynchings:lynching_list_by_accusation': 2,
+    'lynchings:timemap_data': 1,
+    'lynchings:map_data': 1,
+    'lynchings:county_list': 1,
+    'lynchings:county_detail': 4,
+    'lynchings:stats_data': 5,
+    'articles:list': 1,
+    'relations:graph': 1,
+    'relations:graph_data': 2,
+    'relations:event_lookup': 3,
+}
+
 TEMPLATE_DIRS = (
     # Put strings here, like "/home/html/django_templates" or "C:/www/django/templates".
     # Always use forward slashes, even on Windows.
@@ -123,6 +147,22 @@ except ImportError:
     details.'''
     del sys
     
+# Tests use local memory caches whatever localsettings configures: the
+# database cache's queries would be counted against the query budgets and
+# assertNumQueries checks, and tests shouldn't clear the site's cache.
+import sys
+if len(sys.argv) > 1 and sys.argv[1] == 'test':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'responses',
+        },
+    }
+del sys
+
 # After importing localsettings, if SITE_URL_PREFIX is not blank,
 # prefix all statically defined urls above.
 try: